@@ -1,6 +1,24 @@
-import os, sys, json, threading, time, subprocess, configparser
+import os, sys, json, threading, time, socket, mimetypes, configparser, multiprocessing
+import urllib.request, urllib.error
 from flask import Flask, render_template, jsonify
+from library import LibraryIndex
+from watcher import LibraryWatcher
+from events import format_sse
+from prefetch import PageCacheWarmer
+from player import Zone, ZoneManager, ZoneError, ZoneBusy
+from search import TrigramIndex
+from metadata import MetadataStore
+from dupes import DuplicateFinder
+from cluster import SharedState, Coordinator, FORWARD_HEADER, zone_status
+from blobcache import BlobCache, ENCODINGS
+from journal import StateJournal
+from stream import StreamLimiter, FileStream
+from peaks import PeakStore, UnsupportedFormat
+from features import FeatureStore
+import metrics
+from metrics import Counter, Gauge, Histogram, SIZE_BUCKETS
 
+_T_START = time.monotonic()  # 进程启动 (导入本模块) 的时间, 用于统计重启后恢复播放的耗时
 APP = Flask(__name__, template_folder='.')
 
 #############################################
@@ -14,10 +32,41 @@ DEFAULT_CFG = {
 	'FLASK_HOST': '0.0.0.0',
 	'FLASK_PORT': '9000',
 	'DEBUG': 'true',
+	'LIBRARY_DB': 'library.db',        # 音乐库索引 (相对 settings.ini 所在目录)
+	'LIBRARY_RESCAN_INTERVAL': '60',   # 监视器关闭时: /tree 等读取时, 距上次增量扫描超过该秒数才重新扫描
+	'SCAN_WORKERS': '8',               # 并行扫描目录的线程数 (网络共享上可适当调大)
+	'SCAN_DIR_TIMEOUT': '15',          # 单个目录超过该秒数未返回则跳过, 保留旧索引
+	'WATCH_MODE': 'auto',              # auto | inotify | poll | off
+	'WATCH_INTERVAL': '30',            # 轮询模式的扫描间隔(秒)
+	'MPV_IPC_TIMEOUT': '2',            # 单个 IPC 请求等待响应的超时(秒)
+	'ZONE_CALL_TIMEOUT': '10',         # 请求等待分区线程执行命令的超时(秒)
+	'EVENTS_TICK': '1',                # /events 推送播放进度的间隔(秒)
+	'PREFETCH_COUNT': '2',             # 预先排入 mpv 播放列表的后续曲目数, 0 关闭无缝衔接
+	'META_WORKERS': '0',               # 标签/时长解析进程数, 0 为 CPU 核数
+	'DEDUP_SCAN': 'true',              # 启动后在后台按内容哈希查找重复曲目
+	'DEDUP_PARTIAL': 'true',           # 先比较头尾各 1 MiB 的部分哈希, 再对仍相同的文件做完整哈希
+	'DEDUP_SKIP': 'false',             # 下一首/随机播放时跳过重复曲目的副本
+	'ZONES': '',                       # 多分区: 逗号分隔的分区 id, 每个分区一个 mpv; 留空为单分区 default
+	'SERVE_WORKERS': '1',              # 服务进程数; >1 时只有一个进程驱动 mpv, 其余只读并转发写操作 (gunicorn -w N app:APP 时也设为 N)
+	'LEADER_LEASE': '5',               # 多进程: mpv 所有者失联超过该秒数后由其他进程接管
+	'STATE_JOURNAL': 'state.journal',  # 播放状态日志 (相对 settings.ini 所在目录), 重启后恢复曲目/位置/随机/音量; 留空关闭
+	'JOURNAL_INTERVAL': '2',           # 播放中记录位置的间隔(秒)
+	'STREAM_MAX': '64',                # /stream 同时传输的连接数上限
+	'STREAM_PER_CLIENT': '4',          # 每个客户端 (IP) 同时传输的连接数上限
+	'STREAM_RATE_KBPS': '2048',        # 每个客户端的带宽上限 (KB/s), 0 为不限; 需高于无损音频的码率
+	'PEAKS_DIR': 'peaks',              # 波形峰值缓存目录 (相对 settings.ini 所在目录)
+	'PEAKS_BUCKETS': '800',            # 每首曲目的波形桶数
+	'PEAKS_WORKERS': '1',              # 计算波形的后台进程数 (低优先级)
+	'PEAKS_DECODER': 'ffmpeg',         # 非 WAV 格式的本地解码器 (波形与音频特征共用); 找不到时只处理 WAV
+	'FEATURES_SCAN': 'true',           # 启动后在后台提取音频特征 (需要 numpy), 供自动 DJ 选相似曲目
+	'FEATURES_WORKERS': '1',           # 提取音频特征的后台进程数 (低优先级)
+	'SYNC_DEBOUNCE': '2',              # 曲库变化停止该秒数后再同步标签/特征/重复分组 (合并为一次)
 	'MPV_CMD': r'c:\mpv\mpv.exe --input-ipc-server=\\.\pipe\mpv-pipe --idle=yes --force-window=no'
 }
 
 def _ini_path():
+	if os.environ.get('JUKEBOX_INI'):
+		return os.path.abspath(os.environ['JUKEBOX_INI'])     # 指定独立配置 (如基准测试)
 	if getattr(sys, 'frozen', False):
 		return os.path.join(os.path.dirname(sys.executable), 'settings.ini')
 	return os.path.join(os.path.dirname(__file__), 'settings.ini')
@@ -111,22 +160,33 @@ def _extract_pipe_name(cmd: str, fallback: str = r'\\.\\pipe\\mpv-pipe') -> str:
 # 兼容: 若 settings 仍含 PIPE_NAME 则优先; 否则从 MPV_CMD 解析
 PIPE_NAME = cfg.get('PIPE_NAME') or _extract_pipe_name(MPV_CMD)
 
-def mpv_pipe_exists(path: str = None) -> bool:
-	p = path or PIPE_NAME
-	try:
-		with open(p, 'wb'):
-			return True
-	except Exception:
-		return False
-
-# 播放列表 & 自动播放
-PLAYLIST = []            # 存储相对路径（相对 MUSIC_DIR）
-CURRENT_INDEX = -1
-_AUTO_THREAD = None
-_STOP_FLAG = False
-_REQ_ID = 0
-CURRENT_META = {}  # 仅内存保存当前播放信息，不写入 settings.json
-SHUFFLE = False
+try:
+	_IPC_TIMEOUT = float(cfg.get('MPV_IPC_TIMEOUT', '2'))
+except ValueError:
+	_IPC_TIMEOUT = 2.0
+
+def _zone_ids():
+	"""ZONES 中的分区 id (逗号/分号分隔, 仅限字母数字 - _); 未配置时只有 default."""
+	raw = cfg.get('ZONES') or ''
+	ids = []
+	for z in raw.replace(';', ',').split(','):
+		z = z.strip()
+		if z and z.replace('-', '').replace('_', '').isalnum() and z not in ids:
+			ids.append(z)
+	return ids or ['default']
+
+def _zone_cmd(zid: str, first: bool) -> str:
+	"""分区的 mpv 启动命令: 优先 MPV_CMD_<ID>; 否则第一个分区用 MPV_CMD, 其余在其管道名后追加 -<id>."""
+	cmd = cfg.get('MPV_CMD_' + zid.upper())
+	if cmd:
+		return cmd
+	if first:
+		return MPV_CMD
+	if PIPE_NAME not in MPV_CMD:
+		print(f'[WARN] 无法为分区 {zid} 派生独立管道, 请配置 MPV_CMD_{zid.upper()}')
+		return MPV_CMD
+	return MPV_CMD.replace(PIPE_NAME, f'{PIPE_NAME}-{zid}')
+
 
 # =========== 文件树 / 安全路径 ===========
 def safe_path(rel: str):
@@ -138,305 +198,849 @@ def safe_path(rel: str):
 		raise ValueError('不存在的文件')
 	return target
 
-def gather_tracks(root):
-	tracks = []
-	for dp, _, files in os.walk(root):
-		for f in files:
-			ext = os.path.splitext(f)[1].lower()
-			if ext in ALLOWED:
-				tracks.append(os.path.abspath(os.path.join(dp, f)))
-	return tracks
+# =========== 音乐库索引 ===========
+def _library_db_path():
+	p = cfg.get('LIBRARY_DB') or 'library.db'
+	return p if os.path.isabs(p) else os.path.join(os.path.dirname(_ini_path()), p)
 
-def build_tree():
-	abs_root = os.path.abspath(MUSIC_DIR)
-	def walk(path):
-		rel = os.path.relpath(path, abs_root).replace('\\', '/')
-		node = { 'name': os.path.basename(path) or '根目录', 'rel': '' if rel == '.' else rel, 'dirs': [], 'files': [] }
-		try:
-			for name in sorted(os.listdir(path), key=str.lower):
-				full = os.path.join(path, name)
-				if os.path.isdir(full):
-					node['dirs'].append(walk(full))
-				else:
-					ext = os.path.splitext(name)[1].lower()
-					if ext in ALLOWED:
-						rp = os.path.relpath(full, abs_root).replace('\\','/')
-						node['files'].append({'name': name, 'rel': rp})
-		except Exception:
-			pass
-		return node
-	return walk(abs_root)
-
-# =========== MPV 启动 & IPC ===========
-def _wait_pipe(timeout=6.0):
-	end = time.time() + timeout
-	while time.time() < end:
+try:
+	_scan_workers = max(1, int(cfg.get('SCAN_WORKERS', '8')))
+	_scan_timeout = float(cfg.get('SCAN_DIR_TIMEOUT', '15'))
+except ValueError:
+	_scan_workers, _scan_timeout = 8, 15.0
+LIBRARY = LibraryIndex(_library_db_path(), MUSIC_DIR, ALLOWED, workers=_scan_workers, dir_timeout=_scan_timeout)
+try:
+	LIBRARY_RESCAN_INTERVAL = float(cfg.get('LIBRARY_RESCAN_INTERVAL', '60'))
+except ValueError:
+	LIBRARY_RESCAN_INTERVAL = 60.0
+
+WATCHER = None
+SEARCH = TrigramIndex()      # /search 使用的路径三元组索引
+_SEARCH_THREAD = None
+
+def _ensure_search_index():
+	global _SEARCH_THREAD
+	if SEARCH.ready or (_SEARCH_THREAD and _SEARCH_THREAD.is_alive()):
+		return
+	tracks = list(LIBRARY.playlist())
+	_SEARCH_THREAD = threading.Thread(target=SEARCH.build, args=(tracks,), daemon=True)
+	_SEARCH_THREAD.start()
+
+# =========== 标签 / 时长 ===========
+try:
+	_meta_workers = int(cfg.get('META_WORKERS', '0'))
+except ValueError:
+	_meta_workers = 0
+META = MetadataStore(_library_db_path(), _meta_workers or None)
+_META_THREAD = None
+
+def _sync_metadata(rels, removed=(), prune=False):
+	try:
+		stats = META.sync(MUSIC_DIR, rels, removed)
+		if prune:
+			META.prune(rels)
+		if stats['stale']:
+			print(f"[INFO] 标签解析完成: {stats['parsed']}/{stats['total']}, 耗时 {stats['seconds']}s")
+	except Exception as e:
+		print(f'[WARN] 标签解析失败: {e}')
+
+def _ensure_metadata():
+	"""后台同步整个曲库的标签缓存: 已缓存且 size/mtime 未变的文件只做 stat."""
+	global _META_THREAD
+	if _META_THREAD is not None:
+		return
+	tracks = list(LIBRARY.playlist())
+	_META_THREAD = threading.Thread(target=_sync_metadata, args=(tracks, (), True), daemon=True)
+	_META_THREAD.start()
+
+_LIBRARY_THREAD = None
+
+def _library_bootstrap():
+	"""后台完成首次扫描, 然后建立搜索索引、同步标签并启动监视器."""
+	global WATCHER
+	LIBRARY.refresh(0)
+	for zone in ZONES:
+		# 扫描期间取到的可能是部分列表, 换成最终列表并重新定位当前曲目
+		zone.library_changed(LIBRARY.playlist())
+	_ensure_search_index()
+	_ensure_metadata()
+	if _cfg_bool('DEDUP_SCAN', 'true'):
+		_ensure_dupes()
+	if _cfg_bool('FEATURES_SCAN', 'true'):
+		_ensure_features()
+	mode = (cfg.get('WATCH_MODE') or 'auto').lower()
+	if mode == 'off':
+		return
+	try:
+		interval = float(cfg.get('WATCH_INTERVAL', '30'))
+	except ValueError:
+		interval = 30.0
+	WATCHER = LibraryWatcher(LIBRARY, _on_library_change, mode=mode, interval=interval)
+	WATCHER.start()
+
+# =========== 重复曲目 ===========
+def _cfg_bool(key: str, default: str = 'false') -> bool:
+	return str(cfg.get(key, default)).strip().lower() in ('1', 'true', 'yes', 'on')
+
+DUPES = DuplicateFinder(_library_db_path(), _meta_workers or None, partial=_cfg_bool('DEDUP_PARTIAL', 'true'))
+DEDUP_SKIP = _cfg_bool('DEDUP_SKIP')
+_DUPES_THREAD = None
+_DUPES_DIRTY = False
+
+def _scan_dupes():
+	global _DUPES_DIRTY
+	while True:
+		_DUPES_DIRTY = False
 		try:
-			with open(PIPE_NAME, 'wb') as _: return True
-		except Exception: time.sleep(0.15)
-	return False
-
-def ensure_mpv():
-	global PIPE_NAME
-	# 每次调用重新解析，允许运行期间修改 MPV_CMD 并热加载（若外部修改变量并重载模块则生效）
-	PIPE_NAME = _extract_pipe_name(MPV_CMD) if not cfg.get('PIPE_NAME') else cfg.get('PIPE_NAME')
-	if not MPV_CMD:
-		print('[WARN] 未配置 MPV_CMD')
-		return False
-	if mpv_pipe_exists():
-		return True
-	print(f'[INFO] 尝试启动 mpv: {MPV_CMD}')
+			p = DUPES.scan(MUSIC_DIR, list(LIBRARY.playlist()))
+			print(f"[INFO] 重复检测完成: {len(DUPES.groups)} 组, 哈希 {p['hashed']} 个文件, 耗时 {p['seconds']}s")
+		except Exception as e:
+			print(f'[WARN] 重复检测失败: {e}')
+		if not _DUPES_DIRTY:
+			break
+
+def _ensure_dupes(force: bool = False):
+	"""在后台 (重新) 计算重复分组; 运行中再次请求时, 结束后会再跑一轮."""
+	global _DUPES_THREAD, _DUPES_DIRTY
+	if _DUPES_THREAD is not None and _DUPES_THREAD.is_alive():
+		_DUPES_DIRTY = True
+		return
+	if _DUPES_THREAD is not None and not force:
+		return
+	_DUPES_THREAD = threading.Thread(target=_scan_dupes, daemon=True)
+	_DUPES_THREAD.start()
+
+# =========== 音频特征 / 自动 DJ ===========
+try:
+	_features_workers = max(1, int(cfg.get('FEATURES_WORKERS', '1')))
+except ValueError:
+	_features_workers = 1
+FEATURES = FeatureStore(_library_db_path(), _features_workers, cfg.get('PEAKS_DECODER', 'ffmpeg'))
+_FEATURES_THREAD = None
+
+def _sync_features(rels, removed=(), prune=False):
 	try:
-		subprocess.Popen(MPV_CMD, shell=True)
+		stats = FEATURES.sync(MUSIC_DIR, rels, removed)
+		if prune:
+			FEATURES.prune(rels)
+		if stats.get('stale'):
+			print(f"[INFO] 音频特征提取完成: {stats['extracted']}/{stats['stale']} (失败 {stats['failed']}), 耗时 {stats['seconds']}s")
 	except Exception as e:
-		print('[ERROR] 启动 mpv 进程失败:', e)
-		return False
-	ready = _wait_pipe()
-	if not ready:
-		print('[ERROR] 等待 mpv 管道超时: ', PIPE_NAME)
-	return ready
-
-def mpv_command(cmd_list):
-	# 写命令，失败时自动尝试启动一次再重试
-	def _write():
-		with open(PIPE_NAME, 'wb') as w:
-			w.write((json.dumps({'command': cmd_list})+'\n').encode('utf-8'))
+		print(f'[WARN] 音频特征提取失败: {e}')
+
+def _ensure_features():
+	"""后台提取整个曲库的音频特征: 已缓存且 size/mtime 未变的文件只做 stat."""
+	global _FEATURES_THREAD
+	if _FEATURES_THREAD is not None:
+		return
+	if not FEATURES.available:
+		print('[INFO] 未安装 numpy, 不提取音频特征 (自动 DJ 不可用)')
+		return
+	tracks = list(LIBRARY.playlist())
+	_FEATURES_THREAD = threading.Thread(target=_sync_features, args=(tracks, (), True), daemon=True)
+	_FEATURES_THREAD.start()
+
+def _ensure_library(wait: float = 5.0):
+	"""首次访问时在后台扫描并启动监视器; 监视器运行期间不再由请求触发扫描.
+
+	冷启动 (索引为空) 时最多等待 wait 秒让根目录先列出, 其余部分边扫边发布.
+	"""
+	global _LIBRARY_THREAD
+	if _follower():
+		_follow_library()        # 扫描与监视只在 leader 进行
+		return
+	if _LIBRARY_THREAD is None:
+		_LIBRARY_THREAD = threading.Thread(target=_library_bootstrap, daemon=True)
+		_LIBRARY_THREAD.start()
+		end = time.time() + wait
+		while LIBRARY.tree_level('', 0) is None and _LIBRARY_THREAD.is_alive() and time.time() < end:
+			time.sleep(0.05)
+	elif WATCHER is None and not _LIBRARY_THREAD.is_alive():
+		LIBRARY.refresh(LIBRARY_RESCAN_INTERVAL)
+
+def build_tree():
+	"""由音乐库索引派生文件树 (监视器会就地修补, 不再整体遍历)."""
+	_ensure_library()
+	return LIBRARY.tree()
+
+def build_tree_level(rel: str = '', depth: int = 1):
+	"""按需加载: 只返回 rel 目录下 depth 层, 子目录带 dir_count/file_count."""
+	_ensure_library()
+	return LIBRARY.tree_level(rel.replace('\\', '/').strip('/'), depth)
+
+# =========== 曲库变化后的后台同步 ===========
+try:
+	_SYNC_DEBOUNCE = max(0.0, float(cfg.get('SYNC_DEBOUNCE', '2')))
+except ValueError:
+	_SYNC_DEBOUNCE = 2.0
+_SYNC_PENDING = {'added': set(), 'removed': set()}
+_SYNC_LOCK = threading.Lock()
+_SYNC_WAKE = threading.Event()
+_SYNC_THREAD = None
+
+def _queue_sync(added, removed):
+	"""合并曲库变化, 交给唯一的同步线程处理; 同一文件先删后加 (或反之) 只按最后的状态处理一次."""
+	global _SYNC_THREAD
+	with _SYNC_LOCK:
+		for rel in removed:
+			_SYNC_PENDING['added'].discard(rel)
+			_SYNC_PENDING['removed'].add(rel)
+		for rel in added:
+			_SYNC_PENDING['removed'].discard(rel)
+			_SYNC_PENDING['added'].add(rel)
+		if _SYNC_THREAD is None:
+			_SYNC_THREAD = threading.Thread(target=_sync_worker, daemon=True, name='library-sync')
+			_SYNC_THREAD.start()
+	_SYNC_WAKE.set()
+
+def _sync_worker():
+	"""变化停止 _SYNC_DEBOUNCE 秒后, 依次同步标签、音频特征与重复分组; 同时只运行一个任务."""
+	while True:
+		_SYNC_WAKE.wait()
+		_SYNC_WAKE.clear()
+		deadline = time.monotonic() + max(30.0, _SYNC_DEBOUNCE)     # 持续有变化时也不无限推迟
+		while time.monotonic() < deadline and _SYNC_WAKE.wait(_SYNC_DEBOUNCE):   # 去抖: 批量复制/删除期间持续有新事件
+			_SYNC_WAKE.clear()
+		with _SYNC_LOCK:
+			added, removed = list(_SYNC_PENDING['added']), list(_SYNC_PENDING['removed'])
+			_SYNC_PENDING['added'].clear()
+			_SYNC_PENDING['removed'].clear()
+		if not (added or removed):
+			continue
+		_sync_metadata(added, removed)
+		if _FEATURES_THREAD is not None:
+			_sync_features(added, removed)
+		if _DUPES_THREAD is not None:
+			_update_dupes(added, removed)
+
+def _update_dupes(added, removed):
+	global _DUPES_DIRTY
+	if _DUPES_THREAD.is_alive():
+		_DUPES_DIRTY = True      # 首次完整扫描尚未结束: 结束后再完整扫描一轮
+		return
 	try:
-		_write()
+		p = DUPES.update(MUSIC_DIR, added, removed, LIBRARY.playlist())
+		print(f"[INFO] 重复检测已更新: {len(DUPES.groups)} 组, 哈希 {p['hashed']} 个文件, 耗时 {p['seconds']}s")
 	except Exception as e:
-		print(f'[WARN] 首次写入失败: {e}. 尝试 ensure_mpv 后重试...')
-		if ensure_mpv():
-			try:
-				_write()
-				return
-			except Exception as e2:
-				raise RuntimeError(f'MPV 管道写入失败(重试): {e2}')
-		raise RuntimeError(f'MPV 管道写入失败: {e}')
-
-def mpv_request(payload: dict):
-	# 简单同步请求/响应
-	with open(PIPE_NAME, 'r+b', 0) as f:
-		f.write((json.dumps(payload)+'\n').encode('utf-8'))
-		f.flush()
-		while True:
-			line = f.readline()
-			if not line:
-				break
-			try:
-				obj = json.loads(line.decode('utf-8','ignore'))
-			except Exception:
-				continue
-			if obj.get('request_id') == payload.get('request_id'):
-				return obj
-	return None
+		print(f'[WARN] 重复检测失败: {e}')
+
+def _on_library_change(stats):
+	"""索引变化回调: 索引已发布新的播放列表/文件树, 这里把新播放列表交给各分区, 其余同步合并后在后台进行."""
+	added, removed = stats.get('added', []), stats.get('removed', [])
+	plist = LIBRARY.playlist()
+	for zone in ZONES:
+		zone.library_changed(plist, added, removed)
+	SEARCH.apply(added, removed)
+	if added or removed:
+		_queue_sync(added, removed)
+	print(f"[INFO] 音乐库已更新: +{len(added)} -{len(removed)}, 共 {len(plist)} 首")
+
+def _library_tracks(force: bool = False):
+	"""分区取播放列表: 所有分区共用曲库索引派生的同一个 Playlist; force=True 时先增量扫描."""
+	if force:
+		stats = LIBRARY.rescan()
+		if stats['changed']:
+			_on_library_change(stats)
+	else:
+		_ensure_library()
+	return LIBRARY.playlist()
+
+# =========== 播放分区 ===========
+try:
+	PREFETCH_COUNT = max(0, int(cfg.get('PREFETCH_COUNT', '2')))
+except ValueError:
+	PREFETCH_COUNT = 2
+WARMER = PageCacheWarmer()
+
+def _attach_tags(zone, rel: str):
+	zone.meta['tags'] = META.get(rel)
+	if rel not in META:
+		threading.Thread(target=_fill_current_tags, args=(zone, rel), daemon=True).start()
+
+def _fill_current_tags(zone, rel: str):
+	"""当前曲目尚未解析 (后台同步还没轮到它): 单独解析后补推一次状态."""
+	zone.update_meta(rel, {'tags': META.sync_one(MUSIC_DIR, rel)})
+
+try:
+	_ZONE_CALL_TIMEOUT = float(cfg.get('ZONE_CALL_TIMEOUT', '10'))
+except ValueError:
+	_ZONE_CALL_TIMEOUT = 10.0
+
+# 每个分区一个 mpv 进程, 各自的 IPC/播放列表位置/随机排列/自动播放线程互不影响
+ZONES = ZoneManager()
+for _i, _zid in enumerate(_zone_ids()):
+	_cmd = _zone_cmd(_zid, _i == 0)
+	_pipe = (cfg.get('PIPE_NAME') if _i == 0 else None) or _extract_pipe_name(_cmd)
+	_z = ZONES.add(Zone(_zid, _cmd, _pipe, tracks=_library_tracks, resolve=safe_path, root=MUSIC_DIR,
+		ipc_timeout=_IPC_TIMEOUT, prefetch=PREFETCH_COUNT, warmer=WARMER, features=FEATURES if FEATURES.available else None))
+	_z.skip = DUPES.is_duplicate if DEDUP_SKIP else None
+	_z.call_timeout = _ZONE_CALL_TIMEOUT
+	_z.on_track.append(_attach_tags)
+
+# =========== 波形峰值 ===========
+def _peaks_dir():
+	p = cfg.get('PEAKS_DIR') or 'peaks'
+	return p if os.path.isabs(p) else os.path.join(os.path.dirname(_ini_path()), p)
+
+try:
+	PEAKS = PeakStore(_peaks_dir(), int(cfg.get('PEAKS_BUCKETS', '800')), int(cfg.get('PEAKS_WORKERS', '1')),
+		cfg.get('PEAKS_DECODER', 'ffmpeg'))
+except ValueError:
+	PEAKS = PeakStore(_peaks_dir(), decoder=cfg.get('PEAKS_DECODER', 'ffmpeg'))
+
+def _prefetch_peaks(zone, rel: str):
+	# 曲目开始播放时就在后台生成, 页面请求时通常已经命中
+	PEAKS.prefetch(zone.meta['abs_path'])
 
-def mpv_get(prop: str):
-	global _REQ_ID
-	_REQ_ID += 1
-	req = {"command":["get_property", prop], "request_id": _REQ_ID}
-	resp = mpv_request(req)
-	if not resp:
+for _z in ZONES:
+	_z.on_track.append(_prefetch_peaks)
+
+# =========== 播放状态日志 ===========
+def _journal_path():
+	p = cfg.get('STATE_JOURNAL', 'state.journal')
+	if not p:
 		return None
-	return resp.get('data')
+	return p if os.path.isabs(p) else os.path.join(os.path.dirname(_ini_path()), p)
 
-def mpv_set(prop: str, value):
-	try:
-		mpv_command(['set_property', prop, value])
-		return True
-	except Exception:
-		return False
-
-def _build_playlist():
-	abs_root = os.path.abspath(MUSIC_DIR)
-	tracks = []
-	for dp, _, files in os.walk(abs_root):
-		for f in files:
-			ext = os.path.splitext(f)[1].lower()
-			if ext in ALLOWED:
-				rel = os.path.relpath(os.path.join(dp,f), abs_root).replace('\\','/')
-				tracks.append(rel)
-	tracks.sort(key=str.lower)
-	return tracks
-
-def _ensure_playlist(force: bool = False):
-	"""确保内存 PLAYLIST 存在; force=True 时强制重建."""
-	global PLAYLIST
-	if force or not PLAYLIST:
-		PLAYLIST = _build_playlist()
-	return PLAYLIST
-
-def _play_index(idx: int):
-	global CURRENT_INDEX, CURRENT_META
-	if idx < 0 or idx >= len(PLAYLIST):
-		return False
-	rel = PLAYLIST[idx]
-	abs_file = safe_path(rel)
-	mpv_command(['loadfile', abs_file, 'replace'])
-	CURRENT_INDEX = idx
-	CURRENT_META = {'abs_path': abs_file, 'rel': rel, 'index': idx, 'ts': int(time.time())}
-	return True
-
-def _next_track():
-	import random
-	if CURRENT_INDEX < 0:
-		return False
-	if SHUFFLE and len(PLAYLIST) > 1:
-		# 随机选择一个不同的索引
-		choices = list(range(len(PLAYLIST)))
-		try:
-			choices.remove(CURRENT_INDEX)
-		except ValueError:
-			pass
-		if not choices:
-			return False
-		return _play_index(random.choice(choices))
-	nxt = CURRENT_INDEX + 1
-	if nxt >= len(PLAYLIST):
-		return False
-	return _play_index(nxt)
-
-def _prev_track():
-	import random
-	if CURRENT_INDEX < 0:
-		return False
-	if SHUFFLE and len(PLAYLIST) > 1:
-		choices = list(range(len(PLAYLIST)))
-		try:
-			choices.remove(CURRENT_INDEX)
-		except ValueError:
-			pass
-		if not choices:
-			return False
-		return _play_index(random.choice(choices))
-	prv = CURRENT_INDEX - 1
-	if prv < 0:
-		return False
-	return _play_index(prv)
-
-def _auto_loop():
-	print('[INFO] 自动播放线程已启动')
-	while not _STOP_FLAG:
-		print('[DEBUG] 自动播放检查...')
-		if CURRENT_INDEX < 0:
-			# 没有正在播放的，尝试自动加载并播第一首
-			_ensure_playlist()
-			if PLAYLIST:
-				_play_index(0)
-				time.sleep(1.0)
-				continue
-		try:
-			# 侦测曲目结束: 优先 eof-reached, 其次 time-pos≈duration, 再次 idle-active
-			ended = False
-			pos = mpv_get('time-pos')
-			dur = mpv_get('duration')
-			eof = mpv_get('eof-reached')  # 可能为 None
-			if eof is True:
-				ended = True
-			elif isinstance(pos,(int,float)) and isinstance(dur,(int,float)) and dur>0 and (dur - pos) <= 0.3:
-				ended = True
-			else:
-				idle = mpv_get('idle-active')
-				if idle is True and (pos is None or (isinstance(pos,(int,float)) and pos==0)):
-					ended = True
-			if ended:
-				print('[INFO] 当前曲目已结束，尝试播放下一首...')
-				if not _next_track():
-					# 到末尾，等待再尝试
-					time.sleep(10)
-					continue
-		except Exception:
-			pass
-		time.sleep(10)
-
-def _ensure_auto_thread():
-	global _AUTO_THREAD
-	if _AUTO_THREAD and _AUTO_THREAD.is_alive():
-		print('[INFO] 自动播放线程已存在')
+try:
+	_JOURNAL_INTERVAL = max(0.2, float(cfg.get('JOURNAL_INTERVAL', '2')))
+except ValueError:
+	_JOURNAL_INTERVAL = 2.0
+JOURNAL = StateJournal(_journal_path(), _JOURNAL_INTERVAL) if _journal_path() else None
+
+def _journal_fields(zone, payload=None):
+	"""分区需要在重启后恢复的状态; 尚未播放任何曲目时返回 None (不覆盖日志中上次的曲目)."""
+	payload = payload or zone.status_payload()
+	rel = payload['playing'].get('rel')
+	if not rel:
+		return None
+	mpv = payload.get('mpv') or {}
+	fields = {'rel': rel, 'shuffle': zone.snapshot['shuffle'], 'autodj': zone.snapshot['autodj'], 'autoplay': zone.autoplay}
+	if mpv.get('time') is not None:
+		fields['pos'] = round(mpv['time'], 1)
+	for key in ('paused', 'volume'):
+		if mpv.get(key) is not None:
+			fields[key] = mpv[key]
+	return fields
+
+def _journal_status(zone, payload):
+	# 曲目切换/暂停/音量变化: 立即入队 (写入在日志线程中进行)
+	if JOURNAL is None or _follower():
 		return
-	_AUTO_THREAD = threading.Thread(target=_auto_loop, daemon=True)
-	_AUTO_THREAD.start()
+	fields = _journal_fields(zone, payload)
+	if fields:
+		JOURNAL.record(zone.id, **fields)
+
+def _journal_sample():
+	# 播放位置不随推送变化, 由日志线程定期采样
+	if _follower():
+		return {}
+	return {z.id: f for z in ZONES for f in [_journal_fields(z)] if f}
+
+def _restore_zones(fallback=None):
+	"""启动 (或成为 mpv 所有者) 时按日志恢复各分区; 没有日志记录的分区用 fallback(zone) 给出的状态."""
+	saved = JOURNAL.load() if JOURNAL is not None else {}
+	for zone in ZONES:
+		state = saved.get(zone.id) or (fallback(zone) if fallback else None)
+		if state and state.get('rel'):
+			zone.restore(state, _T_START)
+	if JOURNAL is not None:
+		JOURNAL.sampler = _journal_sample
+		JOURNAL.start()
+
+for _z in ZONES:
+	_z.on_status.append(_journal_status)
+
+# =========== 响应缓存 ===========
+PAYLOADS = BlobCache()       # /tree /playlist: 同一曲库代数 + 参数只序列化一次, 压缩结果一并缓存
+_PAYLOAD_CACHE = Counter('jukebox_payload_cache_total', '预序列化负载缓存的命中/未命中', ['result'])
+_NOT_MODIFIED = Counter('jukebox_http_not_modified_total', 'If-None-Match 命中返回 304 的请求数', ['route'])
+
+def _send_blob(key, build):
+	"""按 key 取缓存的 JSON 负载; If-None-Match 命中返回 304, 否则按 Accept-Encoding 返回压缩后的字节."""
+	from flask import request, Response
+	blob, hit = PAYLOADS.get(key, build)
+	_PAYLOAD_CACHE.labels('hit' if hit else 'miss').inc()
+	if request.if_none_match.contains_weak(blob.etag):
+		_NOT_MODIFIED.labels(request.path).inc()
+		resp = Response(status=304)
+	else:
+		data, enc = blob.encoded(request.accept_encodings.best_match(ENCODINGS))
+		resp = Response(data, content_type='application/json')
+		if enc:
+			resp.headers['Content-Encoding'] = enc
+	resp.set_etag(blob.etag, weak=True)       # 同一内容的各种压缩编码共用一个 ETag
+	resp.headers['Vary'] = 'Accept-Encoding'
+	resp.headers['Cache-Control'] = 'no-cache'     # 每次都向服务器确认, 未变化时只传输 304
+	return resp
+
+def _zone_arg():
+	"""请求参数 zone (查询串或表单) 对应的分区, 未提供时为默认分区, 未知 id 返回 None."""
+	from flask import request
+	return ZONES.get(request.values.get('zone'))
+
+def _no_zone():
+	return jsonify({'status':'ERROR','error':'未知的分区'}), 404
+
+def _zone_error(e: ZoneError):
+	return jsonify({'status':'ERROR','error':str(e)}), 503 if isinstance(e, ZoneBusy) else 400
+
+BATCH_MAX_OPS = 64           # /batch 单个请求的操作数上限
+
+# =========== 指标 ===========
+ROUTE_SECONDS = Histogram('jukebox_http_request_seconds', '请求处理耗时 (流式响应只计到开始发送)', ['route', 'method', 'status'])
+ROUTE_BYTES = Histogram('jukebox_http_response_bytes', '响应体字节数 (流式响应不计)', ['route'], buckets=SIZE_BUCKETS)
+Gauge('jukebox_library_files', '音乐库中的曲目数').set_function(lambda: len(LIBRARY.playlist()))
+_SSE = Gauge('jukebox_sse_subscribers', '/events 订阅者数', ['zone'])
+for _z in ZONES:
+	_SSE.labels(_z.id).set_function(lambda hub=_z.hub: hub.subscribers)
+
+@APP.before_request
+def _metrics_start():
+	from flask import g
+	g.t0 = time.perf_counter()
+
+@APP.after_request
+def _metrics_end(resp):
+	from flask import request, g
+	t0 = g.get('t0')
+	if t0 is not None:
+		# 按路由模板而不是实际路径分组, 避免 /static/<path> 之类产生无界标签
+		route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+		ROUTE_SECONDS.labels(route, request.method, str(resp.status_code)).observe(time.perf_counter() - t0)
+		if resp.content_length is not None:
+			ROUTE_BYTES.labels(route).observe(resp.content_length)
+	return resp
+
+# =========== 多进程部署 ===========
+# SERVE_WORKERS > 1 时各进程经 SQLite (WAL) 共享状态: 租约持有者 (leader) 驱动 mpv/自动切歌/扫描,
+# 其余进程 (follower) 从共享库读取 /status /tree /playlist 等, 需要 mpv 的请求转发给 leader.
+try:
+	SERVE_WORKERS = max(1, int(cfg.get('SERVE_WORKERS', '1')))
+	_LEASE = max(1.0, float(cfg.get('LEADER_LEASE', '5')))
+except ValueError:
+	SERVE_WORKERS, _LEASE = 1, 5.0
+SHARED = SharedState(_library_db_path(), _LEASE) if SERVE_WORKERS > 1 else None
+CLUSTER = None               # Coordinator, 首个请求 (或 worker 启动) 时创建
+_CLUSTER_LOCK = threading.Lock()
+_FOLLOW = {'ts': 0.0, 'library': None, 'tags': None}
+_FOLLOW_LOCK = threading.Lock()
+_LEADER_ENDPOINTS = {'play_route', 'api_next', 'api_prev', 'api_shuffle', 'api_autodj', 'api_volume', 'api_batch', 'api_duplicates', 'api_debug_mpv'}
+_DIRECT = urllib.request.build_opener(urllib.request.ProxyHandler({}))   # 转发到本机, 不走环境变量中的代理
+
+def _follower() -> bool:
+	"""多进程部署下本进程不是 mpv 所有者."""
+	return CLUSTER is not None and not CLUSTER.is_leader
+
+def _cluster_start():
+	"""加入选举: 先启动只监听 127.0.0.1 的控制服务 (接收 follower 转发的写操作), 再竞选 mpv 所有者."""
+	global CLUSTER
+	with _CLUSTER_LOCK:
+		if SHARED is None or CLUSTER is not None:
+			return
+		from werkzeug.serving import make_server
+		srv = make_server('127.0.0.1', 0, APP, threaded=True)
+		threading.Thread(target=srv.serve_forever, daemon=True).start()
+		coord = Coordinator(SHARED, port=srv.server_port, on_lead=_on_lead, on_demote=_on_demote, heartbeat=_heartbeat)
+		coord.start()
+		CLUSTER = coord
+
+def _on_lead():
+	"""成为 mpv 所有者: 接管曲库扫描/监视, 各分区从上一个所有者留下的曲目继续."""
+	global _LIBRARY_THREAD
+	_LIBRARY_THREAD = None
+	_ensure_library(wait=0)
+	_restore_zones(_shared_resume_state)
+
+def _shared_resume_state(zone) -> dict:
+	"""没有状态日志时, 从上一个所有者发布的分区记录中取曲目."""
+	rec = SHARED.get('zone:' + zone.id) or {}
+	return {'rel': rec.get('status', {}).get('playing', {}).get('rel'), 'autoplay': bool(SHARED.get('autoplay:' + zone.id))}
+
+def _on_demote():
+	"""租约被其他进程接管 (本进程曾长时间卡住): 断开 mpv 并停止监视, 避免两个进程同时控制."""
+	global WATCHER
+	for zone in ZONES:
+		zone.autoplay = False
+		zone.stop()
+	if WATCHER is not None:
+		WATCHER.stop()
+		WATCHER = None
+
+def _zone_record(zone, payload=None) -> dict:
+	return {'status': payload or zone.status_payload(), 'ts': time.time(), 'info': zone.info()}
+
+def _share_status(zone, payload):
+	# 事件驱动: 曲目切换/暂停/音量变化后立即写入 (异步合并写)
+	if SHARED is not None and not _follower():
+		SHARED.publish('zone:' + zone.id, _zone_record(zone, payload))
+
+def _heartbeat():
+	"""leader 每次续约后发布曲库/标签代数与扫描进度, 并刷新各分区记录 (shuffle/连接等不经推送的字段)."""
+	items = {'library': {'owner': SHARED.owner, 'generation': LIBRARY.generation, 'tags': META.version,
+		'scan': LIBRARY.progress}}
+	for zone in ZONES:
+		items['zone:' + zone.id] = _zone_record(zone)
+		if not zone.autoplay and SHARED.get('autoplay:' + zone.id):
+			zone.ensure_auto_thread()
+	SHARED.put(items)
+
+for _z in ZONES:
+	_z.on_status.append(_share_status)
+Gauge('jukebox_cluster_leader', '多进程部署: 本进程是否为 mpv 所有者 (单进程时恒为 1)').set_function(lambda: 0 if _follower() else 1)
+
+# 单进程部署 (直接运行或外部 WSGI 单 worker) 在创建分区后立即恢复; 多进程由 leader 在 _on_lead 中恢复.
+# 进程池 (spawn) 的子进程以 __mp_main__ 重新导入本模块, 不恢复 (打包为 exe 时子进程以 __main__ 执行到这里, 只能看命令行);
+# 调试模式的重载器父进程不提供服务, 也不恢复
+_POOL_CHILD = __name__ == '__mp_main__' or '--multiprocessing-fork' in sys.argv
+_RELOADER_PARENT = __name__ == '__main__' and _cfg_bool('DEBUG') and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+if SHARED is None and not _POOL_CHILD and not _RELOADER_PARENT:
+	_restore_zones()
+
+def _follow_library():
+	"""follower: leader 发布的曲库/标签代数变化后从 SQLite 重新载入 (至多每秒检查一次, 不阻塞其他请求)."""
+	global _SEARCH_THREAD
+	now = time.time()
+	if now - _FOLLOW['ts'] < 1.0 or not _FOLLOW_LOCK.acquire(blocking=False):
+		return
+	try:
+		_FOLLOW['ts'] = now
+		lib = SHARED.get('library') or {}
+		gen = (lib.get('owner'), lib.get('generation'))
+		if gen != _FOLLOW['library']:
+			_FOLLOW['library'] = gen
+			LIBRARY.reload()
+			_SEARCH_THREAD = threading.Thread(target=SEARCH.build, args=(list(LIBRARY.playlist()),), daemon=True)
+			_SEARCH_THREAD.start()
+		tags = (lib.get('owner'), lib.get('tags'))
+		if tags != _FOLLOW['tags']:
+			_FOLLOW['tags'] = tags
+			META.reload()
+	finally:
+		_FOLLOW_LOCK.release()
+
+def _scan_progress() -> dict:
+	if _follower():
+		return (SHARED.get('library') or {}).get('scan') or LIBRARY.progress
+	return LIBRARY.progress
+
+def _status(zone) -> dict:
+	if _follower():
+		return zone_status(SHARED.get('zone:' + zone.id), zone.id)
+	return zone.status_payload()
+
+def _tick_status(zone):
+	if _follower():
+		zone.hub.publish('status', _status(zone))   # follower 收不到 mpv 推送, 按 tick 轮询共享状态
+	else:
+		zone.tick_status()
+
+def _zone_info(zone) -> dict:
+	if _follower():
+		return (SHARED.get('zone:' + zone.id) or {}).get('info') or {'id': zone.id, 'connected': False, 'playing': None}
+	return zone.info()
+
+def _playlist_view(zone, force: bool = False):
+	"""(播放列表, 当前索引, 当前 rel); follower 用本进程载入的曲库与 leader 发布的当前曲目."""
+	if not _follower():
+		return zone.playlist_view(force)
+	_ensure_library()
+	plist = LIBRARY.playlist()
+	current = zone_status(SHARED.get('zone:' + zone.id), zone.id)['playing'].get('rel')
+	return plist, plist.index(current) if current in plist else -1, current
+
+def _enable_autoplay(zone):
+	if SHARED is not None and not SHARED.get('autoplay:' + zone.id):
+		SHARED.put({'autoplay:' + zone.id: True})    # leader 在下次续约时启用, 接管的新 leader 同样会读到
+	if not _follower():
+		zone.ensure_auto_thread()
+
+def _forward():
+	"""follower: 把请求原样转发给 leader 的控制端口, 响应原样返回."""
+	from flask import request, Response
+	lead = SHARED.leader()
+	if request.headers.get(FORWARD_HEADER) or not lead or not lead.get('port'):
+		return jsonify({'status':'ERROR','error':'播放进程未就绪, 请稍后重试'}), 503
+	req = urllib.request.Request(f"http://127.0.0.1:{lead['port']}{request.full_path}",
+		data=request.get_data() if request.method == 'POST' else None, method=request.method,
+		headers={'Content-Type': request.content_type or 'application/x-www-form-urlencoded', FORWARD_HEADER: '1'})
+	try:
+		with _DIRECT.open(req, timeout=_ZONE_CALL_TIMEOUT + 5) as r:
+			return Response(r.read(), r.status, content_type=r.headers.get('Content-Type'))
+	except urllib.error.HTTPError as e:
+		return Response(e.read(), e.code, content_type=e.headers.get('Content-Type'))
+	except OSError as e:
+		return jsonify({'status':'ERROR','error':f'转发到播放进程失败: {e}'}), 503
+
+@APP.before_request
+def _route_by_role():
+	"""多进程部署: 首个请求时加入选举; follower 上需要 mpv/分区线程的请求转发给 leader."""
+	if SHARED is None:
+		return None
+	from flask import request
+	_cluster_start()
+	if _follower() and (request.endpoint in _LEADER_ENDPOINTS
+			or (request.endpoint == 'api_playlist' and request.args.get('rebuild') == '1')):
+		return _forward()
+	return None
+
 
 # =========== 路由 ===========
 @APP.route('/')
 def index():
-	tree = build_tree()
-	#_AUTO_THREAD = True
-	_ensure_auto_thread()
-	return render_template('index.html', tree=tree, music_dir=MUSIC_DIR)
+	# 页面只内嵌顶层, 子目录展开时再经 /tree?rel=...&depth=1 加载
+	zone = _zone_arg() or ZONES.get()
+	tree = build_tree_level('', 1) or {'name': '根目录', 'rel': '', 'dirs': [], 'files': []}
+	_enable_autoplay(zone)
+	return render_template('index.html', tree=tree, music_dir=MUSIC_DIR, scanning=_scan_progress()['scanning'],
+		zones=[z.id for z in ZONES], zone=zone.id)
 
 @APP.route('/play', methods=['POST'])
 def play_route():
 	from flask import request
+	zone = _zone_arg()
+	if zone is None:
+		return _no_zone()
 	rel = (request.form.get('path') or '').strip()
 	if not rel:
 		return jsonify({'status':'ERROR','error':'缺少 path'}), 400
 	try:
-		if not ensure_mpv():
-			return jsonify({'status':'ERROR','error':'mpv 启动失败'}), 400
-		global PLAYLIST, CURRENT_INDEX
-		if not PLAYLIST or rel not in PLAYLIST:
-			PLAYLIST = _build_playlist()
-		if rel not in PLAYLIST:
-			return jsonify({'status':'ERROR','error':'文件不在列表'}), 400
-		idx = PLAYLIST.index(rel)
-		if not _play_index(idx):
-			return jsonify({'status':'ERROR','error':'播放失败'}), 400
-		_ensure_auto_thread()
-		return jsonify({'status':'OK','rel':rel,'index':idx,'total':len(PLAYLIST)})
+		res = zone.play(rel)
+		return jsonify({'status':'OK','zone':zone.id, **res})
+	except ZoneError as e:
+		return _zone_error(e)
 	except Exception as e:
 		return jsonify({'status':'ERROR','error':str(e)}), 400
 
 @APP.route('/tree')
 def tree_json():
-	return jsonify({'status':'OK','tree':build_tree()})
+	"""文件树.
+
+	参数:
+	  rel    目录相对路径 (默认根目录)
+	  depth  展开层数 (默认 1); 两者都不提供时返回完整树 (兼容旧客户端)
+	"""
+	from flask import request
+	if 'rel' not in request.args and 'depth' not in request.args:
+		_ensure_library()
+		return _send_blob(('tree', LIBRARY.generation), lambda: {'status':'OK','tree':build_tree()})
+	try:
+		depth = max(0, int(request.args.get('depth', '1') or 1))
+	except ValueError:
+		return jsonify({'status':'ERROR','error':'depth 非法'}), 400
+	rel = request.args.get('rel', '').replace('\\', '/').strip('/')
+	if build_tree_level(rel, 0) is None:
+		return jsonify({'status':'ERROR','error':'不存在的目录'}), 400
+	scan = _scan_progress()
+	# 扫描进度只在开始/结束时改变缓存键, 扫描期间的内容变化由代数体现
+	return _send_blob(('tree', LIBRARY.generation, rel, depth, scan['scanning']),
+		lambda: {'status':'OK','tree':LIBRARY.tree_level(rel, depth),'scan': scan})
+
+# =========== 浏览器播放 ===========
+try:
+	STREAMS = StreamLimiter(max(1, int(cfg.get('STREAM_MAX', '64'))), max(1, int(cfg.get('STREAM_PER_CLIENT', '4'))),
+		max(0.0, float(cfg.get('STREAM_RATE_KBPS', '2048'))) * 1024)
+except ValueError:
+	STREAMS = StreamLimiter(64, 4, 2048 * 1024)
+
+@APP.route('/stream/<path:rel>', methods=['GET', 'HEAD'])
+def api_stream(rel):
+	"""把曲目文件传给浏览器播放; 支持 Range (206), 文件内容以 sendfile 发送.
+
+	连接数超过 STREAM_MAX / STREAM_PER_CLIENT 时返回 503 (带 Retry-After).
+	"""
+	from flask import request, Response
+	try:
+		path = safe_path(rel)
+	except ValueError as e:
+		return jsonify({'status':'ERROR','error':str(e)}), 404
+	if os.path.splitext(path)[1].lower() not in ALLOWED or not os.path.isfile(path):
+		return jsonify({'status':'ERROR','error':'不是曲目文件'}), 404
+	st = os.stat(path)
+	size = st.st_size
+	etag = f'{st.st_mtime_ns:x}-{size:x}'
+	headers = {'Accept-Ranges': 'bytes', 'Cache-Control': 'no-cache'}
+	if request.if_none_match.contains_weak(etag):
+		resp = Response(status=304, headers=headers)
+		resp.set_etag(etag)
+		return resp
+	start, length, status = 0, size, 200
+	rng, if_range = request.range, request.if_range
+	# If-Range 与当前文件不符 (文件已被替换) 时忽略 Range, 返回整个文件
+	fresh = (if_range.etag is None and if_range.date is None) or if_range.etag == etag \
+		or (if_range.date is not None and if_range.date.timestamp() >= int(st.st_mtime))
+	if rng is not None and fresh:
+		bounds = rng.range_for_length(size)
+		if bounds is not None:
+			start, length, status = bounds[0], bounds[1] - bounds[0], 206
+			headers['Content-Range'] = f'bytes {bounds[0]}-{bounds[1] - 1}/{size}'
+		elif len(rng.ranges) == 1:
+			headers['Content-Range'] = f'bytes */{size}'
+			return Response(status=416, headers=headers)
+		# 多段范围不支持, 返回整个文件
+	headers['Content-Length'] = str(length)
+	mime = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+	if request.method == 'HEAD':
+		resp = Response(status=status, headers=headers, mimetype=mime)
+	else:
+		client = request.remote_addr or ''
+		reason = STREAMS.acquire(client)
+		if reason is not None:
+			return jsonify({'status':'ERROR','error':'连接数已满, 请稍后重试'}), 503, {'Retry-After': '2'}
+		try:
+			body = FileStream(path, start, length, request.environ, STREAMS.bucket(client), lambda: STREAMS.release(client))
+		except OSError as e:
+			STREAMS.release(client)
+			return jsonify({'status':'ERROR','error':str(e)}), 404
+		resp = Response(body.wsgi_body(), status=status, headers=headers, mimetype=mime, direct_passthrough=True)
+	resp.set_etag(etag)
+	resp.last_modified = st.st_mtime
+	return resp
+
+@APP.route('/peaks/<path:rel>')
+def api_peaks(rel):
+	"""曲目的波形峰值 (二进制, 格式见 peaks.py). 尚未生成时在后台生成, 稍等仍未完成则返回 202."""
+	from flask import request, Response
+	try:
+		path = safe_path(rel)
+	except ValueError as e:
+		return jsonify({'status':'ERROR','error':str(e)}), 404
+	# 与 /stream 相同的检查: 非曲目文件不应交给解码器, 也不应记入 PeakStore 的失败表
+	if os.path.splitext(path)[1].lower() not in ALLOWED or not os.path.isfile(path):
+		return jsonify({'status':'ERROR','error':'不是曲目文件'}), 404
+	if not PEAKS.supported(path):
+		return jsonify({'status':'ERROR','error':'该格式需要本地解码器'}), 415
+	try:
+		key, data = PEAKS.get(path, wait=1.0)
+	except UnsupportedFormat as e:
+		return jsonify({'status':'ERROR','error':str(e)}), 415
+	if data is None:
+		return jsonify({'status':'PENDING'}), 202, {'Retry-After': '1'}
+	if request.if_none_match.contains(key):
+		resp = Response(status=304)
+	else:
+		resp = Response(data, mimetype='application/octet-stream')
+	resp.set_etag(key)
+	resp.headers['Cache-Control'] = 'no-cache'
+	return resp
+
+@APP.route('/search')
+def api_search():
+	"""服务端路径搜索.
+
+	参数:
+	  q  关键词 (空白分隔, 需全部命中, 不区分大小写)
+	  offset, limit  分页 (limit 默认 50, 最大 500)
+	"""
+	from flask import request
+	t0 = time.perf_counter()
+	q = (request.args.get('q') or '').strip()
+	try:
+		offset = max(0, int(request.args.get('offset', '0') or 0))
+		limit = min(500, max(1, int(request.args.get('limit', '50') or 50)))
+	except ValueError:
+		return jsonify({'status':'ERROR','error':'分页参数非法'}), 400
+	_ensure_library()
+	if not SEARCH.ready:
+		_ensure_search_index()
+		return jsonify({'status':'ERROR','error':'搜索索引构建中, 请稍候'}), 503
+	total, page, complete = SEARCH.search(q, offset, limit)
+	return jsonify({
+		'status': 'OK',
+		'q': q,
+		'total': total,
+		'complete': complete,
+		'offset': offset,
+		'limit': limit,
+		'hits': [{'name': r.rsplit('/', 1)[-1], 'rel': r} for r in page],
+		'ms': round((time.perf_counter() - t0) * 1000, 2)
+	})
 
 @APP.route('/next', methods=['POST'])
 def api_next():
-	if not ensure_mpv():
-		return jsonify({'status':'ERROR','error':'mpv 未就绪'}), 400
-	if _next_track():
-		return jsonify({'status':'OK','rel': PLAYLIST[CURRENT_INDEX], 'index': CURRENT_INDEX, 'total': len(PLAYLIST)})
-	return jsonify({'status':'ERROR','error':'没有下一首'}), 400
+	zone = _zone_arg()
+	if zone is None:
+		return _no_zone()
+	try:
+		return jsonify({'status':'OK','zone':zone.id, **zone.next()})
+	except ZoneError as e:
+		return _zone_error(e)
 
 @APP.route('/prev', methods=['POST'])
 def api_prev():
-	if not ensure_mpv():
-		return jsonify({'status':'ERROR','error':'mpv 未就绪'}), 400
-	if _prev_track():
-		return jsonify({'status':'OK','rel': PLAYLIST[CURRENT_INDEX], 'index': CURRENT_INDEX, 'total': len(PLAYLIST)})
-	return jsonify({'status':'ERROR','error':'没有上一首'}), 400
+	zone = _zone_arg()
+	if zone is None:
+		return _no_zone()
+	try:
+		return jsonify({'status':'OK','zone':zone.id, **zone.prev()})
+	except ZoneError as e:
+		return _zone_error(e)
 
 @APP.route('/status')
 def api_status():
-	"""返回当前播放状态（仅内存），所有客户端轮询实现共享可见性。"""
-	playing = CURRENT_META if CURRENT_META else {}
-	mpv_info = {}
-	# 仅在 mpv 管道可用时尝试获取实时播放属性
+	"""返回分区当前播放状态（仅内存），所有客户端轮询实现共享可见性。"""
+	zone = _zone_arg()
+	if zone is None:
+		return _no_zone()
+	return jsonify(_status(zone))
+
+@APP.route('/events')
+def api_events():
+	"""Server-Sent Events: 曲目切换/暂停/音量变化即时推送, 播放进度按 EVENTS_TICK 秒推送."""
+	from flask import Response
+	zone = _zone_arg()
+	if zone is None:
+		return _no_zone()
 	try:
-		with open(PIPE_NAME, 'wb') as _:
-			try:
-				pos = mpv_get('time-pos')
-				dur = mpv_get('duration')
-				paused = mpv_get('pause')
-				vol = mpv_get('volume')
-				mpv_info = {
-					'time': pos,
-					'duration': dur,
-					'paused': paused,
-					'volume': vol
-				}
-			except Exception:
-				pass
-	except Exception:
-		pass
-	return jsonify({'status':'OK','playing': playing, 'mpv': mpv_info})
+		tick = float(cfg.get('EVENTS_TICK', '1'))
+	except ValueError:
+		tick = 1.0
+	zone.hub.start_ticker(tick, lambda: _tick_status(zone))
+	q = zone.hub.subscribe()
+	first = format_sse('status', _status(zone))
+	return Response(zone.hub.stream(q, first), mimetype='text/event-stream',
+		headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @APP.route('/shuffle', methods=['POST'])
 def api_shuffle():
-	"""切换随机播放模式."""
-	global SHUFFLE
-	SHUFFLE = not SHUFFLE
-	return jsonify({'status':'OK','shuffle': SHUFFLE})
+	"""切换分区的随机播放模式.
+
+	参数 seed (可选): 不切换模式, 以该种子重新生成随机排列 (并开启随机模式).
+	"""
+	from flask import request
+	zone = _zone_arg()
+	if zone is None:
+		return _no_zone()
+	seed = request.form.get('seed')
+	try:
+		on = zone.toggle_shuffle(seed or None, reseed=seed is not None)
+	except ZoneError as e:
+		return _zone_error(e)
+	return jsonify({'status':'OK','zone':zone.id,'shuffle': on})
+
+@APP.route('/autodj', methods=['POST'])
+def api_autodj():
+	"""开启/关闭分区的自动 DJ 模式: 下一首为音频特征最相似、且本轮尚未播放的曲目 (与随机播放互斥).
+
+	参数 value (可选): true/false; 省略时切换. 返回特征提取进度; 索引建立前按原有顺序播放.
+	"""
+	from flask import request
+	zone = _zone_arg()
+	if zone is None:
+		return _no_zone()
+	value = request.form.get('value')
+	try:
+		on = zone.set_autodj(None if value is None else value.strip().lower() in ('1', 'true', 'yes', 'on'))
+	except ZoneError as e:
+		return _zone_error(e)
+	index = FEATURES.index
+	return jsonify({'status':'OK','zone':zone.id,'autodj': on,'shuffle': zone.snapshot['shuffle'],
+		'indexed': len(index) if index is not None else 0,'progress': FEATURES.progress})
+
+@APP.route('/zones')
+def api_zones():
+	"""所有分区及其连接/播放状态."""
+	return jsonify({'status':'OK','default': ZONES.default,'zones':[_zone_info(z) for z in ZONES]})
 
 @APP.route('/playlist')
 def api_playlist():
@@ -445,10 +1049,17 @@ def api_playlist():
 	参数:
 	  rebuild=1  强制重建扫描
 	  offset, limit  分页 (可选)
+	  meta=1     每项返回 {rel, title, artist, album, track, duration} (来自标签缓存)
 	"""
 	from flask import request
+	zone = _zone_arg()
+	if zone is None:
+		return _no_zone()
 	force = request.args.get('rebuild') == '1'
-	plist = _ensure_playlist(force)
+	try:
+		plist, index, current = _playlist_view(zone, force)
+	except ZoneError as e:
+		return _zone_error(e)
 	offset = int(request.args.get('offset', '0') or 0)
 	limit = request.args.get('limit')
 	if limit is not None:
@@ -458,53 +1069,168 @@ def api_playlist():
 			limit_i = 0
 	else:
 		limit_i = 0
-	data = plist
 	if offset < 0: offset = 0
-	if limit_i > 0:
-		data = plist[offset: offset+limit_i]
+	meta = request.args.get('meta') == '1'
+
+	def build():
+		data = plist.to_list()
+		if limit_i > 0:
+			data = plist[offset: offset+limit_i]
+		extra = {}
+		if meta:
+			data = [dict(META.get(rel), rel=rel) for rel in data]
+			extra['metadata'] = META.progress
+		return {
+			'status': 'OK',
+			'total': len(plist),
+			'zone': zone.id,
+			'index': index,
+			'current': current,
+			'offset': offset,
+			'limit': limit_i or None,
+			'playlist': data,
+			**extra
+		}
+	# 缓存键包含决定内容的全部因素: 曲库代数、当前曲目、分页与标签版本
+	key = ('playlist', zone.id, LIBRARY.generation, index, current, offset, limit_i,
+		(META.version, META.progress['state']) if meta else None)
+	return _send_blob(key, build)
+
+@APP.route('/duplicates', methods=['GET', 'POST'])
+def api_duplicates():
+	"""重复曲目分组 (按内容哈希).
+
+	GET 参数: rescan=1 重新计算 (后台进行, 结果见 progress)
+	POST 参数: skip=1/0 下一首/随机播放时是否跳过副本
+	"""
+	from flask import request
+	global DEDUP_SKIP
+	if request.method == 'POST':
+		skip = request.form.get('skip')
+		if skip is not None:
+			DEDUP_SKIP = skip.strip().lower() in ('1', 'true', 'yes', 'on')
+			if DEDUP_SKIP:
+				_ensure_dupes()
+			for zone in ZONES:
+				zone.set_skip(DUPES.is_duplicate if DEDUP_SKIP else None)
+	elif request.args.get('rescan') == '1':
+		_ensure_library()
+		_ensure_dupes(force=True)
+	groups = DUPES.groups
 	return jsonify({
 		'status': 'OK',
-		'total': len(plist),
-		'index': CURRENT_INDEX,
-		'current': CURRENT_META.get('rel') if CURRENT_META else None,
-		'offset': offset,
-		'limit': limit_i or None,
-		'playlist': data
+		'skip': DEDUP_SKIP,
+		'progress': DUPES.progress,
+		'total': len(groups),
+		'wasted_bytes': sum(g['size'] * (len(g['tracks']) - 1) for g in groups),
+		'groups': groups,
 	})
 
 @APP.route('/debug/mpv')
 def api_debug_mpv():
-	info = {
-		'MPV_CMD': MPV_CMD,
-		'PIPE_NAME': PIPE_NAME,
-		'pipe_exists': mpv_pipe_exists(),
-		'playlist_len': len(PLAYLIST),
-		'current_index': CURRENT_INDEX,
-		'shuffle': 'SHUFFLE' in globals() and globals().get('SHUFFLE')
-	}
+	zone = _zone_arg()
+	if zone is None:
+		return _no_zone()
+	try:
+		info = zone.debug()
+	except ZoneError as e:
+		return _zone_error(e)
 	return jsonify({'status':'OK','info': info})
 
+@APP.route('/metrics')
+def api_metrics():
+	"""Prometheus 文本格式的指标; 多进程部署时为处理本次请求的进程自身的指标."""
+	from flask import Response
+	return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @APP.route('/volume', methods=['POST'])
 def api_volume():
 	from flask import request
 	# form: value 可选(0-100). 不提供则返回当前音量
-	if not ensure_mpv():
-		return jsonify({'status':'ERROR','error':'mpv 未就绪'}), 400
+	zone = _zone_arg()
+	if zone is None:
+		return _no_zone()
 	val = request.form.get('value')
-	if val is None or val == '':
-		cur = mpv_get('volume')
-		return jsonify({'status':'OK','volume': cur})
 	try:
-		f = float(val)
-	except ValueError:
-		return jsonify({'status':'ERROR','error':'数值非法'}), 400
-	if f < 0: f = 0
-	if f > 130: f = 130
-	if not mpv_set('volume', f):
-		return jsonify({'status':'ERROR','error':'设置失败'}), 400
-	return jsonify({'status':'OK','volume': f})
+		if val is None or val == '':
+			return jsonify({'status':'OK','volume': zone.volume()})
+		try:
+			f = float(val)
+		except ValueError:
+			return jsonify({'status':'ERROR','error':'数值非法'}), 400
+		if f < 0: f = 0
+		if f > 130: f = 130
+		return jsonify({'status':'OK','volume': zone.volume(f)})
+	except ZoneError as e:
+		return _zone_error(e)
+
+@APP.route('/batch', methods=['POST'])
+def api_batch():
+	"""按顺序执行一组播放控制操作, 产生的 mpv 命令合并为一次写入.
+
+	请求体 JSON: {"ops": [{"op": "volume", "value": 40}, {"op": "play", "path": "a/b.mp3"}, ...]}
+	  play / enqueue: path        volume: value(0-130)     pause: value(默认 true)
+	  seek: value, mode=absolute|relative|absolute-percent
+	  shuffle: value(省略时切换), seed(可选, 重新生成随机排列)     autodj: value(省略时切换)     next / prev
+	任一操作参数非法时整批不执行.
+	"""
+	from flask import request
+	zone = _zone_arg()
+	if zone is None:
+		return _no_zone()
+	ops = (request.get_json(silent=True) or {}).get('ops')
+	if not isinstance(ops, list) or not ops:
+		return jsonify({'status':'ERROR','error':'缺少 ops'}), 400
+	if len(ops) > BATCH_MAX_OPS:
+		return jsonify({'status':'ERROR','error':f'操作过多 (最多 {BATCH_MAX_OPS})'}), 400
+	try:
+		res = zone.batch(ops)
+	except ZoneError as e:
+		return _zone_error(e)
+	except Exception as e:
+		return jsonify({'status':'ERROR','error':str(e)}), 400
+	return jsonify({'status':'OK','zone':zone.id, **res})
 
 print("Build marker:", time.time())
 
+def _serve_worker(host: str, port: int):
+	"""多进程模式的 worker: 以 SO_REUSEPORT 监听同一端口, 由内核在各进程间分配连接."""
+	from werkzeug.serving import make_server
+	sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+	sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+	sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+	sock.bind((host, port))
+	sock.listen(128)
+	_cluster_start()             # 启动即参与选举, leader 退出时可以立即接管
+	make_server(host, port, APP, threaded=True, fd=sock.fileno()).serve_forever()
+
+def _serve_workers(host: str, port: int, n: int):
+	"""启动并看护 n 个 worker 进程; 退出的 worker 会被重新拉起."""
+	import multiprocessing
+	ctx = multiprocessing.get_context('spawn')      # 子进程重新导入本模块, 不继承父进程的 SQLite 连接
+	procs = [None] * n
+	try:
+		while True:
+			for i, p in enumerate(procs):
+				if p is None or not p.is_alive():
+					if p is not None:
+						print(f'[WARN] worker {p.pid} 已退出 (code {p.exitcode}), 重新启动')
+					procs[i] = ctx.Process(target=_serve_worker, args=(host, port))
+					procs[i].start()
+			time.sleep(1)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		for p in procs:
+			if p is not None and p.is_alive():
+				p.terminate()
+
 if __name__ == '__main__':
-	APP.run(host=cfg.get('FLASK_HOST','0.0.0.0'), port=cfg.get('FLASK_PORT',8000), debug=cfg.get('DEBUG',False))
+	multiprocessing.freeze_support()     # 打包为 exe 时标签解析进程池需要
+	if SERVE_WORKERS > 1 and hasattr(socket, 'SO_REUSEPORT'):
+		print(f'[INFO] 多进程模式: {SERVE_WORKERS} 个 worker')
+		_serve_workers(cfg.get('FLASK_HOST','0.0.0.0'), int(cfg.get('FLASK_PORT',8000)), SERVE_WORKERS)
+	else:
+		if SERVE_WORKERS > 1:
+			print('[WARN] 当前平台不支持 SO_REUSEPORT, 以单进程运行; 多进程请使用外部 WSGI 服务器')
+		APP.run(host=cfg.get('FLASK_HOST','0.0.0.0'), port=cfg.get('FLASK_PORT',8000), debug=_cfg_bool('DEBUG'))
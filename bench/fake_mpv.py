@@ -0,0 +1,278 @@
+"""模拟 mpv 的 JSON IPC 服务 (Unix socket), 供基准测试使用, 不需要真实的 mpv 与音频设备.
+
+支持 app 用到的命令: loadfile (replace/append/append-play), playlist-clear, playlist-next,
+stop, get_property/set_property (含 start 选项), observe_property; 按 --duration 模拟曲目播放结束并产生
+end-file/idle 等事件. 每个响应可按 --latency 延迟返回, 加载文件可按 --load-latency 延迟.
+
+额外命令 ["bench-stats"] 返回统计: 切歌间隙 (上一首 eof 到下一首开始播放, 毫秒)、请求数等.
+
+用法 (也可直接写进 MPV_CMD):
+  python bench/fake_mpv.py --input-ipc-server=/tmp/mpv.sock --duration=2 --latency=1
+"""
+import os, sys, json, time, socket, argparse, threading
+
+_PROPS = ('path', 'pause', 'duration', 'volume', 'speed', 'idle-active', 'eof-reached')
+
+
+class FakeMpv:
+	def __init__(self, path: str, duration: float = 3.0, latency: float = 0.0, load_latency: float = 0.0):
+		self.path = path
+		self.duration = duration     # 每首曲目的时长(秒)
+		self.latency = latency       # 每个响应的额外延迟(秒)
+		self.load_latency = load_latency
+		self._lock = threading.RLock()
+		self._clients = {}           # socket -> {属性名: observe id}
+		self.playlist = []
+		self.pos = -1
+		self.props = {'pause': False, 'volume': 100.0, 'speed': 1.0}
+		self._started = None         # 当前曲目开始播放的 monotonic 时间; None 为加载中/空闲
+		self._load_seq = 0
+		self._eof_at = None          # 上一首 eof 的时间, 下一首开始播放时计算间隙
+		self.stats = {'requests': 0, 'loads': 0, 'eof': 0, 'gaps_ms': []}
+		self._srv = None
+
+	# ---------- 播放模拟 ----------
+	def _current(self):
+		return self.playlist[self.pos] if 0 <= self.pos < len(self.playlist) else None
+
+	def _prop(self, name):
+		if name == 'path' or name == 'filename':
+			p = self._current()
+			return p if name == 'path' or p is None else os.path.basename(p)
+		if name == 'idle-active':
+			return self._current() is None
+		if name == 'eof-reached':
+			return False
+		if name in ('time-pos', 'playback-time'):
+			return self._position()
+		if name == 'duration':
+			return self.duration if self._started is not None else None
+		if name == 'playlist-pos':
+			return self.pos
+		if name == 'playlist-count':
+			return len(self.playlist)
+		return self.props.get(name)
+
+	def _position(self):
+		if self._started is None:
+			return None
+		return min(self.duration, (time.monotonic() - self._started) * self.props['speed'])
+
+	def _start(self, pos: int):
+		"""切到 pos 并 (在 load_latency 之后) 开始播放."""
+		self.pos = pos
+		self._started = None
+		self._load_seq += 1
+		self.stats['loads'] += 1
+		self._emit({'event': 'start-file', 'playlist_entry_id': pos + 1})
+		self._changed('path')
+		if self.load_latency > 0:
+			seq = self._load_seq
+			threading.Timer(self.load_latency, self._loaded, args=(seq,)).start()
+		else:
+			self._loaded(self._load_seq)
+
+	def _loaded(self, seq: int):
+		with self._lock:
+			if seq != self._load_seq or self._current() is None:
+				return
+			self._started = time.monotonic()
+			start = self.props.get('start')
+			if start not in (None, 'none'):
+				self._started -= float(start) / self.props['speed']     # --start: 从该位置开始
+			if self._eof_at is not None:
+				self.stats['gaps_ms'].append(round((self._started - self._eof_at) * 1000, 3))
+				self._eof_at = None
+			self._emit({'event': 'file-loaded'})
+			self._changed('duration')
+			self._changed('idle-active')
+			self._emit({'event': 'playback-restart'})
+
+	def _end(self, reason: str):
+		self._emit({'event': 'end-file', 'reason': reason})
+		if reason == 'eof':
+			self.stats['eof'] += 1
+			self._eof_at = time.monotonic()
+		else:
+			self._eof_at = None
+
+	def _idle(self):
+		self.pos = -1
+		self._started = None
+		self._changed('path')
+		self._changed('duration')
+		self._changed('idle-active')
+		self._emit({'event': 'idle'})
+
+	def _tick(self):
+		while True:
+			time.sleep(0.005)
+			with self._lock:
+				if self._started is None or self.props['pause']:
+					if self._started is not None:
+						self._started += 0.005    # 暂停时不前进
+					continue
+				if self._position() < self.duration:
+					continue
+				self._end('eof')
+				if self.pos + 1 < len(self.playlist):
+					self._start(self.pos + 1)
+				else:
+					self._idle()
+
+	# ---------- IPC ----------
+	def _send(self, sock, obj):
+		try:
+			sock.sendall((json.dumps(obj) + '\n').encode())
+		except OSError:
+			self._clients.pop(sock, None)
+
+	def _emit(self, ev: dict):
+		for sock in list(self._clients):
+			self._send(sock, ev)
+
+	def _changed(self, name: str):
+		value = self._prop(name)
+		for sock, observed in list(self._clients.items()):
+			oid = observed.get(name)
+			if oid is not None:
+				self._send(sock, {'event': 'property-change', 'id': oid, 'name': name, 'data': value})
+
+	def _handle_cmd(self, sock, cmd: list):
+		op = cmd[0] if cmd else None
+		if op == 'loadfile':
+			mode = cmd[2] if len(cmd) > 2 else 'replace'
+			if mode == 'replace':
+				if self._current() is not None:
+					self._end('stop')
+				self.playlist = [cmd[1]]
+				self._start(0)
+			else:
+				self.playlist.append(cmd[1])
+				if mode == 'append-play' and self._current() is None:
+					self._start(len(self.playlist) - 1)
+			return None
+		if op == 'playlist-clear':
+			cur = self._current()
+			self.playlist = [cur] if cur is not None else []
+			self.pos = 0 if cur is not None else -1
+			return None
+		if op == 'playlist-next':
+			if self.pos + 1 >= len(self.playlist):
+				raise ValueError('error running command')
+			self._end('stop')
+			self._start(self.pos + 1)
+			return None
+		if op == 'stop':
+			if self._current() is not None:
+				self._end('stop')
+			self.playlist = []
+			self._idle()
+			return None
+		if op == 'get_property':
+			if cmd[1] not in self.props and cmd[1] not in _PROPS + ('time-pos', 'playback-time', 'filename', 'playlist-pos', 'playlist-count'):
+				raise KeyError('property not found')
+			return self._prop(cmd[1])
+		if op == 'set_property':
+			self.props[cmd[1]] = cmd[2]
+			self._changed(cmd[1])
+			return None
+		if op == 'observe_property':
+			self._clients.setdefault(sock, {})[cmd[2]] = cmd[1]
+			self._send(sock, {'event': 'property-change', 'id': cmd[1], 'name': cmd[2], 'data': self._prop(cmd[2])})
+			return None
+		if op == 'bench-stats':
+			gaps = self.stats['gaps_ms']
+			return dict(self.stats, gaps_ms=list(gaps))
+		if op == 'bench-reset':
+			self.stats.update(requests=0, loads=0, eof=0, gaps_ms=[])
+			return None
+		raise KeyError('invalid command')
+
+	def _serve_client(self, sock):
+		with self._lock:
+			self._clients[sock] = {}
+		buf = b''
+		try:
+			while True:
+				chunk = sock.recv(65536)
+				if not chunk:
+					break
+				buf += chunk
+				while b'\n' in buf:
+					line, buf = buf.split(b'\n', 1)
+					if not line.strip():
+						continue
+					try:
+						msg = json.loads(line)
+					except ValueError:
+						continue
+					if self.latency > 0:
+						time.sleep(self.latency)
+					resp = {'request_id': msg.get('request_id', 0), 'error': 'success'}
+					with self._lock:
+						self.stats['requests'] += 1
+						try:
+							data = self._handle_cmd(sock, msg.get('command') or [])
+							if data is not None:
+								resp['data'] = data
+						except (KeyError, ValueError, IndexError) as e:
+							resp['error'] = e.args[0] if e.args else 'error'
+						self._send(sock, resp)
+		except OSError:
+			pass
+		finally:
+			with self._lock:
+				self._clients.pop(sock, None)
+			sock.close()
+
+	def start(self):
+		"""在后台线程中监听; 返回 self."""
+		if os.path.exists(self.path):
+			os.unlink(self.path)
+		self._srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self._srv.bind(self.path)
+		self._srv.listen(16)
+		threading.Thread(target=self._tick, daemon=True).start()
+		threading.Thread(target=self._accept, daemon=True).start()
+		return self
+
+	def _accept(self):
+		while True:
+			try:
+				sock, _ = self._srv.accept()
+			except OSError:
+				return
+			threading.Thread(target=self._serve_client, args=(sock,), daemon=True).start()
+
+	def close(self):
+		if self._srv is not None:
+			self._srv.close()
+			self._srv = None
+		try:
+			os.unlink(self.path)
+		except OSError:
+			pass
+
+
+def main(argv=None):
+	ap = argparse.ArgumentParser(description='模拟 mpv JSON IPC 服务')
+	ap.add_argument('--input-ipc-server', required=True, help='Unix socket 路径')
+	ap.add_argument('--duration', type=float, default=3.0, help='每首曲目时长(秒)')
+	ap.add_argument('--latency', type=float, default=0.0, help='每个响应的延迟(毫秒)')
+	ap.add_argument('--load-latency', type=float, default=0.0, help='加载文件到开始播放的延迟(毫秒)')
+	# 真实 mpv 的其余参数 (--idle 等) 忽略, 便于直接替换 MPV_CMD
+	args, _ = ap.parse_known_args(argv)
+	mpv = FakeMpv(args.input_ipc_server, args.duration, args.latency / 1000, args.load_latency / 1000).start()
+	print(f'[INFO] fake mpv 监听 {mpv.path}', flush=True)
+	try:
+		while True:
+			time.sleep(3600)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		mpv.close()
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,298 @@
+"""基准测试入口, 结果以 JSON 输出, 便于逐版本比较回归.
+
+  scan      冷扫描 (空索引) 与热扫描 (无变化的增量扫描) 的耗时与速率
+  payload   /tree (完整/按层) 与 /playlist 负载的构建 + 序列化耗时与字节数 (进程内, 不经 HTTP)
+  server    以 fake mpv 启动 app.py 子进程, 测量 N 个并发轮询者下 /status 的延迟分布,
+            各读接口的 HTTP 耗时, 以及连续自动切歌的间隙 (每个 PREFETCH_COUNT 取值各跑一次)
+
+用法:
+  python bench/run.py --out bench.json
+  python bench/run.py --only scan,payload --depth 4 --dirs 10 --files 12
+需要 Unix socket (fake mpv), Windows 下只能运行 scan/payload.
+"""
+import os, sys, json, time, socket, shutil, argparse, platform, tempfile, threading, subprocess, statistics
+import http.client, urllib.parse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+from gen_tree import generate
+from library import LibraryIndex
+
+
+def _pct(values, p: float):
+	if not values:
+		return None
+	values = sorted(values)
+	return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def _summary(ms: list) -> dict:
+	"""毫秒样本 -> 分布统计."""
+	if not ms:
+		return {'n': 0}
+	return {
+		'n': len(ms),
+		'mean': round(statistics.fmean(ms), 3),
+		'p50': round(_pct(ms, 50), 3),
+		'p90': round(_pct(ms, 90), 3),
+		'p99': round(_pct(ms, 99), 3),
+		'max': round(max(ms), 3),
+	}
+
+def _timed(fn, repeat: int):
+	"""重复执行 fn, 返回 (毫秒样本, 最后一次的返回值)."""
+	samples, out = [], None
+	for _ in range(repeat):
+		t0 = time.perf_counter()
+		out = fn()
+		samples.append((time.perf_counter() - t0) * 1000)
+	return samples, out
+
+
+# =========== scan / payload (进程内) ===========
+def bench_scan(music: str, work: str, workers: int):
+	"""返回 (统计, 扫描后的 LibraryIndex), 后者供 payload 测试复用."""
+	db = os.path.join(work, 'scan.db')
+	if os.path.exists(db):
+		os.remove(db)
+	lib = LibraryIndex(db, music, {'.mp3', '.flac', '.wav'}, workers=workers)
+	cold = lib.rescan()
+	warm = lib.rescan()
+	fields = ('seconds', 'entries', 'rate', 'dirs', 'listed', 'timeouts')
+	return {
+		'workers': workers,
+		'files': len(lib.playlist()),
+		'cold': {k: cold[k] for k in fields},
+		'warm': {k: warm[k] for k in fields},
+	}, lib
+
+def bench_payload(lib: LibraryIndex, repeat: int) -> dict:
+	def tree_full():
+		lib._tree = None          # 强制重建, 测的是构建而不是缓存命中
+		return json.dumps({'status': 'OK', 'tree': lib.tree()}, ensure_ascii=False)
+
+	def tree_level():
+		return json.dumps({'status': 'OK', 'tree': lib.tree_level('', 1)}, ensure_ascii=False)
+
+	def playlist_build():
+		lib._playlist = None
+		return json.dumps({'status': 'OK', 'playlist': lib.playlist().to_list()}, ensure_ascii=False)
+
+	def playlist_cached():
+		return json.dumps({'status': 'OK', 'playlist': lib.playlist().to_list()}, ensure_ascii=False)
+
+	out = {}
+	for name, fn in (('tree_full', tree_full), ('tree_level', tree_level),
+			('playlist_build', playlist_build), ('playlist_cached', playlist_cached)):
+		samples, body = _timed(fn, repeat)
+		out[name] = dict(_summary(samples), bytes=len(body.encode('utf-8')))
+	return out
+
+
+# =========== server (app.py 子进程 + fake mpv) ===========
+def _free_port() -> int:
+	with socket.socket() as s:
+		s.bind(('127.0.0.1', 0))
+		return s.getsockname()[1]
+
+class _Server:
+	"""临时目录中的 settings.ini + fake mpv + app.py 子进程."""
+
+	def __init__(self, music: str, work: str, args, prefetch: int):
+		self.dir = os.path.join(work, f'server-p{prefetch}')
+		os.makedirs(self.dir, exist_ok=True)
+		self.port = _free_port()
+		self.sock = os.path.join(self.dir, 'mpv.sock')
+		ini = os.path.join(self.dir, 'settings.ini')
+		with open(ini, 'w', encoding='utf-8') as w:
+			w.write('[app]\n')
+			for k, v in {
+				'MUSIC_DIR': music, 'ALLOWED_EXTENSIONS': '.mp3,.flac,.wav', 'FLASK_HOST': '127.0.0.1',
+				'FLASK_PORT': self.port, 'DEBUG': 'false', 'WATCH_MODE': 'off', 'DEDUP_SCAN': 'false',
+				'PREFETCH_COUNT': prefetch, 'EVENTS_TICK': '1',
+				'MPV_CMD': f'mpv --input-ipc-server={self.sock} --idle=yes',
+			}.items():
+				w.write(f'{k.lower()} = {v}\n')
+		self.mpv = subprocess.Popen([sys.executable, os.path.join(HERE, 'fake_mpv.py'), f'--input-ipc-server={self.sock}',
+			f'--duration={args.track_seconds}', f'--latency={args.mpv_latency}', f'--load-latency={args.load_latency}'],
+			stdout=subprocess.DEVNULL)
+		end = time.time() + 10
+		while not os.path.exists(self.sock) and time.time() < end:
+			time.sleep(0.02)     # app 连不上管道时会尝试自己启动 mpv
+		self.log = open(os.path.join(self.dir, 'app.log'), 'wb')
+		self.app = subprocess.Popen([sys.executable, os.path.join(ROOT, 'app.py')], cwd=self.dir,
+			env=dict(os.environ, JUKEBOX_INI=ini, PYTHONUNBUFFERED='1'), stdout=self.log, stderr=subprocess.STDOUT)
+
+	def get(self, path: str, method: str = 'GET', body: str = None):
+		c = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+		try:
+			c.request(method, path, body=body, headers={'Content-Type': 'application/x-www-form-urlencoded'} if body else {})
+			r = c.getresponse()
+			return r.status, r.read()
+		finally:
+			c.close()
+
+	def wait_ready(self, timeout: float = 60.0):
+		end = time.time() + timeout
+		while time.time() < end:
+			if self.app.poll() is not None:
+				raise RuntimeError(f'app.py 已退出, 见 {self.log.name}')
+			try:
+				if self.get('/zones')[0] == 200:
+					return
+			except OSError:
+				time.sleep(0.1)
+		raise RuntimeError('等待 app.py 启动超时')
+
+	def mpv_request(self, cmd: list):
+		with socket.socket(socket.AF_UNIX) as s:
+			s.connect(self.sock)
+			s.sendall((json.dumps({'command': cmd, 'request_id': 1}) + '\n').encode())
+			buf = b''
+			while True:
+				buf += s.recv(65536)
+				for line in buf.split(b'\n')[:-1]:
+					msg = json.loads(line)
+					if msg.get('request_id') == 1:
+						return msg.get('data')
+
+	def close(self):
+		for p in (self.app, self.mpv):
+			p.terminate()
+			try:
+				p.wait(5)
+			except subprocess.TimeoutExpired:
+				p.kill()
+		self.log.close()
+
+def _poll_status(srv: _Server, pollers: int, seconds: float) -> dict:
+	samples, errors = [], []
+	lock = threading.Lock()
+
+	def worker():
+		conn = http.client.HTTPConnection('127.0.0.1', srv.port, timeout=10)
+		mine, failed = [], 0
+		end = time.perf_counter() + seconds
+		while time.perf_counter() < end:
+			t0 = time.perf_counter()
+			try:
+				conn.request('GET', '/status')
+				r = conn.getresponse()
+				r.read()
+				if r.status != 200:
+					raise OSError(r.status)
+			except (OSError, http.client.HTTPException):
+				failed += 1
+				conn.close()
+				continue
+			mine.append((time.perf_counter() - t0) * 1000)
+		with lock:
+			samples.extend(mine)
+			errors.append(failed)
+
+	threads = [threading.Thread(target=worker) for _ in range(pollers)]
+	t0 = time.perf_counter()
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	elapsed = time.perf_counter() - t0
+	return dict(_summary(samples), pollers=pollers, rps=round(len(samples) / elapsed, 1), errors=sum(errors))
+
+def bench_server(music: str, work: str, args, prefetch: int) -> dict:
+	srv = _Server(music, work, args, prefetch)
+	try:
+		srv.wait_ready()
+		srv.get('/')                 # 首页: 触发曲库扫描并开启自动播放
+		end = time.time() + 30
+		while time.time() < end and not json.loads(srv.get('/status')[1])['playing']:
+			time.sleep(0.05)
+		out = {'prefetch': prefetch, 'http': {}, 'status': []}
+		for path in ('/tree?rel=&depth=1', '/tree', '/playlist', '/playlist?meta=1', '/zones'):
+			samples, (code, body) = _timed(lambda: srv.get(path), args.repeat)
+			out['http'][path] = dict(_summary(samples), bytes=len(body), code=code)
+		for n in args.pollers:
+			out['status'].append(_poll_status(srv, n, args.poll_seconds))
+		# 切歌间隙: 清零后等待若干次自动切歌
+		srv.mpv_request(['bench-reset'])
+		first = json.loads(srv.get('/playlist?limit=1')[1])['playlist'][0]
+		srv.get('/play', 'POST', urllib.parse.urlencode({'path': first}))
+		time.sleep(args.track_seconds * (args.transitions + 0.5))
+		stats = srv.mpv_request(['bench-stats'])
+		out['gap'] = dict(_summary(stats['gaps_ms']), transitions=stats['eof'], mpv_requests=stats['requests'])
+		return out
+	finally:
+		srv.close()
+
+
+def _git_rev():
+	try:
+		return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, timeout=5).stdout.strip() or None
+	except OSError:
+		return None
+
+def main(argv=None):
+	ap = argparse.ArgumentParser(description='音乐播放器基准测试 (JSON 输出)')
+	ap.add_argument('--out', help='结果写入该文件 (默认输出到标准输出)')
+	ap.add_argument('--only', default='scan,payload,server', help='逗号分隔: scan,payload,server')
+	ap.add_argument('--music', help='使用已有目录, 不生成合成目录树')
+	ap.add_argument('--depth', type=int, default=3)
+	ap.add_argument('--dirs', type=int, default=8)
+	ap.add_argument('--files', type=int, default=12)
+	ap.add_argument('--size', type=int, default=2048)
+	ap.add_argument('--scan-workers', type=int, default=8)
+	ap.add_argument('--repeat', type=int, default=20, help='payload / HTTP 单项重复次数')
+	ap.add_argument('--pollers', default='1,8,32', help='/status 并发轮询者数量, 逗号分隔')
+	ap.add_argument('--poll-seconds', type=float, default=3.0)
+	ap.add_argument('--prefetch', default='2,0', help='依次测试的 PREFETCH_COUNT 取值')
+	ap.add_argument('--track-seconds', type=float, default=1.0, help='fake mpv 中每首曲目的时长')
+	ap.add_argument('--transitions', type=int, default=5, help='测量切歌间隙时等待的切歌次数')
+	ap.add_argument('--mpv-latency', type=float, default=0.0, help='fake mpv 每个响应的延迟(毫秒)')
+	ap.add_argument('--load-latency', type=float, default=0.0, help='fake mpv 加载文件的延迟(毫秒)')
+	ap.add_argument('--keep', action='store_true', help='保留临时目录')
+	args = ap.parse_args(argv)
+	args.pollers = [int(x) for x in args.pollers.split(',') if x.strip()]
+	only = set(x.strip() for x in args.only.split(','))
+
+	work = tempfile.mkdtemp(prefix='jukebox-bench-')
+	result = {
+		'version': 1,
+		'git': _git_rev(),
+		'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'cpus': os.cpu_count(),
+		'params': {k: v for k, v in vars(args).items() if k not in ('out', 'keep')},
+	}
+	try:
+		music = args.music
+		if not music:
+			music = os.path.join(work, 'music')
+			t0 = time.perf_counter()
+			result['tree'] = generate(music, args.depth, args.dirs, args.files, args.size)
+			result['tree']['generate_seconds'] = round(time.perf_counter() - t0, 3)
+		if only & {'scan', 'payload'}:
+			scan, lib = bench_scan(music, work, args.scan_workers)
+			if 'scan' in only:
+				result['scan'] = scan
+			if 'payload' in only:
+				result['payload'] = bench_payload(lib, args.repeat)
+		if 'server' in only:
+			result['server'] = [bench_server(music, work, args, int(p)) for p in args.prefetch.split(',') if p.strip()]
+	finally:
+		if args.keep:
+			print(f'[INFO] 临时目录: {work}', file=sys.stderr)
+		else:
+			shutil.rmtree(work, ignore_errors=True)
+	text = json.dumps(result, ensure_ascii=False, indent=2)
+	if args.out:
+		with open(args.out, 'w', encoding='utf-8') as w:
+			w.write(text + '\n')
+	else:
+		print(text)
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,82 @@
+"""预先序列化、按需压缩的 JSON 响应缓存.
+
+同一份内容 (由调用方给出的 key 完整描述, 通常含曲库代数) 只序列化一次; 每种压缩编码在首次被请求时
+生成一次, 之后所有客户端直接复用同一份字节. ETag 取内容哈希, 跨进程/重启保持一致,
+客户端带 If-None-Match 时可直接返回 304. brotli 为可选依赖, 未安装时只提供 gzip.
+"""
+import gzip, json, hashlib, threading
+from collections import OrderedDict
+
+try:
+	import brotli
+except ImportError:          # 可选依赖
+	brotli = None
+
+MIN_COMPRESS = 1024          # 小于该字节数的负载不压缩 (压缩头开销大于收益)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5           # 11 压缩率最高, 但 1 MB 的负载需要数秒
+
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+	if encoding == 'br':
+		return brotli.compress(body, quality=BROTLI_QUALITY)
+	return gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+
+class Blob:
+	__slots__ = ('body', 'etag', '_encoded', '_lock')
+
+	def __init__(self, body: bytes):
+		self.body = body
+		self.etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+		self._encoded = {}
+		self._lock = threading.Lock()
+
+	def encoded(self, encoding):
+		"""(字节, 实际使用的编码); encoding 为 None 或负载太小时返回原文与 None."""
+		if encoding is None or len(self.body) < MIN_COMPRESS:
+			return self.body, None
+		data = self._encoded.get(encoding)
+		if data is None:
+			with self._lock:
+				data = self._encoded.get(encoding)
+				if data is None:
+					data = self._encoded[encoding] = _compress(self.body, encoding)
+		return data, encoding
+
+	@property
+	def size(self) -> int:
+		return len(self.body) + sum(len(v) for v in self._encoded.values())
+
+
+class BlobCache:
+	"""key -> Blob 的 LRU; 旧代数的条目不会再被命中, 随新条目加入自然淘汰."""
+
+	def __init__(self, max_entries: int = 64, max_bytes: int = 64 << 20):
+		self.max_entries = max_entries
+		self.max_bytes = max_bytes
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+		self.stats = {'hits': 0, 'misses': 0}
+
+	def get(self, key, build) -> tuple:
+		"""返回 (Blob, 是否命中). 未命中时调用 build() 得到可 JSON 序列化的对象, 序列化后缓存."""
+		with self._lock:
+			blob = self._entries.get(key)
+			if blob is not None:
+				self._entries.move_to_end(key)
+				self.stats['hits'] += 1
+				return blob, True
+		# 构建与序列化在锁外进行, 不阻塞其他 key 的命中
+		blob = Blob(json.dumps(build(), ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+		with self._lock:
+			self.stats['misses'] += 1
+			self._entries[key] = blob
+			self._entries.move_to_end(key)
+			total = sum(b.size for b in self._entries.values())
+			while len(self._entries) > 1 and (len(self._entries) > self.max_entries or total > self.max_bytes):
+				_, old = self._entries.popitem(last=False)
+				total -= old.size
+		return blob, False
@@ -0,0 +1,160 @@
+"""多进程部署: 跨进程共享的播放状态与 mpv 所有者选举.
+
+多 worker 的 WSGI 服务器下每个进程各有一份模块全局状态. 只有一个进程 (leader) 驱动 mpv、
+自动切歌、扫描曲库; 其余进程 (follower) 直接提供读取, 写操作转发给 leader.
+共享数据放在曲库索引所在的 SQLite 文件中, 使用 WAL 模式 (读写互不阻塞):
+  lease  leader 租约 (owner, pid, 控制端口, 到期时间). leader 每 lease/3 秒续约一次,
+         进程退出或卡住超过 lease 秒后由其他 worker 接管 (mpv 是独立进程, 接管后重新连接即可)
+  kv     leader 发布的 JSON 值 (分区状态、曲库代数等), follower 读取时只做一次主键查询
+"""
+import os, json, time, uuid, socket, sqlite3, threading
+
+_SCHEMA = (
+	'CREATE TABLE IF NOT EXISTS lease (name TEXT PRIMARY KEY, owner TEXT, pid INTEGER, port INTEGER, expires REAL)',
+	'CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, updated REAL)',
+)
+
+FORWARD_HEADER = 'X-Jukebox-Forwarded'      # 转发给 leader 的请求带此头, 防止循环转发
+
+
+class SharedState:
+	def __init__(self, db_path: str, lease: float = 5.0):
+		self.db_path = db_path
+		self.lease = lease
+		self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+		self._local = threading.local()     # 每个线程一个连接, 并发读取不共用同一把锁
+		self._pending = {}
+		self._pending_lock = threading.Lock()
+		self._wake = threading.Event()
+		self._writer = None
+
+	def _conn(self):
+		db = getattr(self._local, 'db', None)
+		if db is None:
+			db = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+			db.execute('PRAGMA journal_mode=WAL')
+			db.execute('PRAGMA synchronous=NORMAL')
+			for stmt in _SCHEMA:
+				db.execute(stmt)
+			self._local.db = db
+		return db
+
+	# ---------- 租约 ----------
+	def acquire(self, port: int = None) -> bool:
+		"""取得或续约 leader 租约, 返回本进程当前是否为 leader."""
+		db = self._conn()
+		now = time.time()
+		db.execute('BEGIN IMMEDIATE')
+		try:
+			row = db.execute("SELECT owner, expires FROM lease WHERE name='mpv'").fetchone()
+			ok = row is None or row[0] == self.owner or row[1] < now
+			if ok:
+				db.execute("INSERT OR REPLACE INTO lease(name, owner, pid, port, expires) VALUES('mpv',?,?,?,?)",
+					(self.owner, os.getpid(), port, now + self.lease))
+			db.execute('COMMIT')
+		except BaseException:
+			db.execute('ROLLBACK')
+			raise
+		return ok
+
+	def release(self):
+		self._conn().execute("DELETE FROM lease WHERE name='mpv' AND owner=?", (self.owner,))
+
+	def leader(self):
+		"""当前有效的 leader: {'owner','pid','port','expires'}; 没有时返回 None."""
+		row = self._conn().execute("SELECT owner, pid, port, expires FROM lease WHERE name='mpv'").fetchone()
+		if row is None or row[3] < time.time():
+			return None
+		return dict(zip(('owner', 'pid', 'port', 'expires'), row))
+
+	# ---------- 共享值 ----------
+	def get(self, key: str, default=None):
+		row = self._conn().execute('SELECT value FROM kv WHERE key=?', (key,)).fetchone()
+		return json.loads(row[0]) if row else default
+
+	def put(self, items: dict):
+		now = time.time()
+		self._conn().executemany('INSERT OR REPLACE INTO kv(key, value, updated) VALUES(?,?,?)',
+			[(k, json.dumps(v, ensure_ascii=False), now) for k, v in items.items()])
+
+	def publish(self, key: str, value):
+		"""异步写入, 同一 key 只保留最新值; 供 IPC 读线程等不能等待磁盘的调用方使用."""
+		with self._pending_lock:
+			self._pending[key] = value
+			if self._writer is None:
+				self._writer = threading.Thread(target=self._write_loop, daemon=True)
+				self._writer.start()
+		self._wake.set()
+
+	def _write_loop(self):
+		while True:
+			self._wake.wait()
+			self._wake.clear()
+			with self._pending_lock:
+				items, self._pending = self._pending, {}
+			if not items:
+				continue
+			try:
+				self.put(items)
+			except sqlite3.Error as e:
+				print('[WARN] 写入共享状态失败:', e)
+
+
+class Coordinator:
+	"""后台线程: 每 lease/3 秒竞选或续约一次, 角色变化时回调; leader 每轮续约后调用 heartbeat()."""
+
+	def __init__(self, shared: SharedState, *, port: int = None, on_lead=None, on_demote=None, heartbeat=None):
+		self.shared = shared
+		self.port = port             # 本进程控制端口 (仅 127.0.0.1), follower 把写操作转发到这里
+		self.on_lead = on_lead
+		self.on_demote = on_demote
+		self.heartbeat = heartbeat
+		self.is_leader = False
+		self._thread = None
+
+	def start(self):
+		if self._thread is not None:
+			return
+		self._step()                 # 先同步竞选一次, 之后到达的请求即可判断角色
+		self._thread = threading.Thread(target=self._run, daemon=True, name='coordinator')
+		self._thread.start()
+
+	def _run(self):
+		while True:
+			time.sleep(self.shared.lease / 3)
+			self._step()
+
+	def _step(self):
+		try:
+			lead = self.shared.acquire(self.port)
+		except sqlite3.Error as e:
+			print('[WARN] 续约失败:', e)
+			lead = False
+		if lead != self.is_leader:
+			self.is_leader = lead
+			print(f"[INFO] 进程 {os.getpid()} {'成为' if lead else '不再是'} mpv 所有者")
+			cb = self.on_lead if lead else self.on_demote
+			if cb:
+				try:
+					cb()
+				except Exception as e:
+					print('[WARN] 角色切换回调失败:', e)
+		if lead and self.heartbeat:
+			try:
+				self.heartbeat()
+			except Exception as e:
+				print('[WARN] 发布共享状态失败:', e)
+
+
+def zone_status(record: dict, zid: str) -> dict:
+	"""由 leader 发布的分区记录还原 /status 负载; 播放进度按记录时间在本地插值."""
+	if not record:
+		return {'status': 'OK', 'zone': zid, 'playing': {}, 'mpv': {}}
+	payload = record['status']
+	mpv = payload.get('mpv') or {}
+	if isinstance(mpv.get('time'), (int, float)) and mpv.get('paused') is False:
+		pos = mpv['time'] + max(0.0, time.time() - record['ts'])
+		if isinstance(mpv.get('duration'), (int, float)) and mpv['duration'] > 0:
+			pos = min(pos, mpv['duration'])
+		payload['mpv'] = dict(mpv, time=pos)
+	return payload
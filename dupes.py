@@ -0,0 +1,223 @@
+"""按内容查找重复曲目.
+
+只有大小相同的文件才可能重复, 所以先按 size 分组, 只对候选文件计算哈希:
+  1. (可选) 部分哈希: 头尾各 1 MiB, 大多数"同大小不同内容"在这一步就被排除
+  2. 完整哈希: mmap 后按块送入 blake2b, 不经 Python 层复制
+哈希在进程池中计算, 结果按 rel 缓存在 SQLite, 以 size+mtime 判断是否失效.
+每组重复中按播放列表顺序保留第一首, 其余视为副本. 曲库变化时 update() 只重新处理增删文件所在的 size 组.
+"""
+import os, time, mmap, hashlib, sqlite3, threading, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+MIB = 1 << 20
+CHUNK = 4 * MIB
+
+_SCHEMA = (
+	'CREATE TABLE IF NOT EXISTS hashes (rel TEXT PRIMARY KEY, size INTEGER, mtime REAL, partial TEXT, full TEXT)',
+)
+
+
+def hash_file(path: str, partial: bool = False) -> str:
+	"""partial=True 时只哈希头尾各 1 MiB (小于 2 MiB 的文件等同完整哈希)."""
+	h = hashlib.blake2b(digest_size=16)
+	with open(path, 'rb') as f:
+		size = os.fstat(f.fileno()).st_size
+		if size == 0:
+			return h.hexdigest()
+		with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as mv:
+			if partial and size > 2 * MIB:
+				h.update(mv[:MIB])
+				h.update(mv[size - MIB:])
+			else:
+				for off in range(0, size, CHUNK):
+					h.update(mv[off:off + CHUNK])
+	return h.hexdigest()
+
+def _hash_batch(items):
+	"""进程池工作函数: [(rel, abs_path, partial), ...] -> [(rel, 哈希或 None), ...]"""
+	out = []
+	for rel, path, partial in items:
+		try:
+			out.append((rel, hash_file(path, partial)))
+		except (OSError, ValueError):
+			out.append((rel, None))
+	return out
+
+
+class DuplicateFinder:
+	def __init__(self, db_path: str, workers: int = None, partial: bool = True):
+		self.workers = workers or os.cpu_count() or 2
+		self.partial = partial
+		self._lock = threading.RLock()
+		self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+		for stmt in _SCHEMA:
+			self._db.execute(stmt)
+		self._db.commit()
+		self._cache = None           # rel -> [size, mtime, partial, full], 惰性载入
+		self.groups = []             # [{'size', 'hash', 'tracks': [rel, ...]}], 组内按播放列表顺序
+		self._dupe_of = {}           # 副本 rel -> 保留的 rel
+		self._sizes = {}             # rel -> size (最近一次扫描/更新), 增量更新时定位受影响的 size 组
+		self._by_size = None         # size -> {rel}; None 表示尚未完整扫描过
+		self.progress = {'state': 'idle', 'files': 0, 'candidates': 0, 'hashed': 0, 'bytes': 0, 'seconds': 0.0}
+
+	def is_duplicate(self, rel: str) -> bool:
+		"""rel 是否为某组重复中的副本 (每组保留的第一首返回 False)."""
+		return rel in self._dupe_of
+
+	def original(self, rel: str):
+		return self._dupe_of.get(rel)
+
+	def _load(self):
+		if self._cache is None:
+			self._cache = {r[0]: list(r[1:]) for r in self._db.execute('SELECT rel, size, mtime, partial, full FROM hashes')}
+		return self._cache
+
+	@staticmethod
+	def _stat(root: str, rel: str):
+		try:
+			st = os.stat(os.path.join(root, *rel.split('/')))
+			return rel, st.st_size, st.st_mtime
+		except OSError:
+			return rel, None, None
+
+	def _hash_all(self, root: str, rels, partial: bool, field: int, sizes: dict):
+		"""计算 rels 中缓存缺失的哈希 (field: 2=partial, 3=full), 写回缓存."""
+		cache = self._cache
+		todo = [(rel, os.path.join(root, *rel.split('/')), partial) for rel in rels if cache[rel][field] is None]
+		if not todo:
+			return
+		batches = [todo[i:i+16] for i in range(0, len(todo), 16)]
+		if len(batches) == 1:
+			# 增量更新通常只有几个文件: 直接在本线程计算, 不为此启动进程池 (子进程要重新导入主模块)
+			self._store_hashes([_hash_batch(batches[0])], partial, field, sizes)
+			return
+		# spawn 而非 fork: 见 metadata.MetadataStore.sync
+		with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')) as pp:
+			self._store_hashes(pp.map(_hash_batch, batches), partial, field, sizes)
+
+	def _store_hashes(self, results, partial: bool, field: int, sizes: dict):
+		cache = self._cache
+		for batch in results:
+			for rel, digest in batch:
+				cache[rel][field] = digest
+				self.progress['hashed'] += 1
+				self.progress['bytes'] += min(sizes[rel], 2 * MIB) if partial else sizes[rel]
+			with self._lock:
+				self._db.executemany(
+					'INSERT OR REPLACE INTO hashes(rel, size, mtime, partial, full) VALUES(?,?,?,?,?)',
+					[(rel,) + tuple(cache[rel]) for rel, _ in batch])
+				self._db.commit()
+
+	def scan(self, root: str, rels) -> dict:
+		"""重新计算 rels (播放列表顺序) 中的重复分组; 未变化的文件使用缓存的哈希."""
+		t0 = time.time()
+		rels = list(rels)
+		order = {r: i for i, r in enumerate(rels)}
+		self.progress = {'state': 'stat', 'files': len(rels), 'candidates': 0, 'hashed': 0, 'bytes': 0, 'seconds': 0.0}
+		cache = self._load()
+		with ThreadPoolExecutor(max_workers=16) as tp:
+			stats = list(tp.map(lambda r: self._stat(root, r), rels, chunksize=256))
+		by_size = {}
+		sizes = {}
+		for rel, size, mtime in stats:
+			if not size:
+				continue
+			sizes[rel] = size
+			row = cache.get(rel)
+			if row is None or row[0] != size or row[1] != mtime:
+				cache[rel] = [size, mtime, None, None]
+			by_size.setdefault(size, set()).add(rel)
+		self._sizes, self._by_size = sizes, by_size
+		candidates = [list(g) for g in by_size.values() if len(g) > 1]
+		self.progress.update(state='hash', candidates=sum(len(g) for g in candidates))
+		self._publish(self._group(root, candidates, order.__getitem__), order.__getitem__)
+		self._prune(set(rels))
+		self.progress.update(state='done', seconds=round(time.time() - t0, 3))
+		return self.progress
+
+	def update(self, root: str, added, removed, playlist) -> dict:
+		"""增量更新: 只重新分组 added/removed 所在的 size 组, 不 stat 整个曲库.
+		playlist 为当前播放列表 (Playlist, 决定组内顺序); 尚未完整扫描过时退回 scan()."""
+		if self._by_size is None:
+			return self.scan(root, list(playlist))
+		t0 = time.time()
+		self.progress = {'state': 'stat', 'files': len(added) + len(removed), 'candidates': 0, 'hashed': 0,
+			'bytes': 0, 'seconds': 0.0}
+		cache = self._load()
+		touched = set()
+		for rel in list(removed) + list(added):
+			size = self._sizes.pop(rel, None)
+			if size is not None:
+				self._by_size[size].discard(rel)
+				touched.add(size)
+		with ThreadPoolExecutor(max_workers=16) as tp:
+			stats = list(tp.map(lambda r: self._stat(root, r), added))
+		for rel, size, mtime in stats:
+			if not size:
+				continue
+			row = cache.get(rel)
+			if row is None or row[0] != size or row[1] != mtime:
+				cache[rel] = [size, mtime, None, None]
+			self._sizes[rel] = size
+			self._by_size.setdefault(size, set()).add(rel)
+			touched.add(size)
+		key = lambda r: playlist.index(r) if r in playlist else len(playlist)
+		candidates = []
+		for size in touched:
+			g = self._by_size.get(size)
+			if not g:
+				self._by_size.pop(size, None)
+			elif len(g) > 1:
+				candidates.append(list(g))
+		self.progress.update(state='hash', candidates=sum(len(g) for g in candidates))
+		kept = [g for g in self.groups if g['size'] not in touched]
+		self._publish(kept + self._group(root, candidates, key), key)
+		gone = set(removed) - set(added)
+		self._prune_rels([r for r in gone if r in cache])
+		self.progress.update(state='done', seconds=round(time.time() - t0, 3))
+		return self.progress
+
+	def _group(self, root: str, candidates, key) -> list:
+		"""candidates 为若干组大小相同的 rel; 计算 (缺失的) 哈希, 返回其中内容相同的分组, 组内按 key 排序."""
+		cache, sizes = self._cache, self._sizes
+		if self.partial:
+			self._hash_all(root, [r for g in candidates for r in g if sizes[r] > 2 * MIB], True, 2, sizes)
+			narrowed = []
+			for g in candidates:
+				sub = {}
+				for rel in g:
+					k = cache[rel][2] if sizes[rel] > 2 * MIB else ''
+					if k is not None:
+						sub.setdefault(k, []).append(rel)
+				narrowed.extend(s for s in sub.values() if len(s) > 1)
+			candidates = narrowed
+		self._hash_all(root, [r for g in candidates for r in g], False, 3, sizes)
+		groups = []
+		for g in candidates:
+			sub = {}
+			for rel in g:
+				if cache[rel][3] is not None:
+					sub.setdefault(cache[rel][3], []).append(rel)
+			for digest, tracks in sub.items():
+				if len(tracks) < 2:
+					continue
+				tracks.sort(key=key)
+				groups.append({'size': sizes[tracks[0]], 'hash': digest, 'tracks': tracks})
+		return groups
+
+	def _publish(self, groups: list, key):
+		groups.sort(key=lambda g: key(g['tracks'][0]))
+		dupe_of = {rel: g['tracks'][0] for g in groups for rel in g['tracks'][1:]}
+		self.groups, self._dupe_of = groups, dupe_of
+
+	def _prune(self, keep: set):
+		self._prune_rels([r for r in self._cache if r not in keep])
+
+	def _prune_rels(self, gone):
+		if not gone:
+			return
+		with self._lock:
+			for rel in gone:
+				del self._cache[rel]
+			self._db.executemany('DELETE FROM hashes WHERE rel=?', [(r,) for r in gone])
+			self._db.commit()
@@ -0,0 +1,78 @@
+"""Server-Sent Events 广播.
+
+每条消息只序列化一次, 然后把同一份字节放进各订阅者的队列;
+慢客户端的队列满时丢弃其最旧的消息 (状态消息只关心最新值).
+"""
+import json, queue, threading, time
+
+
+def format_sse(event: str, data) -> bytes:
+	return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'.encode('utf-8')
+
+
+class EventHub:
+	def __init__(self, max_queue: int = 32):
+		self.max_queue = max_queue
+		self._subs = set()
+		self._lock = threading.Lock()
+		self._ticker = None
+		self.published = 0
+
+	@property
+	def subscribers(self) -> int:
+		return len(self._subs)
+
+	def subscribe(self) -> queue.Queue:
+		q = queue.Queue(self.max_queue)
+		with self._lock:
+			self._subs.add(q)
+		return q
+
+	def unsubscribe(self, q):
+		with self._lock:
+			self._subs.discard(q)
+
+	def publish(self, event: str, data):
+		if not self._subs:
+			return
+		msg = format_sse(event, data)
+		with self._lock:
+			subs = list(self._subs)
+		self.published += 1
+		for q in subs:
+			try:
+				q.put_nowait(msg)
+			except queue.Full:
+				try:
+					q.get_nowait()
+					q.put_nowait(msg)
+				except (queue.Empty, queue.Full):
+					pass
+
+	def stream(self, q, first: bytes = None, keepalive: float = 15.0):
+		"""供 Response 使用的生成器; 连接关闭时自动退订."""
+		try:
+			if first:
+				yield first
+			while True:
+				try:
+					yield q.get(timeout=keepalive)
+				except queue.Empty:
+					yield b': ping\n\n'      # 注释行, 防止代理/浏览器判定连接空闲
+		finally:
+			self.unsubscribe(q)
+
+	def start_ticker(self, interval: float, producer):
+		"""单一后台线程: 有订阅者时每 interval 秒调用一次 producer()."""
+		if self._ticker and self._ticker.is_alive():
+			return
+		def loop():
+			while True:
+				time.sleep(interval)
+				if self._subs:
+					try:
+						producer()
+					except Exception as e:
+						print('[WARN] 事件推送失败:', e)
+		self._ticker = threading.Thread(target=loop, daemon=True)
+		self._ticker.start()
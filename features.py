@@ -0,0 +1,462 @@
+"""音频特征与相似曲目检索, 供"自动 DJ"切歌模式使用.
+
+每首曲目提取一个短向量 (FEATURES): 响度 (RMS, dBFS)、频谱质心 (Hz)、速度估计 (BPM) 与时长 (秒).
+只解码中间 ANALYZE_SECONDS 秒 (时长由文件头解析或 ffprobe 得到) 为 FEATURE_RATE 单声道, 分帧加窗, 每 FFT_BLOCK 帧做一次 numpy rfft;
+质心为整段频谱的幅度加权平均频率, 速度取频谱通量 (onset 包络) 自相关的峰值.
+提取在低优先级的进程池中进行, 结果按 rel 缓存在 SQLite (与音乐库索引同一文件), 以 size+mtime 判断是否失效.
+
+检索时所有向量放在一个 float32 矩阵中 (行号 <-> rel), 标准化后建立网格索引: 每个点落入边长为 cell 的
+超立方格, 格子键排序后二分查找; 查询从所在格子逐层向外扩展, 最近点的距离不超过已搜索的范围即停止,
+通常只计算几十个点的距离. numpy 为可选依赖, 未安装时不提取特征, 自动 DJ 不可用.
+"""
+import os, json, time, wave, random, shutil, sqlite3, threading, subprocess, multiprocessing
+from itertools import product
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from peaks import decode_pcm, lower_priority, UnsupportedFormat
+from metadata import parse_file
+
+try:
+	import numpy as np
+except ImportError:          # 可选依赖
+	np = None
+
+FEATURES = ('loudness', 'centroid', 'tempo', 'duration')
+FEATURE_RATE = 11025         # 解码采样率; 质心只统计到 5.5 kHz, 用于比较曲目足够
+ANALYZE_SECONDS = 60.0       # 只分析中间这一段
+FRAME = 1024
+HOP = 256                    # 帧移; onset 包络约 43 帧/秒
+FFT_BLOCK = 512              # 每次 rfft 的帧数, 限制临时数组大小
+TEMPO_RANGE = (60.0, 200.0)
+WEIGHTS = (1.0, 1.0, 0.75, 0.5)  # 标准化后各维的权重: 时长只作参考
+GRID_TARGET = 8              # 数据中心处每个格子期望的点数, 决定格子边长
+GRID_SHELLS = 4              # 逐层搜索的最大层数, 仍无法确定时退回全量计算
+REBUILD_EVERY = 2000         # 冷启动提取期间, 每新增这么多首重建一次索引
+
+_GRID_BITS = 10
+_GRID_OFFSET = 1 << (_GRID_BITS - 1)
+_SCHEMA = (
+	'CREATE TABLE IF NOT EXISTS features (rel TEXT PRIMARY KEY, size INTEGER, mtime REAL, vec BLOB)',
+)
+
+
+# =========== 提取 (进程池中执行) ===========
+def _read_wav(path: str):
+	"""无解码器时直接读 WAV 的分析窗口: (单声道 float32, 采样率, 时长)."""
+	try:
+		with wave.open(path, 'rb') as w:
+			ch, width, rate, frames = w.getnchannels(), w.getsampwidth(), w.getframerate(), w.getnframes()
+			want = int(ANALYZE_SECONDS * rate)
+			w.setpos(max(0, (frames - want) // 2))
+			raw = w.readframes(min(frames, want))
+	except (wave.Error, EOFError) as e:
+		raise UnsupportedFormat(f'不支持的 WAV: {e}')
+	if width == 1:
+		x = np.frombuffer(raw, np.uint8).astype(np.float32) - 128
+	elif width == 3:
+		b = np.frombuffer(raw[:len(raw) // 3 * 3], np.uint8).reshape(-1, 3).astype(np.int32)
+		x = ((b[:, 0] << 8) | (b[:, 1] << 16) | (b[:, 2] << 24)).astype(np.float32)     # 左对齐到 32 位
+	elif width in (2, 4):
+		x = np.frombuffer(raw[:len(raw) // width * width], '<i2' if width == 2 else '<i4').astype(np.float32)
+	else:
+		raise UnsupportedFormat(f'不支持的采样宽度: {width}')
+	full = 2.0 ** (8 * width - 1 if width < 3 else 31)
+	x = x[:len(x) // ch * ch].reshape(-1, ch).mean(axis=1) / full
+	# 按整数倍抽取到接近 FEATURE_RATE (块平均, 兼作低通)
+	f = max(1, rate // FEATURE_RATE)
+	if f > 1:
+		x = x[:len(x) // f * f].reshape(-1, f).mean(axis=1)
+	return x, rate / f, frames / rate if rate else 0.0
+
+def _probe_duration(path: str, decoder: str):
+	"""时长(秒): 先用标签解析 (MP3/FLAC/WAV 只读文件头), 否则用解码器旁的 ffprobe; 都不行时返回 None."""
+	duration = parse_file(path).get('duration')
+	if duration:
+		return duration
+	name = os.path.basename(decoder).lower().replace('ffmpeg', 'ffprobe')
+	probe = os.path.join(os.path.dirname(decoder), name)
+	if name == os.path.basename(decoder).lower() or not os.path.isfile(probe):
+		return None
+	try:
+		res = subprocess.run([probe, '-v', 'error', '-show_entries', 'format=duration', '-of', 'json', path],
+			stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=30)
+		return float(json.loads(res.stdout)['format']['duration'])
+	except (OSError, subprocess.TimeoutExpired, ValueError, KeyError, TypeError):
+		return None
+
+def _read_decoded(path: str, decoder: str):
+	duration = _probe_duration(path, decoder)
+	if duration:
+		start = max(0.0, (duration - ANALYZE_SECONDS) / 2)
+		pcm = decode_pcm(path, decoder, FEATURE_RATE, start, ANALYZE_SECONDS)
+		x = np.frombuffer(pcm, '<i2', count=len(pcm) // 2)
+		return x.astype(np.float32) / 32768, float(FEATURE_RATE), duration
+	# 时长未知: 只能完整解码, 再取中间一段
+	pcm = decode_pcm(path, decoder, FEATURE_RATE)
+	x = np.frombuffer(pcm, '<i2', count=len(pcm) // 2)
+	want = int(ANALYZE_SECONDS * FEATURE_RATE)
+	start = max(0, (len(x) - want) // 2)
+	return x[start: start + want].astype(np.float32) / 32768, float(FEATURE_RATE), len(x) / FEATURE_RATE
+
+def _tempo(flux, fps: float) -> float:
+	"""onset 包络的自相关峰值对应的 BPM; 以 120 BPM 为中心加权, 减少倍频/半频误判."""
+	env = flux - flux.mean()
+	n = len(env)
+	spec = np.fft.rfft(env, 2 * n)
+	ac = np.fft.irfft(spec.real ** 2 + spec.imag ** 2)[:n]
+	lo = int(np.ceil(60 * fps / TEMPO_RANGE[1]))
+	hi = min(n - 2, int(60 * fps / TEMPO_RANGE[0]))
+	if ac[0] <= 0 or hi <= lo:
+		return 0.0
+	lags = np.arange(lo, hi + 1)
+	score = ac[lo:hi + 1] * np.exp(-0.5 * np.log2(60 * fps / lags / 120.0) ** 2)
+	i = int(score.argmax()) + lo
+	if score[i - lo] <= 0:
+		return 0.0
+	# 抛物线插值得到小数滞后
+	a, b, c = ac[i - 1], ac[i], ac[i + 1]
+	den = a - 2 * b + c
+	lag = i + (0.5 * (a - c) / den if den < 0 else 0.0)
+	return float(60 * fps / lag)
+
+def analyze(x, rate: float):
+	"""单声道样本 (满幅 ±1) -> (响度 dBFS, 质心 Hz, 速度 BPM)."""
+	if not len(x):
+		return -120.0, 0.0, 0.0
+	rms = float(np.sqrt(np.mean(np.square(x, dtype=np.float64))))
+	loudness = float(20 * np.log10(max(rms, 1e-6)))
+	if len(x) < FRAME * 2:
+		return loudness, 0.0, 0.0
+	frames = np.lib.stride_tricks.sliding_window_view(x, FRAME)[::HOP]
+	win = np.hanning(FRAME).astype(np.float32)
+	freqs = np.fft.rfftfreq(FRAME, 1.0 / rate)
+	weighted = total = 0.0
+	flux, last = [], None
+	for b in range(0, len(frames), FFT_BLOCK):
+		mag = np.abs(np.fft.rfft(frames[b:b + FFT_BLOCK] * win, axis=1))
+		weighted += float((mag @ freqs).sum())
+		total += float(mag.sum())
+		logm = np.log1p(100 * mag)
+		d = np.diff(logm, axis=0, prepend=logm[:1] if last is None else last)
+		flux.append(np.maximum(d, 0).sum(axis=1))
+		last = logm[-1:]
+	centroid = weighted / total if total > 0 else 0.0
+	return loudness, centroid, _tempo(np.concatenate(flux), rate / HOP)
+
+def extract_features(path: str, decoder: str = None):
+	"""返回 FEATURES 对应的元组; 有解码器时所有格式都经它解码 (各格式的频谱一致)."""
+	if decoder:
+		x, rate, duration = _read_decoded(path, decoder)
+	elif os.path.splitext(path)[1].lower() == '.wav':
+		x, rate, duration = _read_wav(path)
+	else:
+		raise UnsupportedFormat('该格式需要本地解码器')
+	return analyze(x, rate) + (duration,)
+
+def _extract_batch(items, decoder):
+	"""进程池工作函数: [(rel, abs_path), ...] -> [(rel, 特征元组或 None), ...]"""
+	out = []
+	for rel, path in items:
+		try:
+			out.append((rel, extract_features(path, decoder)))
+		except (OSError, ValueError):
+			out.append((rel, None))
+	return out
+
+
+# =========== 近邻索引 ===========
+_SHELLS = {}
+
+def _shells(dim: int):
+	"""网格逐层搜索的键偏移: 第 r 项为切比雪夫距离恰为 r 的所有格子."""
+	if dim not in _SHELLS:
+		grid = np.array(list(product(range(-GRID_SHELLS, GRID_SHELLS + 1), repeat=dim)), np.int64)
+		keys = grid @ (np.int64(1) << (_GRID_BITS * np.arange(dim, dtype=np.int64)))
+		cheb = np.abs(grid).max(axis=1)
+		_SHELLS[dim] = [keys[cheb == r] for r in range(GRID_SHELLS + 1)]
+	return _SHELLS[dim]
+
+
+class FeatureIndex:
+	"""rels 与特征矩阵的只读快照: 标准化后按网格分桶, nearest() 查找未排除的最近曲目."""
+
+	def __init__(self, rels: list, vecs):
+		self.rels = rels
+		self.rows = {r: i for i, r in enumerate(rels)}
+		self.vecs = vecs                     # (n, len(FEATURES)) float32, 原始特征
+		pts = vecs.astype(np.float64)
+		tempo = pts[:, 2]
+		known = tempo > 0
+		# 速度/质心/时长按对数比较 (120 与 126 BPM 的差别等同于 60 与 63); 测不出速度的取中位数
+		tempo[~known] = np.median(tempo[known]) if known.any() else 120.0
+		pts[:, 1:] = np.log(np.maximum(pts[:, 1:], 1e-3))
+		std = pts.std(axis=0)
+		z = np.clip((pts - pts.mean(axis=0)) / np.where(std > 0, std, 1.0), -20, 20) * WEIGHTS
+		self.points = z.astype(np.float32)
+		n, dim = z.shape
+		self.cell = max(0.05, (GRID_TARGET * (2 * np.pi) ** (dim / 2) / max(n, 1)) ** (1.0 / dim))
+		self._shift = np.int64(1) << (_GRID_BITS * np.arange(dim, dtype=np.int64))
+		keys = self._keys_of(self.points)
+		self._order = np.argsort(keys, kind='stable')
+		self._keys, self._starts = np.unique(keys[self._order], return_index=True)
+		self._ends = np.append(self._starts[1:], n)
+
+	def __len__(self):
+		return len(self.rels)
+
+	def _keys_of(self, pts):
+		return (np.floor(pts / self.cell).astype(np.int64) + _GRID_OFFSET) @ self._shift
+
+	def _cells(self, keys):
+		"""keys 对应格子中的全部行号."""
+		pos = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+		pos = pos[self._keys[pos] == keys]
+		if not len(pos):
+			return pos
+		return np.concatenate([self._order[s:e] for s, e in zip(self._starts[pos], self._ends[pos])])
+
+	def nearest(self, row: int, exclude) -> int:
+		"""与第 row 行最近、且 exclude (bool 数组, True 为排除) 中未排除的行; 全部排除时返回 -1."""
+		q = self.points[row]
+		qkey = self._keys_of(q[None, :])[0]
+		best, best_d = -1, np.inf
+		for r, deltas in enumerate(_shells(len(q))):
+			cand = self._cells(qkey + deltas)
+			if len(cand):
+				cand = cand[~exclude[cand]]
+			if len(cand):
+				dist = np.square(self.points[cand] - q).sum(axis=1)
+				i = int(dist.argmin())
+				if dist[i] < best_d:
+					best, best_d = int(cand[i]), float(dist[i])
+			# 未搜索的格子与 q 的距离至少为 r 个格子边长
+			if best >= 0 and best_d <= (r * self.cell) ** 2:
+				return best
+		# 附近的曲目都已排除: 对剩余的全部计算
+		free = np.flatnonzero(~exclude)
+		if not len(free):
+			return -1
+		return int(free[np.square(self.points[free] - q).sum(axis=1).argmin()])
+
+
+# =========== 缓存与提取任务 ===========
+class FeatureStore:
+	"""rel -> (size, mtime, 特征字节) 的内存表, 持久化在 SQLite; index 为最近一次构建的 FeatureIndex."""
+
+	def __init__(self, db_path: str, workers: int = 1, decoder: str = ''):
+		self.workers = max(1, workers)
+		self.decoder = shutil.which(decoder) if decoder else None
+		self.available = np is not None
+		self._lock = threading.RLock()
+		self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+		for stmt in _SCHEMA:
+			self._db.execute(stmt)
+		self._db.commit()
+		self._loaded = None          # 惰性载入, 理由同 MetadataStore
+		self.index = None
+		self.version = 0
+		self.progress = {'state': 'idle', 'total': 0, 'stale': 0, 'extracted': 0, 'failed': 0, 'seconds': 0.0}
+
+	@property
+	def _rows(self):
+		if self._loaded is None:
+			with self._lock:
+				if self._loaded is None:
+					self._loaded = {r[0]: (r[1], r[2], r[3]) for r in self._db.execute('SELECT rel, size, mtime, vec FROM features')}
+		return self._loaded
+
+	def get(self, rel: str) -> dict:
+		row = self._rows.get(rel)
+		if not row or not row[2] or np is None:
+			return None
+		return dict(zip(FEATURES, (round(float(v), 3) for v in np.frombuffer(row[2], np.float32))))
+
+	def rebuild(self):
+		"""由内存表构建新的 FeatureIndex 并整体替换 (读取方不会看到构建到一半的索引)."""
+		if np is None:
+			return None
+		with self._lock:
+			items = [(rel, row[2]) for rel, row in self._rows.items() if row[2]]
+		if not items:
+			self.index = None
+			return None
+		vecs = np.frombuffer(b''.join(v for _, v in items), np.float32).reshape(len(items), len(FEATURES))
+		self.index = FeatureIndex([rel for rel, _ in items], vecs)
+		return self.index
+
+	def _stat(self, root: str, rel: str):
+		try:
+			st = os.stat(os.path.join(root, *rel.split('/')))
+			return rel, st.st_size, st.st_mtime
+		except OSError:
+			return rel, None, None
+
+	def sync(self, root: str, rels, removed=()):
+		"""对 rels 做 stat, 只为 size/mtime 变化或未缓存的文件提取特征; removed 从缓存删除. 完成后重建索引."""
+		if not self.available:
+			self.progress['state'] = 'unavailable'
+			return self.progress
+		t0 = time.time()
+		rels = list(rels)
+		self.progress = {'state': 'stat', 'total': len(rels), 'stale': 0, 'extracted': 0, 'failed': 0, 'seconds': 0.0}
+		with ThreadPoolExecutor(max_workers=16) as tp:
+			stats = list(tp.map(lambda r: self._stat(root, r), rels, chunksize=256))
+		stale = []
+		for rel, size, mtime in stats:
+			row = self._rows.get(rel)
+			if size is not None and (row is None or row[0] != size or row[1] != mtime):
+				stale.append((rel, size, mtime))
+		self.remove(removed)
+		if self.index is None and self._rows:
+			self.rebuild()           # 先用缓存建立索引, 提取新文件期间自动 DJ 即可使用
+		self.progress.update(state='extract', stale=len(stale))
+		info = {rel: (size, mtime) for rel, size, mtime in stale}
+		items = [(rel, os.path.join(root, *rel.split('/'))) for rel, _, _ in stale]
+		batches = [items[i:i+8] for i in range(0, len(items), 8)]
+		if batches:
+			pending = 0
+			# spawn 而非 fork: 见 metadata.MetadataStore.sync
+			with ProcessPoolExecutor(max_workers=self.workers, initializer=lower_priority,
+					mp_context=multiprocessing.get_context('spawn')) as pp:
+				for batch in pp.map(_extract_batch, batches, [self.decoder] * len(batches)):
+					self._store([(rel, info[rel], vec) for rel, vec in batch])
+					ok = sum(1 for _, vec in batch if vec is not None)
+					self.progress['extracted'] += ok
+					self.progress['failed'] += len(batch) - ok
+					pending += ok
+					if pending >= REBUILD_EVERY:
+						pending = 0
+						self.rebuild()
+		if stale or removed or self.index is None:
+			self.rebuild()
+		self.progress.update(state='done', seconds=round(time.time() - t0, 3))
+		return self.progress
+
+	def remove(self, rels):
+		rels = [r for r in rels if r in self._rows]
+		if not rels:
+			return
+		with self._lock:
+			for rel in rels:
+				self._rows.pop(rel, None)
+			self._db.executemany('DELETE FROM features WHERE rel=?', [(r,) for r in rels])
+			self._db.commit()
+			self.version += 1
+
+	def prune(self, keep):
+		"""删除不在 keep 中的缓存行 (曲库中已不存在的文件)."""
+		keep = keep if isinstance(keep, (set, frozenset)) else set(keep)
+		self.remove([r for r in self._rows if r not in keep])
+
+	def _store(self, rows):
+		# 无法解码的文件也记录 (vec 为 NULL), 文件不变就不再重试
+		rows = [(rel, size, mtime, np.asarray(vec, np.float32).tobytes() if vec is not None else None)
+			for rel, (size, mtime), vec in rows]
+		with self._lock:
+			for rel, size, mtime, vec in rows:
+				self._rows[rel] = (size, mtime, vec)
+			self._db.executemany('INSERT OR REPLACE INTO features(rel, size, mtime, vec) VALUES(?,?,?,?)', rows)
+			self._db.commit()
+			self.version += 1
+
+
+# =========== 自动 DJ ===========
+class AutoDJ:
+	"""切歌引擎: 从当前曲目出发, 取本轮尚未播放的最相似曲目; 一轮播完 (或附近都已播放) 才重复.
+
+	与随机引擎一样预选后续曲目 (peek 与随后的切歌结果一致, 供无缝衔接预先排入 mpv), 并保留播放历史供"上一首".
+	"""
+
+	def __init__(self, store: FeatureStore, history: int = 500, seed=None):
+		self.store = store
+		self.history = history
+		self.skip = None             # 可选 f(rel) -> bool: 选到时跳过 (本轮不再出现), 如重复曲目
+		self._rng = random.Random(seed)
+		self._played = set()         # 本轮已播放或被跳过的 rel
+		self._plan = []              # 预选但尚未播放的 rel
+		self._hist = []
+		self._mask = None            # (索引快照, 排除掩码): played 与 plan 对应的行
+
+	def ready(self) -> bool:
+		return self.store.index is not None
+
+	def reset(self, current: str = None):
+		self._played = {current} if current else set()
+		self._plan = []
+		self._hist = [current] if current else []
+		self._mask = None
+
+	def set_current(self, rel: str):
+		if self._plan and self._plan[0] == rel:
+			self._plan.pop(0)
+		elif self._plan:
+			self._plan = []          # 未按预选播放 (点播等): 从新的曲目重新选
+			self._mask = None
+		self._played.add(rel)
+		self._exclude(rel)
+		if not self._hist or self._hist[-1] != rel:
+			self._hist.append(rel)
+			if len(self._hist) > self.history * 2:
+				del self._hist[:-self.history]
+
+	def prev(self):
+		"""回到历史中的上一首; 没有时返回 None."""
+		if len(self._hist) < 2:
+			return None
+		self._hist.pop()
+		self._plan = []
+		self._mask = None
+		return self._hist[-1]
+
+	def peek(self, n: int, tracks) -> list:
+		"""接下来的 n 首 (不足时按相似度继续预选); tracks 为当前播放列表, 不在其中的曲目不会被选中."""
+		idx = self.store.index
+		if idx is None:
+			return []
+		if any(r not in tracks for r in self._plan):
+			self._plan = []
+			self._mask = None
+		while len(self._plan) < n:
+			src = self._plan[-1] if self._plan else (self._hist[-1] if self._hist else None)
+			rel = self._pick(idx, src, tracks)
+			if rel is None:
+				break
+			self._plan.append(rel)
+		return self._plan[:n]
+
+	def _exclusion(self, idx):
+		if self._mask is None or self._mask[0] is not idx:
+			mask = np.zeros(len(idx), bool)
+			for rel in self._played.union(self._plan):
+				row = idx.rows.get(rel)
+				if row is not None:
+					mask[row] = True
+			self._mask = (idx, mask)
+		return self._mask[1]
+
+	def _exclude(self, rel: str):
+		if self._mask is not None:
+			row = self._mask[0].rows.get(rel)
+			if row is not None:
+				self._mask[1][row] = True
+
+	def _pick(self, idx, src, tracks):
+		for _ in range(2):           # 本轮都已播放时, 开始新一轮再试一次
+			mask = self._exclusion(idx)
+			row = idx.rows.get(src) if src else None
+			while True:
+				if row is not None:
+					r = idx.nearest(row, mask)
+				else:
+					# 当前曲目还没有特征: 随机选一首作为起点
+					free = np.flatnonzero(~mask)
+					r = int(free[self._rng.randrange(len(free))]) if len(free) else -1
+				if r < 0:
+					break
+				mask[r] = True
+				rel = idx.rels[r]
+				if rel in tracks and not (self.skip is not None and self.skip(rel)):
+					return rel
+				self._played.add(rel)
+			self._played = set(self._hist[-1:])
+			self._mask = None
+		return None
@@ -0,0 +1,162 @@
+"""播放状态的追加式日志 (write-behind), 进程崩溃/重启后据此恢复各分区的曲目、位置、随机模式与音量.
+
+每条记录一行 JSON: {"z": 分区 id, "ts": 写入时间, 变化的字段...}. record() 只把字段合并进待写缓冲并唤醒
+后台线程, 不做任何 IO, 请求线程与分区线程都不会被磁盘阻塞; 后台线程把一批变化写成若干行后
+flush + fsync. 与上次写入相同的字段不再重复记录, 暂停时的定期采样因此不产生写入.
+
+记录数超过 compact_every 后把每个分区折叠为一条完整状态, 写入临时文件再原子替换.
+读取时逐行合并; 崩溃时写了一半的末行无法解析, 直接忽略.
+"""
+import os, json, time, threading
+from metrics import Counter
+
+JOURNAL_RECORDS = Counter('jukebox_journal_records_total', '写入播放状态日志的记录行数')
+JOURNAL_COMPACTIONS = Counter('jukebox_journal_compactions_total', '播放状态日志的压缩次数')
+
+
+class StateJournal:
+	def __init__(self, path: str, interval: float = 2.0, compact_every: int = 1000, fsync: bool = True):
+		self.path = path
+		self.interval = interval             # 定期采样 (播放位置) 的间隔(秒)
+		self.compact_every = compact_every
+		self.fsync = fsync
+		self.sampler = None                  # 可选 f() -> {zone: 字段}: 每 interval 秒调用一次并记录
+		self.state = {}                      # zone -> 已写入的完整状态 (load 之后只在写线程中修改)
+		self._pending = {}
+		self._lock = threading.Lock()
+		self._wake = threading.Event()
+		self._file = None
+		self._records = 0                    # 上次压缩后写入的行数
+		self._thread = None
+		self._stop = False
+		self.stats = {'writes': 0, 'records': 0, 'compactions': 0, 'errors': 0}
+
+	# ---------- 读取 ----------
+	def load(self) -> dict:
+		"""读取日志并返回 zone -> 状态 (副本); 同时压缩一次, 使后续追加从完整状态开始."""
+		state, lines = {}, 0
+		try:
+			with open(self.path, 'r', encoding='utf-8') as f:
+				for line in f:
+					try:
+						rec = json.loads(line)
+					except ValueError:
+						continue         # 崩溃时未写完的行
+					if isinstance(rec, dict) and rec.get('z'):
+						state.setdefault(rec.pop('z'), {}).update(rec)
+						lines += 1
+		except FileNotFoundError:
+			pass
+		except OSError as e:
+			print(f'[WARN] 读取播放状态日志失败: {e}')
+		self.state = state
+		if lines > len(state):
+			self._compact()
+		return {z: dict(s) for z, s in state.items()}
+
+	# ---------- 写入 ----------
+	def start(self):
+		if self._thread is not None and self._thread.is_alive():
+			return
+		self._stop = False
+		self._thread = threading.Thread(target=self._run, daemon=True, name='state-journal')
+		self._thread.start()
+
+	def stop(self):
+		"""停止写线程, 写出尚未落盘的变化."""
+		self._stop = True
+		self._wake.set()
+		if self._thread is not None:
+			self._thread.join(timeout=5)
+		self._close()
+
+	def record(self, zone: str, **fields):
+		"""合并字段到待写缓冲 (非阻塞); 同一字段在写入前多次变化只写最后的值."""
+		with self._lock:
+			self._pending.setdefault(zone, {}).update(fields)
+		self._wake.set()
+		if self._thread is None:
+			self.start()
+
+	def _run(self):
+		next_sample = time.monotonic() + self.interval
+		while True:
+			self._wake.wait(max(0.0, next_sample - time.monotonic()))
+			self._wake.clear()
+			stop = self._stop            # 先读标志再写出: stop() 之前到达的记录都会包含在这次写出中
+			if self.sampler is not None and time.monotonic() >= next_sample:
+				next_sample = time.monotonic() + self.interval
+				try:
+					for zone, fields in (self.sampler() or {}).items():
+						self.record(zone, **fields)
+				except Exception as e:
+					print(f'[WARN] 播放状态采样失败: {e}')
+			try:
+				self._flush()
+			except OSError as e:
+				self.stats['errors'] += 1
+				print(f'[WARN] 写入播放状态日志失败: {e}')
+				self._close()
+			if stop:
+				return
+
+	def _flush(self):
+		with self._lock:
+			pending, self._pending = self._pending, {}
+		# 以下只在写线程中执行, 不持锁, record() 不会等待磁盘
+		lines = []
+		now = round(time.time(), 3)
+		for zone, fields in pending.items():
+			cur = self.state.setdefault(zone, {})
+			changed = {k: v for k, v in fields.items() if k not in cur or cur[k] != v}
+			if not changed:
+				continue
+			cur.update(changed, ts=now)
+			lines.append(json.dumps(dict(changed, z=zone, ts=now), ensure_ascii=False, separators=(',', ':')))
+		if not lines:
+			return
+		if self._file is None:
+			self._file = open(self.path, 'a', encoding='utf-8')
+		self._file.write('\n'.join(lines) + '\n')
+		self._file.flush()
+		if self.fsync:
+			os.fsync(self._file.fileno())
+		self._records += len(lines)
+		self.stats['writes'] += 1
+		self.stats['records'] += len(lines)
+		JOURNAL_RECORDS.inc(len(lines))
+		if self._records >= self.compact_every:
+			self._compact()
+
+	def _compact(self) -> bool:
+		"""每个分区一条完整状态, 写入临时文件后原子替换. 失败 (磁盘满/只读/并发) 时保留原日志, 返回 False."""
+		self._close()
+		self._records = 0                    # 失败时也重新计数, 不在之后每次写入时都重试
+		tmp = f'{self.path}.{os.getpid()}.tmp'   # 每个进程各自的临时文件: 多个进程同时启动时可能同时压缩
+		try:
+			with open(tmp, 'w', encoding='utf-8') as f:
+				for zone, st in self.state.items():
+					f.write(json.dumps(dict(st, z=zone), ensure_ascii=False, separators=(',', ':')) + '\n')
+				f.flush()
+				if self.fsync:
+					os.fsync(f.fileno())
+			os.replace(tmp, self.path)
+		except OSError as e:
+			self.stats['errors'] += 1
+			print(f'[WARN] 压缩播放状态日志失败: {e}')
+			try:
+				os.remove(tmp)
+			except OSError:
+				pass
+			return False
+		self.stats['compactions'] += 1
+		JOURNAL_COMPACTIONS.inc()
+		return True
+
+	def _close(self):
+		if self._file is not None:
+			try:
+				self._file.close()
+			except OSError:
+				pass
+			self._file = None
@@ -0,0 +1,350 @@
+"""音乐库持久化索引 (SQLite).
+
+保存每个目录的 mtime 及其直接包含的文件/子目录; 重新扫描时仅对 mtime 变化的目录
+重新 listdir, 其余目录只需一次 stat. 播放列表与文件树均由同一份索引派生.
+"""
+import os, time, bisect, sqlite3, threading
+from playlist import Playlist
+from scanner import ParallelScanner
+from metrics import Counter, Histogram
+
+FLUSH_INTERVAL = 0.5         # 扫描中途向索引发布部分结果的间隔(秒)
+
+SCAN_SECONDS = Histogram('jukebox_library_scan_seconds', '音乐库扫描耗时 (full: 整库增量扫描, dir: 监视器触发的子树)', ['kind'])
+SCAN_ENTRIES = Counter('jukebox_library_scan_entries_total', '扫描访问的目录项数', ['kind'])
+SCAN_LISTED = Counter('jukebox_library_scan_dirs_listed_total', '因 mtime 变化而重新列出的目录数', ['kind'])
+SCAN_TIMEOUTS = Counter('jukebox_library_scan_timeouts_total', '超时被跳过的目录数')
+
+_SCHEMA = (
+	'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)',
+	'CREATE TABLE IF NOT EXISTS dirs (rel TEXT PRIMARY KEY, parent TEXT, mtime REAL)',
+	'CREATE TABLE IF NOT EXISTS files (rel TEXT PRIMARY KEY, dir TEXT, name TEXT)',
+	'CREATE INDEX IF NOT EXISTS files_dir ON files(dir)',
+)
+
+def _join(parent: str, name: str) -> str:
+	return parent + '/' + name if parent else name
+
+def _parent(rel: str) -> str:
+	return rel.rsplit('/', 1)[0] if '/' in rel else ''
+
+def _ancestors(rel: str):
+	"""rel 的所有上级目录 (由近及远, 含根 '')."""
+	out = []
+	while rel:
+		rel = _parent(rel)
+		out.append(rel)
+	return out
+
+
+class LibraryIndex:
+	"""目录 -> (mtime, 子目录名, 文件名) 的内存映射, 同步持久化到 SQLite."""
+
+	def __init__(self, db_path: str, root: str, allowed, workers: int = 8, dir_timeout: float = 15.0):
+		self.db_path = db_path
+		self.root = os.path.abspath(root)
+		self.allowed = set(e.lower() for e in allowed)
+		self.generation = 0          # 每次内容变化 +1, 供缓存失效使用
+		self.last_scan = 0.0
+		self._lock = threading.RLock()      # 保护内存索引与派生视图, 只在短时间内持有
+		self._scan_lock = threading.Lock()  # 同一时刻只有一个扫描
+		self._scanner = ParallelScanner(workers, dir_timeout)
+		self._index = None           # rel -> {'mtime': float, 'dirs': [name], 'files': [name]}; 首次使用时才载入
+		self._playlist = None        # 缓存: Playlist (排序 + rel 索引)
+		self._tree = None
+		self._db = sqlite3.connect(db_path, check_same_thread=False)
+		for stmt in _SCHEMA:
+			self._db.execute(stmt)
+
+	@property
+	def _dirs(self) -> dict:
+		# 惰性载入: 进程池 (spawn) 的子进程会重新导入主模块, 不应各自载入整个目录索引
+		if self._index is None:
+			with self._lock:
+				if self._index is None:
+					self._load()
+		return self._index
+
+	# ---------- 持久化 ----------
+	def _signature(self) -> str:
+		return self.root + '|' + ','.join(sorted(self.allowed))
+
+	def _load(self):
+		cur = self._db.cursor()
+		row = cur.execute("SELECT value FROM meta WHERE key='signature'").fetchone()
+		if not row or row[0] != self._signature():
+			# 根目录或扩展名配置变化, 旧索引作废
+			cur.execute('DELETE FROM dirs')
+			cur.execute('DELETE FROM files')
+			cur.execute("INSERT OR REPLACE INTO meta(key, value) VALUES('signature', ?)", (self._signature(),))
+			self._db.commit()
+			self._index = {}
+			return
+		dirs = {}
+		for rel, parent, mtime in cur.execute('SELECT rel, parent, mtime FROM dirs'):
+			dirs[rel] = {'mtime': mtime, 'dirs': [], 'files': []}
+		for rel in list(dirs):
+			if rel:
+				node = dirs.get(_parent(rel))
+				if node is not None:
+					node['dirs'].append(rel.rsplit('/', 1)[-1])
+		for d, name in cur.execute('SELECT dir, name FROM files'):
+			node = dirs.get(d)
+			if node is not None:
+				node['files'].append(name)
+		with self._lock:
+			self._index = dirs
+			self._playlist = None
+			self._tree = None
+			if dirs:
+				self.generation += 1
+
+	def reload(self):
+		"""从 SQLite 重新载入整个索引 (多进程部署时由另一个进程负责扫描和写入).
+
+		与扫描/监视线程共用同一个连接, 与其他写入者一样全程持锁, 读取方在载入期间等待.
+		"""
+		with self._lock:
+			self._load()
+
+	def _store_dir(self, cur, rel: str, node: dict):
+		cur.execute('INSERT OR REPLACE INTO dirs(rel, parent, mtime) VALUES(?,?,?)', (rel, _parent(rel) if rel else None, node['mtime']))
+		cur.execute('DELETE FROM files WHERE dir=?', (rel,))
+		cur.executemany('INSERT OR REPLACE INTO files(rel, dir, name) VALUES(?,?,?)', [(_join(rel, n), rel, n) for n in node['files']])
+
+	def _drop_dir(self, cur, rel: str):
+		cur.execute('DELETE FROM dirs WHERE rel=?', (rel,))
+		cur.execute('DELETE FROM files WHERE dir=?', (rel,))
+
+	# ---------- 扫描 ----------
+	def _abs(self, rel: str) -> str:
+		return os.path.join(self.root, *rel.split('/')) if rel else self.root
+
+	def _list_dir(self, full: str):
+		dirs, files = [], []
+		with os.scandir(full) as it:
+			for entry in it:
+				try:
+					if entry.is_dir():
+						dirs.append(entry.name)
+						continue
+				except OSError:
+					continue
+				if os.path.splitext(entry.name)[1].lower() in self.allowed:
+					files.append(entry.name)
+		return dirs, files
+
+	def rescan(self) -> dict:
+		"""增量扫描整个库: 只 listdir mtime 变化的目录. 返回统计信息及新增/删除的文件."""
+		return self._scan('', force=False)
+
+	def rescan_dir(self, rel: str) -> dict:
+		"""只重新列出 rel 目录 (强制, 不看 mtime), 其新增子目录会递归扫描.
+
+		供文件监视器使用; 若 rel 已不存在, 则退回到最近的仍存在的上级目录.
+		"""
+		rel = rel.strip('/')
+		while rel and not os.path.isdir(self._abs(rel)):
+			rel = _parent(rel)
+		return self._scan(rel, force=True)
+
+	def _visit(self, rel: str, force: bool):
+		"""在扫描线程池中执行: stat 目录, mtime 变化 (或 force) 时才列出内容."""
+		full = self._abs(rel)
+		try:
+			mtime = os.stat(full).st_mtime
+		except OSError:
+			return ('gone', None, None), 0
+		old = self._dirs.get(rel)
+		if old is not None and old['mtime'] == mtime and not force:
+			return ('same', mtime, None), 1
+		try:
+			listing = self._list_dir(full)
+		except OSError:
+			return ('error', mtime, None), 1
+		return ('listed', mtime, listing), 1 + len(listing[0]) + len(listing[1])
+
+	def _scan(self, start: str, force: bool) -> dict:
+		"""并行遍历 start 子树. 结果每隔 FLUSH_INTERVAL 秒分批写入索引, 扫描期间读取者即可看到已完成的部分."""
+		with self._scan_lock:
+			t0 = time.time()
+			seen = set()
+			listed, added, removed = [], [], []
+			batch = {'added': [], 'removed': [], 'dirs': [], 'ts': time.time()}
+			cur = self._db.cursor()
+
+			def flush():
+				with self._lock:
+					self._db.commit()
+					if batch['dirs']:
+						self._patch_views(batch['added'], batch['removed'], batch['dirs'])
+				batch.update(added=[], removed=[], dirs=[], ts=time.time())
+
+			def handle(rel, result):
+				kind, mtime, listing = result
+				if kind == 'gone':
+					return ()
+				seen.add(rel)
+				old = self._dirs.get(rel)
+				if kind != 'listed':
+					# 未变化, 或列目录失败 (保留旧内容)
+					return [_join(rel, d) for d in old['dirs']] if old else ()
+				dirs, files = listing
+				old_files = set(old['files']) if old else set()
+				new_files = set(files)
+				plus = [_join(rel, f) for f in new_files - old_files]
+				minus = [_join(rel, f) for f in old_files - new_files]
+				node = {'mtime': mtime, 'dirs': dirs, 'files': files}
+				with self._lock:
+					self._dirs[rel] = node
+					self._store_dir(cur, rel, node)
+				added.extend(plus)
+				removed.extend(minus)
+				listed.append(rel)
+				batch['added'].extend(plus)
+				batch['removed'].extend(minus)
+				batch['dirs'].append(rel)
+				if time.time() - batch['ts'] >= FLUSH_INTERVAL:
+					flush()
+				return [_join(rel, d) for d in dirs]
+
+			def on_timeout(rel):
+				# 超时的目录及其旧子树都视为仍存在, 留待下次扫描
+				prefix = rel + '/' if rel else ''
+				seen.add(rel)
+				seen.update(r for r in self._dirs if r.startswith(prefix))
+
+			scan = self._scanner.run([start], lambda rel: self._visit(rel, force and rel == start), handle, on_timeout)
+			prefix = start + '/' if start else ''
+			with self._lock:
+				gone = [r for r in self._dirs if r not in seen and (r == start or r.startswith(prefix))]
+				for rel in gone:
+					minus = [_join(rel, f) for f in self._dirs.pop(rel)['files']]
+					removed.extend(minus)
+					batch['removed'].extend(minus)
+					batch['dirs'].append(rel)
+					self._drop_dir(cur, rel)
+				flush()
+			changed = bool(listed or gone)
+			self.last_scan = time.time()
+			kind = 'dir' if force else 'full'
+			SCAN_SECONDS.labels(kind).observe(self.last_scan - t0)
+			SCAN_ENTRIES.labels(kind).inc(scan['entries'])
+			SCAN_LISTED.labels(kind).inc(len(listed))
+			if scan['timeouts']:
+				SCAN_TIMEOUTS.inc(scan['timeouts'])
+			if scan['entries'] > 1000:
+				print(f"[INFO] 音乐库扫描: {scan['dirs']} 个目录, {scan['entries']} 个条目, "
+					f"{scan['seconds']}s ({scan['rate']:.0f} 条/秒, {self._scanner.workers} 线程)")
+			return {
+				'dirs': len(self._dirs), 'listed': len(listed), 'changed': changed,
+				'added': added, 'removed': removed, 'dirs_listed': listed, 'dirs_gone': gone,
+				'seconds': round(self.last_scan - t0, 3), 'entries': scan['entries'],
+				'rate': scan['rate'], 'timeouts': scan['timeouts'],
+			}
+
+	def refresh(self, max_age: float = 0.0) -> bool:
+		"""距上次扫描超过 max_age 秒(或从未扫描)时执行增量扫描."""
+		if self.last_scan and time.time() - self.last_scan < max_age:
+			return False
+		self.rescan()
+		return True
+
+	def _patch_views(self, added, removed, dirty_dirs):
+		"""修补缓存的播放列表与文件树, 避免整体重建.
+
+		播放列表被各分区线程无锁读取, 不能就地修改: 复制出新对象后整体替换引用, 新对象由
+		变化回调投递到各分区的命令队列."""
+		self.generation += 1
+		if self._playlist is not None:
+			if len(added) + len(removed) > len(self._playlist) // 4:
+				self._playlist = None
+			else:
+				self._playlist = self._playlist.patched(added, removed)
+		if self._tree is not None:
+			dirty = set(dirty_dirs)
+			for rel in sorted(dirty):
+				if rel and any(a in dirty for a in _ancestors(rel)):
+					continue      # 上级目录整体重建即可
+				if not self._splice_tree(rel):
+					self._tree = None
+					break
+
+	def _splice_tree(self, rel: str) -> bool:
+		"""用索引重建 rel 子树并替换缓存树中的对应节点; 找不到上级节点时返回 False."""
+		if rel == '':
+			self._tree = self._tree_node('')
+			return True
+		parent = self._tree
+		for a in reversed(_ancestors(rel)):
+			if a == '':
+				continue
+			parent = next((d for d in parent['dirs'] if d['rel'] == a), None)
+			if parent is None:
+				return False
+		dirs = [d for d in parent['dirs'] if d['rel'] != rel]
+		if rel in self._dirs:
+			node = self._tree_node(rel)
+			dirs.insert(bisect.bisect_right(dirs, node['name'].lower(), key=lambda d: d['name'].lower()), node)
+		parent['dirs'] = dirs      # 整体替换, 并发读取者看到的要么是旧列表要么是新列表
+		return True
+
+	@property
+	def progress(self) -> dict:
+		"""当前 (或最近一次) 扫描的进度: scanning/dirs/entries/timeouts/seconds/rate."""
+		return self._scanner.stats
+
+	# ---------- 派生视图 ----------
+	def dirs(self) -> list:
+		with self._lock:
+			return list(self._dirs)
+
+	def playlist(self) -> Playlist:
+		with self._lock:
+			if self._playlist is None:
+				self._playlist = Playlist(_join(rel, f) for rel, node in self._dirs.items() for f in node['files'])
+			return self._playlist
+
+	def tree(self) -> dict:
+		"""与旧 build_tree() 相同结构: {'name','rel','dirs':[...],'files':[{'name','rel'}]}"""
+		with self._lock:
+			if self._tree is None:
+				self._tree = self._tree_node('')
+			return self._tree
+
+	def tree_level(self, rel: str = '', depth: int = 1):
+		"""只展开 rel 下 depth 层; 边界处的目录只带 dir_count/file_count, 不含子节点.
+
+		rel 不在索引中时返回 None.
+		"""
+		with self._lock:
+			if rel not in self._dirs:
+				return None
+			return self._level_node(rel, depth)
+
+	def _level_node(self, rel: str, depth: int) -> dict:
+		entry = self._dirs[rel]
+		subdirs = sorted((d for d in entry['dirs'] if _join(rel, d) in self._dirs), key=str.lower)
+		node = {
+			'name': rel.rsplit('/', 1)[-1] if rel else (os.path.basename(self.root) or '根目录'),
+			'rel': rel,
+			'dir_count': len(subdirs),
+			'file_count': len(entry['files']),
+		}
+		if depth > 0:
+			node['dirs'] = [self._level_node(_join(rel, d), depth - 1) for d in subdirs]
+			node['files'] = [{'name': f, 'rel': _join(rel, f)} for f in sorted(entry['files'], key=str.lower)]
+		return node
+
+	def _tree_node(self, rel: str) -> dict:
+		name = rel.rsplit('/', 1)[-1] if rel else (os.path.basename(self.root) or '根目录')
+		node = {'name': name, 'rel': rel, 'dirs': [], 'files': []}
+		entry = self._dirs.get(rel)
+		if entry is None:
+			return node
+		for d in sorted(entry['dirs'], key=str.lower):
+			if _join(rel, d) in self._dirs:
+				node['dirs'].append(self._tree_node(_join(rel, d)))
+		for f in sorted(entry['files'], key=str.lower):
+			node['files'].append({'name': f, 'rel': _join(rel, f)})
+		return node
@@ -0,0 +1,376 @@
+"""曲目标签/时长提取与缓存.
+
+纯 Python 解析文件头, 不依赖第三方库:
+  - MP3: ID3v2.2/2.3/2.4 文本帧 (逐帧 seek 跳过封面等大帧), ID3v1 兜底;
+         时长取 Xing/Info/VBRI 帧数, 否则按首帧码率估算 (CBR)
+  - FLAC: STREAMINFO (采样率/总采样数) + VORBIS_COMMENT
+  - WAV: fmt / data 块计算时长, LIST/INFO 或 id3 块取标签
+结果按 rel 缓存在 SQLite (与音乐库索引同一文件), 以 size+mtime 判断是否需要重新解析;
+冷启动时解析分发到进程池, 热启动只做 stat (线程池并发) 不解析任何文件.
+"""
+import os, io, time, struct, sqlite3, threading, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+FIELDS = ('title', 'artist', 'album', 'track', 'duration')
+
+_SCHEMA = (
+	'CREATE TABLE IF NOT EXISTS tags (rel TEXT PRIMARY KEY, size INTEGER, mtime REAL, '
+	'title TEXT, artist TEXT, album TEXT, track INTEGER, duration REAL)',
+)
+
+
+# =========== 通用 ===========
+def _decode_legacy(b: bytes) -> str:
+	"""无编码声明的文本: 中文曲库常见 GBK 冒充 latin-1."""
+	for enc in ('utf-8', 'gbk'):
+		try:
+			return b.decode(enc)
+		except UnicodeDecodeError:
+			continue
+	return b.decode('latin-1')
+
+def _clean(s):
+	if s is None:
+		return None
+	s = s.replace('\x00', '').strip()
+	return s or None
+
+def _track_no(s):
+	"""'3' / '03/12' -> 3"""
+	if s is None:
+		return None
+	s = str(s).split('/', 1)[0].strip()
+	return int(s) if s.isdigit() else None
+
+
+# =========== ID3 ===========
+_ID3_FRAMES = {
+	'TIT2': 'title', 'TPE1': 'artist', 'TALB': 'album', 'TRCK': 'track', 'TLEN': 'tlen',
+	'TT2': 'title', 'TP1': 'artist', 'TAL': 'album', 'TRK': 'track', 'TLE': 'tlen',
+}
+
+def _syncsafe(b: bytes) -> int:
+	return (b[0] << 21) | (b[1] << 14) | (b[2] << 7) | b[3]
+
+def _id3_text(data: bytes):
+	if not data:
+		return None
+	enc, raw = data[0], data[1:]
+	if enc == 0:
+		return _clean(_decode_legacy(raw.split(b'\x00', 1)[0]))
+	if enc == 1:
+		return _clean(raw.decode('utf-16', 'replace'))
+	if enc == 2:
+		return _clean(raw.decode('utf-16-be', 'replace'))
+	return _clean(raw.decode('utf-8', 'replace'))
+
+def _read_id3v2(f, out: dict) -> int:
+	"""从当前位置解析 ID3v2, 返回标签总长度 (无标签返回 0)."""
+	start = f.tell()
+	hdr = f.read(10)
+	if len(hdr) < 10 or hdr[:3] != b'ID3':
+		f.seek(start)
+		return 0
+	ver, flags, size = hdr[3], hdr[5], _syncsafe(hdr[6:10])
+	total = 10 + size + (10 if flags & 0x10 else 0)
+	end = start + 10 + size
+	if flags & 0x80 and ver < 4:
+		# 整体非同步化 (少见): 只能整体读入再还原
+		f = io.BytesIO(f.read(size).replace(b'\xff\x00', b'\xff'))
+		end = size
+	if flags & 0x40:
+		ext = f.read(4)
+		f.seek((_syncsafe(ext) - 4) if ver >= 4 else struct.unpack('>I', ext)[0], 1)
+	id_len, hdr_len = (3, 6) if ver == 2 else (4, 10)
+	while f.tell() + hdr_len <= end:
+		fh = f.read(hdr_len)
+		fid = fh[:id_len]
+		if not fid.strip(b'\x00') or not fid.isalnum():
+			break        # 填充区
+		if ver == 2:
+			fsize = int.from_bytes(fh[3:6], 'big')
+		elif ver >= 4:
+			fsize = _syncsafe(fh[4:8])
+		else:
+			fsize = struct.unpack('>I', fh[4:8])[0]
+		key = _ID3_FRAMES.get(fid.decode('latin-1'))
+		if key and fsize < 4096 and key not in out:
+			out[key] = _id3_text(f.read(fsize))
+		else:
+			f.seek(fsize, 1)     # 封面等大帧直接跳过
+	return total
+
+def _read_id3v1(f, size: int, out: dict):
+	if size < 128:
+		return
+	f.seek(size - 128)
+	tag = f.read(128)
+	if tag[:3] != b'TAG':
+		return
+	for key, a, b in (('title', 3, 33), ('artist', 33, 63), ('album', 63, 93)):
+		if not out.get(key):
+			out[key] = _clean(_decode_legacy(tag[a:b].split(b'\x00', 1)[0]))
+	if not out.get('track') and tag[125] == 0 and tag[126]:
+		out['track'] = str(tag[126])
+
+
+# =========== MP3 时长 ===========
+_MP3_BITRATES = {
+	(1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+	(1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+	(1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+	(2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+	(2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+	(2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 25: (11025, 12000, 8000)}
+
+def _mp3_duration(f, audio_start: int, size: int):
+	f.seek(audio_start)
+	buf = f.read(8192)
+	for i in range(len(buf) - 4):
+		if buf[i] != 0xFF or (buf[i+1] & 0xE0) != 0xE0:
+			continue
+		h = int.from_bytes(buf[i:i+4], 'big')
+		ver_bits, layer_bits = (h >> 19) & 3, (h >> 17) & 3
+		br_idx, sr_idx = (h >> 12) & 0xF, (h >> 10) & 3
+		if ver_bits == 1 or layer_bits == 0 or br_idx in (0, 15) or sr_idx == 3:
+			continue
+		ver = {3: 1, 2: 2, 0: 25}[ver_bits]
+		layer = 4 - layer_bits
+		rate = _MP3_RATES[ver][sr_idx]
+		kbps = _MP3_BITRATES[(1 if ver == 1 else 2, layer)][br_idx]
+		mono = ((h >> 6) & 3) == 3
+		spf = 384 if layer == 1 else (1152 if layer == 2 or ver == 1 else 576)
+		# Xing/Info 位于 side info 之后; VBRI 固定在帧头后 32 字节
+		side = (17 if mono else 32) if ver == 1 else (9 if mono else 17)
+		x = i + 4 + side
+		if buf[x:x+4] in (b'Xing', b'Info') and struct.unpack('>I', buf[x+4:x+8])[0] & 1:
+			frames = struct.unpack('>I', buf[x+8:x+12])[0]
+			return frames * spf / rate
+		v = i + 36
+		if buf[v:v+4] == b'VBRI':
+			frames = struct.unpack('>I', buf[v+14:v+18])[0]
+			return frames * spf / rate
+		return (size - audio_start - i) * 8 / (kbps * 1000)
+	return None
+
+def _parse_mp3(f, size: int) -> dict:
+	out = {}
+	audio_start = _read_id3v2(f, out)
+	tlen = out.pop('tlen', None)
+	_read_id3v1(f, size, out)
+	dur = _mp3_duration(f, audio_start, size)
+	if dur is None and tlen and tlen.isdigit():
+		dur = int(tlen) / 1000.0
+	out['duration'] = dur
+	return out
+
+
+# =========== FLAC ===========
+_VORBIS_KEYS = {'TITLE': 'title', 'ARTIST': 'artist', 'ALBUM': 'album', 'TRACKNUMBER': 'track'}
+
+def _parse_flac(f, size: int) -> dict:
+	out = {}
+	_read_id3v2(f, {})            # 少数文件前面带 ID3, 跳过
+	if f.read(4) != b'fLaC':
+		return out
+	while True:
+		bh = f.read(4)
+		if len(bh) < 4:
+			break
+		last, btype, blen = bh[0] & 0x80, bh[0] & 0x7F, int.from_bytes(bh[1:4], 'big')
+		if btype == 0:
+			si = f.read(blen)
+			v = int.from_bytes(si[10:18], 'big')
+			rate, total = v >> 44, v & 0xFFFFFFFFF
+			if rate:
+				out['duration'] = total / rate
+		elif btype == 4:
+			vc = f.read(blen)
+			off = 4 + struct.unpack('<I', vc[:4])[0]
+			count = struct.unpack('<I', vc[off:off+4])[0]
+			off += 4
+			for _ in range(count):
+				ln = struct.unpack('<I', vc[off:off+4])[0]
+				k, _, val = vc[off+4:off+4+ln].decode('utf-8', 'replace').partition('=')
+				key = _VORBIS_KEYS.get(k.upper())
+				if key and key not in out:
+					out[key] = _clean(val)
+				off += 4 + ln
+		else:
+			f.seek(blen, 1)       # PICTURE/SEEKTABLE/PADDING
+		if last:
+			break
+	return out
+
+
+# =========== WAV ===========
+_INFO_KEYS = {b'INAM': 'title', b'IART': 'artist', b'IPRD': 'album', b'ITRK': 'track', b'IPRT': 'track'}
+
+def _parse_wav(f, size: int) -> dict:
+	out = {}
+	hdr = f.read(12)
+	if hdr[:4] != b'RIFF' or hdr[8:12] != b'WAVE':
+		return out
+	byte_rate = 0
+	while True:
+		ch = f.read(8)
+		if len(ch) < 8:
+			break
+		cid, clen = ch[:4], struct.unpack('<I', ch[4:])[0]
+		nxt = f.tell() + clen + (clen & 1)
+		if cid == b'fmt ':
+			fmt = f.read(16)
+			byte_rate = struct.unpack('<I', fmt[8:12])[0]
+		elif cid == b'data':
+			if byte_rate:
+				out['duration'] = min(clen, size - f.tell()) / byte_rate
+		elif cid == b'LIST' and clen < 65536:
+			body = f.read(clen)
+			if body[:4] == b'INFO':
+				off = 4
+				while off + 8 <= len(body):
+					sid, slen = body[off:off+4], struct.unpack('<I', body[off+4:off+8])[0]
+					key = _INFO_KEYS.get(sid)
+					if key and key not in out:
+						out[key] = _clean(_decode_legacy(body[off+8:off+8+slen].split(b'\x00', 1)[0]))
+					off += 8 + slen + (slen & 1)
+		elif cid in (b'id3 ', b'ID3 '):
+			_read_id3v2(f, out)
+			out.pop('tlen', None)
+		f.seek(nxt)
+	return out
+
+
+_PARSERS = {'.mp3': _parse_mp3, '.flac': _parse_flac, '.wav': _parse_wav}
+
+def parse_file(path: str) -> dict:
+	"""解析单个文件, 返回 FIELDS 对应的字典; 不认识或损坏的文件各字段为 None."""
+	rec = dict.fromkeys(FIELDS)
+	parser = _PARSERS.get(os.path.splitext(path)[1].lower())
+	if parser is None:
+		return rec
+	try:
+		size = os.path.getsize(path)
+		with open(path, 'rb') as f:
+			rec.update({k: v for k, v in parser(f, size).items() if k in rec})
+	except (OSError, ValueError, KeyError, IndexError, struct.error):
+		pass
+	rec['track'] = _track_no(rec['track'])
+	if rec['duration'] is not None:
+		rec['duration'] = round(rec['duration'], 3)
+	return rec
+
+def _parse_batch(items):
+	"""进程池工作函数: [(rel, abs_path), ...] -> [(rel, record), ...]"""
+	return [(rel, parse_file(p)) for rel, p in items]
+
+
+# =========== 缓存 ===========
+class MetadataStore:
+	"""rel -> (size, mtime, 标签元组) 的内存表, 持久化在 SQLite."""
+
+	def __init__(self, db_path: str, workers: int = None):
+		self.workers = workers or os.cpu_count() or 2
+		self._lock = threading.RLock()
+		self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+		for stmt in _SCHEMA:
+			self._db.execute(stmt)
+		self._db.commit()
+		self._loaded = None          # rel -> (size, mtime, 字段元组); 首次使用时才从库中载入
+		self.version = 0             # 每次写入/删除 +1, 供其他进程判断是否需要 reload()
+		self.progress = {'state': 'idle', 'total': 0, 'stale': 0, 'parsed': 0, 'seconds': 0.0}
+
+	@property
+	def _rows(self):
+		# 惰性载入: Windows 下进程池 (spawn) 的子进程会重新导入主模块, 不应各自载入整张表
+		if self._loaded is None:
+			with self._lock:
+				if self._loaded is None:
+					self._loaded = {row[0]: (row[1], row[2], row[3:]) for row in self._db.execute(
+						'SELECT rel, size, mtime, title, artist, album, track, duration FROM tags')}
+		return self._loaded
+
+	def reload(self):
+		"""丢弃内存表, 下次读取时从 SQLite 重新载入 (标签由另一个进程解析写入时使用)."""
+		self._loaded = None
+
+	def __contains__(self, rel):
+		return rel in self._rows
+
+	def get(self, rel: str) -> dict:
+		row = self._rows.get(rel)
+		return dict(zip(FIELDS, row[2])) if row else dict.fromkeys(FIELDS)
+
+	def _stat(self, root: str, rel: str):
+		try:
+			st = os.stat(os.path.join(root, *rel.split('/')))
+			return rel, st.st_size, st.st_mtime
+		except OSError:
+			return rel, None, None
+
+	def sync(self, root: str, rels, removed=()):
+		"""对 rels 做 stat, 只解析 size/mtime 变化或未缓存的文件; removed 从缓存删除."""
+		t0 = time.time()
+		rels = list(rels)
+		self.progress = {'state': 'stat', 'total': len(rels), 'stale': 0, 'parsed': 0, 'seconds': 0.0}
+		with ThreadPoolExecutor(max_workers=16) as tp:       # stat 受 I/O 延迟限制, 线程并发即可
+			stats = list(tp.map(lambda r: self._stat(root, r), rels, chunksize=256))
+		stale = []
+		for rel, size, mtime in stats:
+			row = self._rows.get(rel)
+			if size is not None and (row is None or row[0] != size or row[1] != mtime):
+				stale.append((rel, size, mtime))
+		self.progress.update(state='parse', stale=len(stale))
+		info = {rel: (size, mtime) for rel, size, mtime in stale}
+		items = [(rel, os.path.join(root, *rel.split('/'))) for rel, _, _ in stale]
+		batches = [items[i:i+64] for i in range(0, len(items), 64)]
+		if len(items) <= 64:
+			results = [_parse_batch(b) for b in batches]
+		else:
+			# spawn: 服务进程中有大量线程, fork 出的子进程可能继承被其他线程持有的锁而死锁
+			with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')) as pp:
+				results = pp.map(_parse_batch, batches)
+		for batch in results:
+			self._store([(rel, info[rel], rec) for rel, rec in batch])
+			self.progress['parsed'] += len(batch)
+		self.remove(removed)
+		self.progress.update(state='done', seconds=round(time.time() - t0, 3))
+		return self.progress
+
+	def sync_one(self, root: str, rel: str) -> dict:
+		"""单个文件 (如刚开始播放的曲目): 未缓存或已变化时立即在本线程解析, 返回其标签.
+		不修改 progress, 与同时进行的整库 sync 互不干扰."""
+		rel, size, mtime = self._stat(root, rel)
+		row = self._rows.get(rel)
+		if size is not None and (row is None or row[0] != size or row[1] != mtime):
+			self._store([(rel, (size, mtime), parse_file(os.path.join(root, *rel.split('/'))))])
+		return self.get(rel)
+
+	def remove(self, rels):
+		rels = [r for r in rels if r in self._rows]
+		if not rels:
+			return
+		with self._lock:
+			for rel in rels:
+				self._rows.pop(rel, None)
+			self._db.executemany('DELETE FROM tags WHERE rel=?', [(r,) for r in rels])
+			self._db.commit()
+			self.version += 1
+
+	def prune(self, keep):
+		"""删除不在 keep 中的缓存行 (曲库中已不存在的文件)."""
+		keep = keep if isinstance(keep, (set, frozenset)) else set(keep)
+		with self._lock:             # 后台 sync 的 _store 可能同时写入 _rows, 遍历期间持锁 (RLock, remove 可重入)
+			self.remove([r for r in self._rows if r not in keep])
+
+	def _store(self, rows):
+		with self._lock:
+			for rel, (size, mtime), rec in rows:
+				self._rows[rel] = (size, mtime, tuple(rec[k] for k in FIELDS))
+			self._db.executemany(
+				'INSERT OR REPLACE INTO tags(rel, size, mtime, title, artist, album, track, duration) VALUES(?,?,?,?,?,?,?,?)',
+				[(rel, size, mtime) + tuple(rec[k] for k in FIELDS) for rel, (size, mtime), rec in rows])
+			self._db.commit()
+			self.version += 1
@@ -0,0 +1,169 @@
+"""进程内指标, 以 Prometheus 文本格式导出 (不依赖 prometheus_client).
+
+热路径上记录一次只需: 按标签取子序列 (一次 dict 查找) + bisect 定位桶 + 短暂加锁累加;
+桶计数按非累积方式存放, 导出时再累加. 多进程部署时每个进程各自一份.
+"""
+import abc, bisect, threading
+
+# 秒; 覆盖 IPC 往返 (亚毫秒) 到扫描 (数秒) 的范围
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+REGISTRY = []
+
+
+def _fmt(v) -> str:
+	if v != v:
+		return 'NaN'
+	if v == float('inf'):
+		return '+Inf'
+	if isinstance(v, float) and v.is_integer():
+		return str(int(v)) if abs(v) < 1e15 else repr(v)
+	return repr(v) if isinstance(v, float) else str(v)
+
+def _escape(v: str) -> str:
+	return v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values, extra=()) -> str:
+	pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + [f'{n}="{v}"' for n, v in extra]
+	return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric(abc.ABC):
+	kind = 'untyped'
+
+	def __init__(self, name: str, doc: str, labels=()):
+		self.name = name
+		self.doc = doc
+		self.labelnames = tuple(labels)
+		self._children = {}
+		self._lock = threading.Lock()
+		REGISTRY.append(self)
+
+	def labels(self, *values):
+		"""返回标签值对应的子序列 (首次使用时创建); 标签值按 str() 转换."""
+		key = values if all(type(v) is str for v in values) else tuple(str(v) for v in values)
+		child = self._children.get(key)
+		if child is None:
+			if len(key) != len(self.labelnames):
+				raise ValueError(f'{self.name}: 需要标签 {self.labelnames}')
+			with self._lock:
+				child = self._children.setdefault(key, self._new())
+		return child
+
+	@abc.abstractmethod
+	def _new(self):
+		"""创建一个子序列的存储对象."""
+
+	@abc.abstractmethod
+	def _render_child(self, key, child) -> list:
+		"""一个子序列导出的文本行."""
+
+	def render(self) -> list:
+		lines = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} {self.kind}']
+		for key, child in sorted(self._children.items()):
+			lines.extend(self._render_child(key, child))
+		return lines
+
+
+class _Value:
+	__slots__ = ('value', 'fn', '_lock')
+
+	def __init__(self):
+		self.value = 0.0
+		self.fn = None
+		self._lock = threading.Lock()
+
+	def inc(self, n: float = 1.0):
+		with self._lock:
+			self.value += n
+
+	def set(self, v: float):
+		self.value = v
+
+	def set_function(self, fn):
+		"""导出时调用 fn() 取值 (队列长度、订阅者数等现成的状态)."""
+		self.fn = fn
+
+	def get(self):
+		if self.fn is not None:
+			try:
+				return float(self.fn())
+			except Exception:
+				return float('nan')
+		return self.value
+
+
+class Counter(_Metric):
+	kind = 'counter'
+
+	def _new(self):
+		return _Value()
+
+	def inc(self, n: float = 1.0):
+		self.labels().inc(n)
+
+	def _render_child(self, key, child):
+		return [f'{self.name}{_labels(self.labelnames, key)} {_fmt(child.get())}']
+
+
+class Gauge(Counter):
+	kind = 'gauge'
+
+	def set(self, v: float):
+		self.labels().set(v)
+
+	def set_function(self, fn):
+		self.labels().set_function(fn)
+
+
+class _Buckets:
+	__slots__ = ('bounds', 'counts', 'sum', 'count', '_lock')
+
+	def __init__(self, bounds):
+		self.bounds = bounds
+		self.counts = [0] * (len(bounds) + 1)      # 最后一格为 +Inf
+		self.sum = 0.0
+		self.count = 0
+		self._lock = threading.Lock()
+
+	def observe(self, v: float):
+		i = bisect.bisect_left(self.bounds, v)
+		with self._lock:
+			self.counts[i] += 1
+			self.sum += v
+			self.count += 1
+
+
+class Histogram(_Metric):
+	kind = 'histogram'
+
+	def __init__(self, name: str, doc: str, labels=(), buckets=DEFAULT_BUCKETS):
+		self.buckets = tuple(sorted(buckets))
+		super().__init__(name, doc, labels)
+
+	def _new(self):
+		return _Buckets(self.buckets)
+
+	def observe(self, v: float):
+		self.labels().observe(v)
+
+	def _render_child(self, key, child):
+		with child._lock:
+			counts, total, n = list(child.counts), child.sum, child.count
+		lines, acc = [], 0
+		for bound, c in zip(self.buckets + (float('inf'),), counts):
+			acc += c
+			lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, [("le", _fmt(float(bound)))])} {acc}')
+		lab = _labels(self.labelnames, key)
+		lines.append(f'{self.name}_sum{lab} {_fmt(total)}')
+		lines.append(f'{self.name}_count{lab} {n}')
+		return lines
+
+
+def render() -> str:
+	"""全部指标的 Prometheus 文本格式 (text/plain; version=0.0.4)."""
+	lines = []
+	for m in REGISTRY:
+		lines.extend(m.render())
+	return '\n'.join(lines) + '\n'
@@ -0,0 +1,314 @@
+"""mpv JSON IPC 长连接客户端.
+
+一条连接复用所有请求: 写入端加锁串行, 独立读线程按 request_id 把响应分发给等待者,
+因此多个请求可以同时在途 (pipelining), 每个请求各自超时. 连接断开后下一次请求自动重连.
+支持 Windows 命名管道 (\\\\.\\pipe\\xxx, 重叠 I/O, 读写互不阻塞) 与 Unix domain socket (/tmp/mpv.sock).
+"""
+import json, socket, threading, itertools, time
+from metrics import Counter, Histogram
+
+try:
+	import _winapi
+except ImportError:          # 非 Windows
+	_winapi = None
+
+
+class IpcError(RuntimeError):
+	"""连接 mpv IPC 失败或连接在请求途中断开."""
+
+
+IPC_RTT = Histogram('jukebox_mpv_ipc_rtt_seconds', 'mpv IPC 请求从写入到收到响应的时间', ['command'])
+IPC_WRITE = Histogram('jukebox_mpv_ipc_write_seconds', 'mpv IPC 一次写入 (可含多条命令) 的耗时')
+IPC_TIMEOUTS = Counter('jukebox_mpv_ipc_timeouts_total', '等待响应超时的 mpv IPC 请求数', ['command'])
+IPC_ERRORS = Counter('jukebox_mpv_ipc_errors_total', 'mpv IPC 连接/写入失败次数', ['kind'])
+
+def _cmd_label(cmd) -> str:
+	"""指标标签: 命令名, 属性读写再附属性名 (取值范围有限)."""
+	if not cmd:
+		return ''
+	if cmd[0] in ('get_property', 'set_property') and len(cmd) > 1:
+		return f'{cmd[0]}:{cmd[1]}'
+	return str(cmd[0])
+
+
+def _is_win_pipe(path: str) -> bool:
+	p = path.replace('/', '\\')
+	return p.startswith('\\\\.\\pipe\\') or p.startswith('\\\\?\\pipe\\')
+
+
+class _UnixTransport:
+	def __init__(self, path: str, timeout: float):
+		self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self._sock.settimeout(timeout)
+		try:
+			self._sock.connect(path)
+		except OSError:
+			self._sock.close()
+			raise
+		self._sock.settimeout(None)
+
+	def read(self) -> bytes:
+		return self._sock.recv(65536)
+
+	def write(self, data: bytes):
+		self._sock.sendall(data)
+
+	def close(self):
+		try:
+			self._sock.shutdown(socket.SHUT_RDWR)
+		except OSError:
+			pass
+		self._sock.close()
+
+
+class _WinPipeTransport:
+	"""命名管道以 FILE_FLAG_OVERLAPPED 打开; 同步句柄上挂起的 ReadFile 会阻塞 WriteFile."""
+	_ERROR_PIPE_BUSY = 231
+	_ERROR_MORE_DATA = 234
+
+	def __init__(self, path: str, timeout: float):
+		end = time.time() + timeout
+		while True:
+			try:
+				self._h = _winapi.CreateFile(
+					path, _winapi.GENERIC_READ | _winapi.GENERIC_WRITE, 0, _winapi.NULL,
+					_winapi.OPEN_EXISTING, _winapi.FILE_FLAG_OVERLAPPED, _winapi.NULL)
+				return
+			except OSError as e:
+				if getattr(e, 'winerror', None) != self._ERROR_PIPE_BUSY or time.time() >= end:
+					raise
+				_winapi.WaitNamedPipe(path, max(1, int((end - time.time()) * 1000)))
+
+	def read(self) -> bytes:
+		ov, err = _winapi.ReadFile(self._h, 65536, overlapped=True)
+		try:
+			if err == _winapi.ERROR_IO_PENDING:
+				_winapi.WaitForMultipleObjects([ov.event], False, _winapi.INFINITE)
+			_, err = ov.GetOverlappedResult(True)
+		except BaseException:
+			ov.cancel()
+			raise
+		if err not in (0, self._ERROR_MORE_DATA):
+			raise OSError(err, 'ReadFile 失败')
+		return bytes(ov.getbuffer())
+
+	def write(self, data: bytes):
+		ov, err = _winapi.WriteFile(self._h, data, overlapped=True)
+		try:
+			if err == _winapi.ERROR_IO_PENDING:
+				_winapi.WaitForMultipleObjects([ov.event], False, _winapi.INFINITE)
+			_, err = ov.GetOverlappedResult(True)
+		except BaseException:
+			ov.cancel()
+			raise
+		if err:
+			raise OSError(err, 'WriteFile 失败')
+
+	def close(self):
+		_winapi.CloseHandle(self._h)
+
+
+class _Waiter:
+	__slots__ = ('event', 'response', 'callback', 'label', 't0')
+
+	def __init__(self, label: str, callback=None):
+		self.event = threading.Event()
+		self.response = None
+		self.callback = callback
+		self.label = label
+		self.t0 = time.perf_counter()
+
+	def done(self, response):
+		if response is not None:
+			IPC_RTT.labels(self.label).observe(time.perf_counter() - self.t0)
+		self.response = response
+		self.event.set()
+		if self.callback is not None:
+			try:
+				self.callback(response)
+			except Exception as e:
+				print('[WARN] mpv IPC 异步回调失败:', e)
+
+
+class MpvIpcClient:
+	"""线程安全的 mpv IPC 客户端.
+
+	request()/request_many() 发送带 request_id 的命令并等待对应响应;
+	command() 只写不等; 没有 request_id 的消息 (mpv 事件) 交给 on_event 回调.
+	"""
+
+	def __init__(self, path: str, connect_timeout: float = 1.0, timeout: float = 2.0):
+		self.path = path
+		self.connect_timeout = connect_timeout
+		self.timeout = timeout
+		self.on_event = []           # 回调 f(event_dict), 在读线程中执行, 需尽快返回
+		self.on_connect = []         # 回调 f(client), 每次(重新)连接成功后执行
+		self.stats = {'requests': 0, 'timeouts': 0, 'connects': 0, 'errors': 0}
+		self._ids = itertools.count(1)
+		self._conn_lock = threading.Lock()
+		self._write_lock = threading.Lock()
+		self._waiters = {}
+		self._transport = None
+		self._reader = None
+
+	# ---------- 连接管理 ----------
+	@property
+	def connected(self) -> bool:
+		return self._transport is not None
+
+	def connect(self) -> bool:
+		"""已连接直接返回 True; 否则尝试建立连接 (不抛异常)."""
+		if self._transport is not None:
+			return True
+		with self._conn_lock:
+			if self._transport is not None:
+				return True
+			try:
+				if _is_win_pipe(self.path):
+					if _winapi is None:
+						return False
+					tr = _WinPipeTransport(self.path, self.connect_timeout)
+				else:
+					tr = _UnixTransport(self.path, self.connect_timeout)
+			except OSError:
+				return False
+			self._transport = tr
+			self._reader = threading.Thread(target=self._read_loop, args=(tr,), daemon=True)
+			self._reader.start()
+			self.stats['connects'] += 1
+		for cb in list(self.on_connect):
+			try:
+				cb(self)
+			except Exception as e:
+				print('[WARN] mpv IPC on_connect 回调失败:', e)
+		return True
+
+	def close(self):
+		self._drop(self._transport)
+
+	def _drop(self, tr):
+		"""断开指定连接并让其上所有在途请求立即失败."""
+		with self._conn_lock:
+			if tr is None or self._transport is not tr:
+				return
+			self._transport = None
+			try:
+				tr.close()
+			except OSError:
+				pass
+			waiters, self._waiters = self._waiters, {}
+		for w in waiters.values():
+			w.done(None)
+
+	def _read_loop(self, tr):
+		buf = b''
+		try:
+			while True:
+				chunk = tr.read()
+				if not chunk:
+					break
+				buf += chunk
+				while b'\n' in buf:
+					line, buf = buf.split(b'\n', 1)
+					self._dispatch(line)
+		except OSError:
+			pass
+		finally:
+			self._drop(tr)
+
+	def _dispatch(self, line: bytes):
+		try:
+			obj = json.loads(line.decode('utf-8', 'ignore'))
+		except ValueError:
+			return
+		rid = obj.get('request_id')
+		if rid is not None and 'event' not in obj:
+			w = self._waiters.pop(rid, None)
+			if w is not None:
+				w.done(obj)
+			return
+		if 'event' in obj:
+			for cb in list(self.on_event):
+				try:
+					cb(obj)
+				except Exception as e:
+					print('[WARN] mpv 事件回调失败:', e)
+
+	# ---------- 请求 ----------
+	def _send(self, payloads):
+		"""一次写入多条命令 (换行分隔). 写失败时断开连接并抛出 IpcError."""
+		if not self.connect():
+			IPC_ERRORS.labels('connect').inc()
+			raise IpcError(f'无法连接 mpv IPC: {self.path}')
+		tr = self._transport
+		data = b''.join((json.dumps(p) + '\n').encode('utf-8') for p in payloads)
+		try:
+			t0 = time.perf_counter()
+			with self._write_lock:
+				tr.write(data)
+			IPC_WRITE.observe(time.perf_counter() - t0)
+		except (OSError, AttributeError) as e:
+			self.stats['errors'] += 1
+			IPC_ERRORS.labels('write').inc()
+			self._drop(tr)
+			raise IpcError(f'mpv IPC 写入失败: {e}')
+
+	def command(self, cmd: list):
+		"""只发送, 不等待响应."""
+		self._send([{'command': cmd}])
+
+	def command_many(self, cmds):
+		"""多条命令合并为一次写入, 不等待响应; mpv 按顺序执行."""
+		if cmds:
+			self._send([{'command': c} for c in cmds])
+
+	def request_many(self, cmds, timeout: float = None):
+		"""流水线发送多条命令 (一次写入), 按顺序返回各自的响应; 超时或断开的项为 None."""
+		waiters = []
+		payloads = []
+		for cmd in cmds:
+			rid = next(self._ids)
+			w = _Waiter(_cmd_label(cmd))
+			self._waiters[rid] = w
+			waiters.append((rid, w))
+			payloads.append({'command': cmd, 'request_id': rid})
+		self.stats['requests'] += len(payloads)
+		try:
+			self._send(payloads)
+		except IpcError:
+			for rid, _ in waiters:
+				self._waiters.pop(rid, None)
+			raise
+		end = time.time() + (self.timeout if timeout is None else timeout)
+		out = []
+		for rid, w in waiters:
+			if not w.event.wait(max(0.0, end - time.time())):
+				self._waiters.pop(rid, None)
+				self.stats['timeouts'] += 1
+				IPC_TIMEOUTS.labels(w.label).inc()
+			out.append(w.response)
+		return out
+
+	def request_async(self, cmd: list, callback):
+		"""发送命令后立即返回; 响应到达时在读线程中调用 callback(response), 断开时为 None.
+
+		可在事件回调 (读线程) 中使用, 不会死锁.
+		"""
+		rid = next(self._ids)
+		self._waiters[rid] = _Waiter(_cmd_label(cmd), callback)
+		self.stats['requests'] += 1
+		try:
+			self._send([{'command': cmd, 'request_id': rid}])
+		except IpcError:
+			self._waiters.pop(rid, None)
+			raise
+
+	def request(self, cmd: list, timeout: float = None):
+		"""发送单条命令并等待响应; 超时返回 None."""
+		return self.request_many([cmd], timeout)[0]
+
+	def get(self, prop: str, timeout: float = None):
+		resp = self.request(['get_property', prop], timeout)
+		if not resp or resp.get('error') != 'success':
+			return None
+		return resp.get('data')
@@ -0,0 +1,121 @@
+"""mpv 播放状态缓存.
+
+通过 observe_property 订阅 pause/duration/volume/speed, 由 mpv 主动推送变化;
+time-pos 不订阅 (播放中每秒变化数十次), 而是在 playback-restart (开始播放/跳转后)
+与暂停切换时异步取一次作为锚点, 其间按 speed 在本地插值.
+读取 snapshot() 为纯内存操作, 成本与客户端数量无关.
+"""
+import time, threading
+
+# observe_property 的 id 段, 避开 player.Zone 自用的 1/2/3
+_OBSERVED = {11: 'pause', 12: 'duration', 13: 'volume', 14: 'speed'}
+
+
+class PlaybackState:
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._fields = {}            # name -> (value, monotonic 更新时间)
+		self._anchor = None          # (time-pos, monotonic) ; None 表示未在播放
+		self._client = None
+		self.listeners = []          # 回调 f(name), 字段或锚点变化后在 IPC 读线程中调用
+
+	def attach(self, client):
+		"""挂到 MpvIpcClient 上: 连接时订阅属性, 事件到达时更新缓存."""
+		self._client = client
+		client.on_connect.append(self._on_connect)
+		client.on_event.append(self._on_event)
+		if client.connected:
+			self._on_connect(client)
+
+	# ---------- mpv 回调 (IPC 读线程) ----------
+	def _on_connect(self, client):
+		for oid, name in _OBSERVED.items():
+			client.command(['observe_property', oid, name])
+		self._reanchor()
+
+	def _on_event(self, ev: dict):
+		name = ev.get('event')
+		if name == 'property-change' and ev.get('name') in _OBSERVED.values():
+			prop = ev['name']
+			if prop == 'pause':
+				with self._lock:
+					# 先按旧状态把插值位置固定下来, 再异步校准
+					pos = self._position_locked(time.monotonic())
+					if pos is not None:
+						self._anchor = (pos, time.monotonic())
+					self._fields['pause'] = (ev.get('data'), time.monotonic())
+				self._notify('pause')
+				self._reanchor()
+			else:
+				self.set(prop, ev.get('data'))
+		elif name in ('playback-restart', 'seek'):
+			self._reanchor()
+		elif name == 'end-file':
+			with self._lock:
+				self._anchor = None
+				self._fields['duration'] = (None, time.monotonic())
+			self._notify('time')
+
+	def _notify(self, name: str):
+		for cb in list(self.listeners):
+			try:
+				cb(name)
+			except Exception as e:
+				print('[WARN] 播放状态监听回调失败:', e)
+
+	def _reanchor(self):
+		client = self._client
+		if client is None:
+			return
+		try:
+			client.request_async(['get_property', 'time-pos'], self._on_time_pos)
+		except Exception:
+			pass
+
+	def _on_time_pos(self, resp):
+		if not resp or resp.get('error') != 'success':
+			return
+		pos = resp.get('data')
+		with self._lock:
+			self._anchor = (pos, time.monotonic()) if isinstance(pos, (int, float)) else None
+		self._notify('time')
+
+	# ---------- 读写 ----------
+	def set(self, name: str, value):
+		with self._lock:
+			self._fields[name] = (value, time.monotonic())
+		self._notify(name)
+
+	def get(self, name: str, default=None):
+		with self._lock:
+			v = self._fields.get(name)
+		return default if v is None else v[0]
+
+	def _position_locked(self, now: float):
+		if self._anchor is None:
+			return None
+		pos, ts = self._anchor
+		paused = self._fields.get('pause', (False, 0))[0]
+		if not paused:
+			speed = self._fields.get('speed', (1.0, 0))[0] or 1.0
+			pos += (now - ts) * speed
+		dur = self._fields.get('duration', (None, 0))[0]
+		if isinstance(dur, (int, float)) and dur > 0:
+			pos = min(pos, dur)
+		return pos
+
+	def snapshot(self) -> dict:
+		"""返回与 /status 旧字段兼容的字典, 另附 stale: 各字段距上次 mpv 推送的秒数."""
+		now = time.monotonic()
+		with self._lock:
+			def val(n):
+				return self._fields.get(n, (None, None))[0]
+			stale = {n: round(now - ts, 3) for n, (_, ts) in self._fields.items()}
+			stale['time'] = round(now - self._anchor[1], 3) if self._anchor else None
+			return {
+				'time': self._position_locked(now),
+				'duration': val('duration'),
+				'paused': val('pause'),
+				'volume': val('volume'),
+				'stale': stale,
+			}
@@ -0,0 +1,257 @@
+"""波形峰值: 供进度条绘制波形, 在后台进程中预先计算并以紧凑的二进制文件缓存.
+
+WAV 用标准库 wave 读取参数, 采样数据经 numpy.memmap 映射后按桶向量化求 min/max, 不把整个文件读进内存;
+其他格式需要本地解码器 (如 ffmpeg), 转成 8 kHz 单声道 s16le 后同样计算. numpy 为可选依赖,
+未安装时改用 array 模块逐桶计算 (较慢, 但只在后台进程中进行).
+
+峰值文件按 路径 + size + mtime + 桶数 的哈希命名, 曲目被替换后自然失效; 命中时直接返回文件字节.
+格式 (小端): b'JKPK' | 版本 u8 | 保留 u8 | 桶数 u16 | 时长(秒) f32 | 每桶 (min, max) 各 int8 (满幅 ±127).
+"""
+import os, sys, wave, struct, shutil, hashlib, threading, subprocess, multiprocessing
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+	import numpy as np
+except ImportError:          # 可选依赖
+	np = None
+
+MAGIC = b'JKPK'
+VERSION = 1
+HEADER = struct.Struct('<4sBBHf')
+DECODE_RATE = 8000           # 解码器输出的采样率; 只用于画波形, 足够
+BLOCK_FRAMES = 1 << 20       # numpy 每次归约的帧数上限, 限制临时数组大小
+_FULL_SCALE = {1: 128.0, 2: 32768.0, 3: 8388608.0, 4: 2147483648.0}
+_ARRAY_CODE = {1: 'B', 2: 'h', 4: 'i'}
+
+
+class UnsupportedFormat(ValueError):
+	"""无法解码 (非 PCM 的 WAV, 或没有可用的解码器)."""
+
+
+# =========== 计算 (进程池中执行) ===========
+def _wav_params(path: str):
+	"""(声道数, 采样宽度, 采样率, 帧数, data 块在文件中的偏移)."""
+	try:
+		with wave.open(path, 'rb') as w:
+			ch, width, rate, frames = w.getnchannels(), w.getsampwidth(), w.getframerate(), w.getnframes()
+	except (wave.Error, EOFError) as e:
+		raise UnsupportedFormat(f'不支持的 WAV: {e}')
+	with open(path, 'rb') as f:
+		f.seek(12)
+		while True:
+			hdr = f.read(8)
+			if len(hdr) < 8:
+				raise UnsupportedFormat('WAV 缺少 data 块')
+			cid, clen = hdr[:4], struct.unpack('<I', hdr[4:])[0]
+			if cid == b'data':
+				return ch, width, rate, frames, f.tell()
+			f.seek(clen + (clen & 1), 1)
+
+def _np_peaks(raw, ch: int, width: int, frames: int, buckets: int):
+	"""raw 为原始采样的一维 numpy 数组 (可为 memmap; 24 位时为字节); 按桶分块归约, 返回 (mins, maxs)."""
+	per = frames // buckets
+	mins = np.empty(buckets, np.float64)
+	maxs = np.empty(buckets, np.float64)
+	unit = ch * (3 if width == 3 else 1)
+	step = max(1, BLOCK_FRAMES // per)
+	for b0 in range(0, buckets, step):
+		b1 = min(buckets, b0 + step)
+		blk = raw[b0 * per * unit: b1 * per * unit]
+		if width == 3:
+			b = blk.reshape(-1, 3).astype(np.int32)
+			blk = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+			blk = np.where(blk >= 1 << 23, blk - (1 << 24), blk)
+		blk = blk.reshape(b1 - b0, per * ch)
+		mins[b0:b1] = blk.min(axis=1)
+		maxs[b0:b1] = blk.max(axis=1)
+	if width == 1:               # 8 位 WAV 为无符号
+		mins -= 128
+		maxs -= 128
+	return mins / _FULL_SCALE[width], maxs / _FULL_SCALE[width]
+
+def _py_peaks(read, ch: int, width: int, frames: int, buckets: int):
+	"""无 numpy: read(n) 返回 n 帧的字节, 逐桶用 array 求 min/max."""
+	per = frames // buckets
+	mins, maxs = [], []
+	for _ in range(buckets):
+		data = read(per)
+		if width == 3:           # 24 位只取高 16 位, 画波形足够
+			hi = bytearray(len(data) // 3 * 2)
+			hi[0::2], hi[1::2] = data[1::3], data[2::3]
+			data, w = bytes(hi), 2
+		else:
+			w = width
+		samples = array(_ARRAY_CODE[w], data)
+		if sys.byteorder == 'big' and w > 1:
+			samples.byteswap()
+		if not samples:
+			mins.append(0.0)
+			maxs.append(0.0)
+			continue
+		off = 128 if w == 1 else 0
+		mins.append((min(samples) - off) / _FULL_SCALE[w])
+		maxs.append((max(samples) - off) / _FULL_SCALE[w])
+	return mins, maxs
+
+def decode_pcm(path: str, decoder: str, rate: int = DECODE_RATE, start: float = None, length: float = None) -> bytes:
+	"""用本地解码器把任意格式转成 rate 单声道 s16le; 给出 start/length (秒) 时只解码这一段."""
+	cmd = [decoder, '-v', 'error', '-nostdin']
+	if start:
+		cmd += ['-ss', f'{start:.3f}']       # 放在 -i 之前: 按索引/码率直接定位, 不解码前面的部分
+	cmd += ['-i', path]
+	if length:
+		cmd += ['-t', f'{length:.3f}']
+	cmd += ['-ac', '1', '-ar', str(rate), '-f', 's16le', '-']
+	try:
+		res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=300)
+	except (OSError, subprocess.TimeoutExpired) as e:
+		raise UnsupportedFormat(f'解码失败: {e}')
+	if res.returncode != 0 or not res.stdout:
+		raise UnsupportedFormat('解码失败: ' + res.stderr.decode('utf-8', 'replace').strip()[:200])
+	return res.stdout
+
+def _encode(mins, maxs, duration: float) -> bytes:
+	out = bytearray(HEADER.pack(MAGIC, VERSION, 0, len(mins), duration))
+	for lo, hi in zip(mins, maxs):
+		out += struct.pack('<bb', max(-127, min(127, round(lo * 127))), max(-127, min(127, round(hi * 127))))
+	return bytes(out)
+
+def compute_peaks(path: str, buckets: int, decoder: str = None) -> bytes:
+	"""进程池工作函数: 返回峰值文件的完整字节."""
+	if os.path.splitext(path)[1].lower() == '.wav':
+		ch, width, rate, frames, offset = _wav_params(path)
+		if width not in _FULL_SCALE:
+			raise UnsupportedFormat(f'不支持的采样宽度: {width}')
+		frames = min(frames, (os.path.getsize(path) - offset) // (ch * width))     # 截断的文件
+		buckets = max(1, min(buckets, frames))
+		duration = frames / rate if rate else 0.0
+		if frames == 0:
+			return _encode([0.0], [0.0], duration)
+		if np is not None:
+			dtype = np.uint8 if width in (1, 3) else ('<i2' if width == 2 else '<i4')
+			count = frames * ch * (3 if width == 3 else 1)
+			raw = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+			mins, maxs = _np_peaks(raw, ch, width, frames, buckets)
+		else:
+			with wave.open(path, 'rb') as w:
+				mins, maxs = _py_peaks(w.readframes, ch, width, frames, buckets)
+		return _encode(mins, maxs, duration)
+	if not decoder:
+		raise UnsupportedFormat('该格式需要本地解码器')
+	pcm = decode_pcm(path, decoder)
+	frames = len(pcm) // 2
+	buckets = max(1, min(buckets, frames))
+	if np is not None:
+		mins, maxs = _np_peaks(np.frombuffer(pcm, '<i2', count=frames), 1, 2, frames, buckets)
+	else:
+		pos = [0]
+		def read(n):
+			data = pcm[pos[0]: pos[0] + n * 2]
+			pos[0] += n * 2
+			return data
+		mins, maxs = _py_peaks(read, 1, 2, frames, buckets)
+	return _encode(mins, maxs, frames / DECODE_RATE)
+
+def lower_priority():
+	# 进程池初始化: 降低优先级, 不与播放/请求处理争抢 CPU
+	if hasattr(os, 'nice'):
+		try:
+			os.nice(10)
+		except OSError:
+			pass
+
+
+# =========== 缓存 ===========
+class PeakStore:
+	"""峰值文件缓存; 未命中时提交到后台进程池, 同一文件同时只计算一次."""
+
+	def __init__(self, cache_dir: str, buckets: int = 800, workers: int = 1, decoder: str = ''):
+		self.cache_dir = cache_dir
+		self.buckets = max(1, min(65535, buckets))
+		self.workers = max(1, workers)
+		self.decoder = shutil.which(decoder) if decoder else None
+		self._pool = None
+		self._pending = {}           # key -> Future
+		self._failed = {}            # key -> 错误信息; 文件变化后 key 也会变, 不再重试同一版本
+		self._lock = threading.Lock()
+		self.stats = {'hits': 0, 'computed': 0, 'errors': 0}
+
+	def supported(self, path: str) -> bool:
+		return os.path.splitext(path)[1].lower() == '.wav' or self.decoder is not None
+
+	def key(self, path: str) -> str:
+		st = os.stat(path)
+		raw = f'{path}\0{st.st_size}\0{st.st_mtime_ns}\0{self.buckets}\0{VERSION}'.encode('utf-8', 'surrogateescape')
+		return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+	def _file(self, key: str) -> str:
+		return os.path.join(self.cache_dir, key[:2], key + '.peaks')
+
+	def get(self, path: str, wait: float = 0.0):
+		"""(key, 峰值字节); 尚未生成时在后台生成并最多等待 wait 秒, 仍未完成时字节为 None.
+		无法解码时抛 UnsupportedFormat."""
+		key = self.key(path)
+		try:
+			with open(self._file(key), 'rb') as f:
+				data = f.read()
+			self.stats['hits'] += 1
+			return key, data
+		except FileNotFoundError:
+			pass
+		if key in self._failed:
+			raise UnsupportedFormat(self._failed[key])
+		fut = self._submit(key, path)
+		if wait > 0:
+			try:
+				return key, fut.result(timeout=wait)
+			except UnsupportedFormat:
+				raise
+			except Exception:
+				pass
+		return key, None
+
+	def prefetch(self, path: str):
+		"""确保峰值文件在后台生成 (如曲目开始播放时), 不等待."""
+		try:
+			key = self.key(path)
+		except OSError:
+			return
+		if self.supported(path) and key not in self._failed and not os.path.exists(self._file(key)):
+			self._submit(key, path)
+
+	def _submit(self, key: str, path: str):
+		with self._lock:
+			fut = self._pending.get(key)
+			if fut is None:
+				if self._pool is None:
+					# spawn 而非 fork: 服务进程中有大量线程, fork 出的子进程可能继承被持有的锁而死锁
+					self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=lower_priority,
+						mp_context=multiprocessing.get_context('spawn'))
+				fut = self._pool.submit(compute_peaks, path, self.buckets, self.decoder)
+				self._pending[key] = fut
+				fut.add_done_callback(lambda f: self._done(key, path, f))
+		return fut
+
+	def _done(self, key: str, path: str, fut):
+		try:
+			data = fut.result()
+			target = self._file(key)
+			os.makedirs(os.path.dirname(target), exist_ok=True)
+			tmp = f'{target}.{os.getpid()}.tmp'
+			with open(tmp, 'wb') as f:
+				f.write(data)
+			os.replace(tmp, target)      # 多进程部署时各进程可能同时生成同一文件
+			self.stats['computed'] += 1
+		except BrokenProcessPool as e:
+			print(f'[WARN] 波形峰值进程池异常, 将重新创建: {e}')
+			with self._lock:
+				self._pool = None
+		except Exception as e:
+			self.stats['errors'] += 1
+			self._failed[key] = str(e) or type(e).__name__
+			print(f'[WARN] 波形峰值生成失败 {path}: {e}')
+		finally:
+			with self._lock:
+				self._pending.pop(key, None)
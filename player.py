@@ -0,0 +1,949 @@
+"""播放分区 (zone): 每个分区驱动一个独立的 mpv 进程.
+
+分区各自拥有 IPC 长连接、播放状态缓存、事件推送、播放列表位置、随机排列与
+播放线程, 互不共享可变状态; 某个分区的 mpv 卡顿只会阻塞该分区自己的线程.
+曲库 (播放列表对象、标签、重复检测) 由调用方通过回调提供, 所有分区共用.
+
+每个分区是一个单写者 actor: 播放状态只在分区线程中修改. 请求线程经 call() 提交命令并
+带超时等待结果, mpv 事件与曲库变化经 post() 排队; 读取方只看 snapshot (每条命令执行后
+整体替换的只读字典), 不会读到执行到一半的状态.
+"""
+import os, time, queue, threading, subprocess
+from types import MappingProxyType
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from mpv_ipc import MpvIpcClient, IpcError
+from mpv_state import PlaybackState
+from events import EventHub
+from playlist import Playlist
+from shuffle import ShuffleEngine
+from features import AutoDJ
+from metrics import Counter, Gauge, Histogram
+
+HOUSEKEEP_INTERVAL = 5.0     # 检查 mpv 连接 / 自动开始播放的间隔(秒)
+VOLUME_COALESCE = 0.05       # 该时间窗口内的多次音量设置合并为一次 (拖动滑块时的连发请求)
+SEEK_MODES = ('absolute', 'relative', 'absolute-percent')
+
+ADVANCE_GAP = Histogram('jukebox_autoadvance_gap_seconds', '自动切歌间隙: 上一首 eof 到下一首开始播放 (gapless: 下一首已预先排入 mpv)',
+	['zone', 'gapless'], buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+ZONE_COMMAND = Histogram('jukebox_zone_command_seconds', '分区命令排队等待 (wait) 与执行 (run) 的耗时', ['zone', 'phase'])
+ZONE_QUEUE = Gauge('jukebox_zone_queue_length', '分区命令队列中等待执行的条目数', ['zone'])
+MPV_RETRIES = Counter('jukebox_mpv_retries_total', '写入失败后确保 mpv 运行并重试的次数', ['zone', 'result'])
+MPV_STARTS = Counter('jukebox_mpv_starts_total', '由本进程启动 mpv 的次数', ['zone'])
+BATCH_COMMANDS = Histogram('jukebox_batch_commands', '每个批处理请求合并后写入 mpv 的命令条数', ['zone'],
+	buckets=(0, 1, 2, 4, 8, 16, 32, 64))
+RESUME_SECONDS = Gauge('jukebox_resume_seconds', '启动后按状态日志恢复播放: 进程启动到 mpv 开始播放 (或接管仍在播放的 mpv) 的耗时', ['zone'])
+VOLUME_COALESCED = Counter('jukebox_volume_coalesced_total', '被同一窗口内更新的设置取代、未单独写入 mpv 的音量请求', ['zone'])
+
+
+class ZoneError(RuntimeError):
+	"""命令无法完成 (mpv 未就绪、没有下一首等), 消息可直接返回给客户端."""
+
+
+class ZoneBusy(ZoneError):
+	"""分区线程在超时内未处理完命令."""
+
+
+def coalesce_commands(cmds: list) -> list:
+	"""合并一批按顺序执行的 mpv 命令, 结果与逐条执行等价:
+	同一属性只保留最后一次 set_property; 最后一次 loadfile replace 之前的切歌/排队/跳转都会被它覆盖;
+	之后还有 playlist-clear (中间没有 playlist-next) 的 playlist-clear 与 append 也会被清掉."""
+	out, props, cleared, replaced = [], set(), False, False
+	for cmd in reversed(cmds):
+		op = cmd[0] if cmd else None
+		if op == 'set_property':
+			if cmd[1] in props:
+				continue
+			props.add(cmd[1])
+		elif replaced and op in ('loadfile', 'playlist-clear', 'playlist-next', 'seek'):
+			continue
+		elif op == 'loadfile' and (len(cmd) < 3 or cmd[2] == 'replace'):
+			replaced = True
+		elif op == 'playlist-next':
+			cleared = False      # 之前排入的曲目会被它用到
+		elif op == 'playlist-clear':
+			if cleared:
+				continue
+			cleared = True
+		elif op == 'loadfile' and cleared:
+			continue
+		out.append(cmd)
+	out.reverse()
+	return out
+
+
+class Zone:
+	def __init__(self, zid: str, mpv_cmd: str, pipe: str, *, tracks, resolve, root: str,
+			ipc_timeout: float = 2.0, prefetch: int = 2, warmer=None, call_timeout: float = 10.0, features=None):
+		self.id = zid
+		self.mpv_cmd = mpv_cmd
+		self.pipe = pipe
+		self.root = root
+		self.prefetch = prefetch
+		self.call_timeout = call_timeout
+		self._tracks = tracks        # f(force=False) -> Playlist (曲库共享)
+		self._resolve = resolve      # f(rel) -> 绝对路径, 非法时抛 ValueError
+		self._warmer = warmer
+		self.on_track = []           # f(zone, rel): 当前曲目变化后在分区线程中调用, 可修改 zone.meta
+		self.on_status = []          # f(zone, payload): 每次推送状态后调用 (分区线程或 IPC 读线程), 需尽快返回
+		self.proc = None             # 本分区启动的 mpv 进程 (外部已运行时为 None)
+		# 与 mpv 的长连接及由推送维护的状态缓存, /status 只读内存
+		self.ipc = MpvIpcClient(pipe, timeout=ipc_timeout)
+		self.state = PlaybackState()
+		self.state.attach(self.ipc)
+		self.hub = EventHub()
+		# ---- 以下只在分区线程中修改 ----
+		self.playlist = Playlist()
+		self.index = -1
+		self.meta = {}               # 当前播放信息, 仅内存
+		self.shuffle = False
+		self.shuffler = ShuffleEngine()
+		self.autodj = False          # 自动 DJ: 按音频特征选下一首最相似且本轮未播放的曲目 (与随机互斥)
+		self.dj = AutoDJ(features) if features is not None else None
+		self.skip = None             # 可选 f(rel) -> bool: 下一首/随机时跳过 (如重复曲目)
+		self.autoplay = False        # 空闲时自动从第一首开始 (首页打开或点播后启用)
+		self.user_queue = []         # 用户排入的曲目 (rel), 优先于列表顺序/随机排列播放
+		self._queued = []            # 已追加到 mpv 播放列表、排在当前曲目之后的 rel
+		self._last_load_ts = 0.0     # 最近一次 loadfile 的 monotonic 时间, 用于丢弃过期的结束事件
+		self._last_end_ts = 0.0
+		self._pending_cmds = None    # 批处理中收集的 mpv 命令, 结束时合并后一次写入
+		self._undo = None            # 批处理中已提前生效的状态变化的撤销函数, 写入失败时逆序执行
+		# ---- actor ----
+		self._inbox = queue.Queue()
+		self._thread = None
+		self._thread_lock = threading.Lock()
+		self._stop = False
+		self.stats = {'commands': 0, 'timeouts': 0, 'errors': 0, 'wait_ms_total': 0.0, 'wait_ms_max': 0.0,
+			'run_ms_total': 0.0, 'run_ms_max': 0.0}
+		self.snapshot = MappingProxyType({'index': -1, 'meta': MappingProxyType({}), 'shuffle': False, 'autodj': False,
+			'total': 0, 'queue': ()})
+		self._eof_ts = None          # 自动切歌计时: 最近一次 eof 的时间 (事件在 IPC 读线程中取时间戳)
+		self._eof_gapless = False
+		self._restore_t0 = None      # restore() 的计时起点, 恢复后第一次开始播放时记录耗时
+		self._start_override = False # 为恢复位置设置了 mpv 的 start 选项, 开始播放后需要复原
+		self._volume_lock = threading.Lock()
+		self._volume_pending = None  # [最新音量, Future]: 尚未写入 mpv 的合并音量设置
+		self._m_wait = ZONE_COMMAND.labels(zid, 'wait')
+		self._m_run = ZONE_COMMAND.labels(zid, 'run')
+		ZONE_QUEUE.labels(zid).set_function(self._inbox.qsize)
+		self.state.listeners.append(self.publish_status)
+		self.ipc.on_event.append(self._on_mpv_event)
+		self.ipc.on_connect.append(self._on_mpv_connect)
+
+	# ---------- actor ----------
+	def start(self):
+		with self._thread_lock:
+			if self._thread and self._thread.is_alive():
+				return
+			self._stop = False
+			self._thread = threading.Thread(target=self._run, daemon=True, name=f'zone-{self.id}')
+			self._thread.start()
+
+	def stop(self):
+		self._stop = True
+		self._inbox.put(None)
+		self.ipc.close()
+
+	def post(self, fn, *args):
+		"""排队执行 fn(*args), 不等待结果 (异常只记录日志)."""
+		self.start()
+		self._inbox.put((fn, args, None, time.perf_counter()))
+
+	def call(self, fn, *args, timeout: float = None):
+		"""在分区线程中执行 fn(*args) 并等待结果; 超时抛 ZoneBusy, fn 的异常原样抛出."""
+		if threading.current_thread() is self._thread:
+			return fn(*args)         # 已在分区线程中 (如 on_track 回调), 直接执行避免自锁
+		self.start()
+		fut = Future()
+		self._inbox.put((fn, args, fut, time.perf_counter()))
+		try:
+			return fut.result(self.call_timeout if timeout is None else timeout)
+		except FutureTimeout:
+			fut.cancel()             # 尚未开始执行的命令不再执行
+			self.stats['timeouts'] += 1
+			raise ZoneBusy(f'分区 {self.id} 忙, 请稍后重试')
+
+	def _run(self):
+		print(f'[INFO] 分区 {self.id} 播放线程已启动')
+		next_housekeep = time.monotonic()
+		while not self._stop:
+			wait = max(0.0, next_housekeep - time.monotonic())
+			try:
+				item = self._inbox.get(timeout=wait)
+			except queue.Empty:
+				item = False
+			if item:
+				self._execute(*item)
+			if time.monotonic() >= next_housekeep:
+				next_housekeep = time.monotonic() + HOUSEKEEP_INTERVAL
+				try:
+					self._housekeep()
+				except Exception as e:
+					print(f'[WARN] 分区 {self.id} 维护失败:', e)
+				self._publish_snapshot()
+
+	def _execute(self, fn, args, fut, t_submit):
+		if fut is not None and not fut.set_running_or_notify_cancel():
+			return                   # 调用方已超时放弃
+		t0 = time.perf_counter()
+		try:
+			result = fn(*args)
+		except Exception as e:
+			self.stats['errors'] += 1
+			if fut is not None:
+				fut.set_exception(e)
+			else:
+				print(f'[WARN] 分区 {self.id} 执行 {getattr(fn, "__name__", fn)} 失败:', e)
+		else:
+			if fut is not None:
+				fut.set_result(result)
+		t1 = time.perf_counter()
+		st = self.stats
+		st['commands'] += 1
+		self._m_wait.observe(t0 - t_submit)
+		self._m_run.observe(t1 - t0)
+		wait_ms, run_ms = (t0 - t_submit) * 1000, (t1 - t0) * 1000
+		st['wait_ms_total'] += wait_ms
+		st['run_ms_total'] += run_ms
+		st['wait_ms_max'] = max(st['wait_ms_max'], wait_ms)
+		st['run_ms_max'] = max(st['run_ms_max'], run_ms)
+		self._publish_snapshot()
+
+	def _publish_snapshot(self):
+		self.snapshot = MappingProxyType({
+			'index': self.index,
+			'meta': MappingProxyType(dict(self.meta)),
+			'shuffle': self.shuffle,
+			'autodj': self.autodj,
+			'total': len(self.playlist),
+			'queue': tuple(self.user_queue),
+		})
+
+	def latency(self) -> dict:
+		"""命令排队等待与执行的平均/最大耗时 (毫秒)."""
+		st = self.stats
+		n = st['commands'] or 1
+		return {
+			'commands': st['commands'], 'timeouts': st['timeouts'], 'errors': st['errors'],
+			'queue': self._inbox.qsize(),
+			'wait_ms_avg': round(st['wait_ms_total'] / n, 3), 'wait_ms_max': round(st['wait_ms_max'], 3),
+			'run_ms_avg': round(st['run_ms_total'] / n, 3), 'run_ms_max': round(st['run_ms_max'], 3),
+		}
+
+	# ---------- 对外命令 (任意线程调用) ----------
+	def ensure_auto_thread(self):
+		"""启用自动播放: 空闲时从第一首开始, 曲目结束后自动下一首."""
+		if self.autoplay:
+			self.start()
+		else:
+			self.post(self._cmd_autoplay, True)
+
+	def resume(self, rel=None, autoplay: bool = False):
+		"""接管已在运行的 mpv (多进程部署中换了 leader): 以 mpv 正在播放的曲目为准恢复状态;
+		mpv 已空闲时, 从 rel (上一个所有者最后播放的曲目) 的下一首继续."""
+		self.post(self._cmd_resume, rel, autoplay)
+
+	def restore(self, state: dict, t0: float = None):
+		"""按状态日志恢复 (进程重启/崩溃后): 曲目、播放位置、暂停、随机模式、音量与自动播放.
+		mpv 仍在播放已知曲目时 (只有本进程退出过) 直接接管, 不打断播放. t0 为计时起点 (monotonic)."""
+		self.post(self._cmd_restore, dict(state), t0)
+
+	def play(self, rel: str) -> dict:
+		return self.call(self._cmd_play, rel)
+
+	def next(self) -> dict:
+		return self.call(self._cmd_step, self._next_track, '没有下一首')
+
+	def prev(self) -> dict:
+		return self.call(self._cmd_step, self._prev_track, '没有上一首')
+
+	def toggle_shuffle(self, seed=None, reseed: bool = False) -> bool:
+		return self.call(self._cmd_shuffle, seed, reseed)
+
+	def set_autodj(self, on=None) -> bool:
+		"""开启/关闭自动 DJ (on 为 None 时切换); 特征索引尚未建立时按原有顺序播放, 建立后自动生效."""
+		return self.call(self._cmd_autodj, on)
+
+	def volume(self, value: float = None):
+		"""value 为 None 时返回当前音量 (优先读推送缓存), 否则设置并返回新值.
+
+		VOLUME_COALESCE 秒内的多次设置合并为一次写入, 窗口内的调用方都返回最终生效的值."""
+		if value is None:
+			cur = self.state.get('volume')
+			return cur if cur is not None else self.call(self._cmd_volume, None)
+		with self._volume_lock:
+			pending = self._volume_pending
+			if pending is None:
+				pending = self._volume_pending = [value, Future()]
+				timer = threading.Timer(VOLUME_COALESCE, self.post, args=(self._cmd_volume_flush,))
+				timer.daemon = True
+				timer.start()
+			else:
+				pending[0] = value
+				VOLUME_COALESCED.labels(self.id).inc()
+		try:
+			return pending[1].result(VOLUME_COALESCE + self.call_timeout)
+		except FutureTimeout:
+			self.stats['timeouts'] += 1
+			raise ZoneBusy(f'分区 {self.id} 忙, 请稍后重试')
+
+	def batch(self, ops: list) -> dict:
+		"""在分区线程中按顺序执行一组操作 (期间不会插入其他命令), 产生的 mpv 命令合并后一次写入.
+
+		ops 为 [{'op': 'volume', 'value': 40}, {'op': 'play', 'path': rel}, ...], 见 _plan_op;
+		任一操作参数非法时整批不执行. 返回 {'results': [每个操作的结果], 'commands': 写入的命令数}."""
+		return self.call(self._cmd_batch, list(ops))
+
+	def playlist_view(self, force: bool = False):
+		"""(播放列表, 当前索引, 当前 rel); force=True 时先重新扫描曲库."""
+		return self.call(self._cmd_playlist, force)
+
+	def set_skip(self, pred):
+		self.post(self._cmd_skip, pred)
+
+	def library_changed(self, playlist, added=(), removed=()):
+		self.post(self._library_changed, playlist, added, removed)
+
+	def update_meta(self, rel: str, fields: dict):
+		"""当前曲目仍为 rel 时合并 fields 到 meta 并推送状态 (如异步解析出的标签)."""
+		self.post(self._cmd_update_meta, rel, fields)
+
+	def debug(self) -> dict:
+		return self.call(self._cmd_debug)
+
+	# ---------- 命令实现 (分区线程) ----------
+	def _require_mpv(self):
+		if not self.ensure_mpv():
+			raise ZoneError('mpv 未就绪')
+
+	def _cmd_play(self, rel: str) -> dict:
+		self._eof_ts = None          # 用户点播, 不计入自动切歌间隙
+		if not self.ensure_mpv():
+			raise ZoneError('mpv 启动失败')
+		plist = self.ensure_playlist()
+		# O(1) 哈希查找; 索引由监视器保持最新, 未知路径直接拒绝, 不触发扫描
+		if rel not in plist:
+			raise ZoneError('文件不在列表')
+		if not self._play_index(plist.index(rel)):
+			raise ZoneError('播放失败')
+		self.autoplay = True
+		return {'rel': rel, 'index': self.index, 'total': len(plist)}
+
+	def _cmd_step(self, step, error: str) -> dict:
+		self._eof_ts = None
+		self._require_mpv()
+		if not step():
+			raise ZoneError(error)
+		return {'rel': self.meta['rel'], 'index': self.index, 'total': len(self.playlist)}
+
+	def _cmd_shuffle(self, seed, reseed: bool) -> bool:
+		if reseed:
+			self.shuffle = True
+			self._shuffler().reseed(seed)
+		else:
+			self.shuffle = not self.shuffle
+			if self.shuffle:
+				self.shuffler.reset(self.playlist, self.meta.get('rel') if self.meta else None)
+		if self.shuffle:
+			self.autodj = False
+		self._requeue()
+		return self.shuffle
+
+	def _cmd_autodj(self, on) -> bool:
+		on = not self.autodj if on is None else bool(on)
+		if on and self.dj is None:
+			raise ZoneError('未启用音频特征, 无法使用自动 DJ')
+		if on and not self.autodj:
+			self.dj.reset(self.meta.get('rel') if self.meta else None)
+			self.shuffle = False
+		self.autodj = on
+		self._requeue()
+		return self.autodj
+
+	def _cmd_autoplay(self, on: bool):
+		self.autoplay = on
+		if on:
+			self._housekeep()        # 不必等到下一次定期维护才开始播放
+
+	def _cmd_resume(self, rel, autoplay: bool):
+		self.autoplay = self.autoplay or autoplay
+		if not rel or not self.ensure_mpv():
+			return
+		plist = self.ensure_playlist()
+		path = self.get('path')
+		cur = os.path.relpath(path, self.root).replace('\\', '/') if path else None
+		if cur in plist:
+			self._last_load_ts = time.monotonic()
+			self._set_current(plist.index(cur), cur, path)
+			self._publish_snapshot()
+			self.publish_status()
+			self.commands(self._queue_cmds())
+		elif rel in plist:
+			self._set_current(plist.index(rel), rel, self._resolve(rel))
+			if not (self.autoplay and self._next_track()):
+				self._publish_snapshot()
+				self.publish_status()
+
+	def _cmd_restore(self, state: dict, t0: float = None):
+		self._restore_t0 = t0
+		self.autoplay = self.autoplay or bool(state.get('autoplay'))
+		rel = state.get('rel')
+		if not rel or not self.ensure_mpv():
+			self._restore_t0 = None
+			return
+		plist = self.ensure_playlist()
+		if bool(state.get('shuffle')) != self.shuffle:
+			self._cmd_shuffle(None, False)
+		if bool(state.get('autodj')) != self.autodj and self.dj is not None:
+			self._cmd_autodj(bool(state.get('autodj')))
+		path = self.get('path')
+		cur = os.path.relpath(path, self.root).replace('\\', '/') if path else None
+		if cur in plist:
+			# mpv 没有随本进程退出, 仍在播放: 以它为准, 位置与音量保持不变
+			self._cmd_resume(rel, False)
+			self._resume_done()
+			return
+		if rel not in plist:
+			print(f'[WARN] 分区 {self.id} 上次播放的曲目已不在曲库: {rel}')
+			self._restore_t0 = None
+			return
+		# 音量/暂停/起始位置与 loadfile 合并为一次写入; start 选项在开始播放后复原 (见 _on_mpv_event)
+		self._pending_cmds, self._undo = [], []
+		try:
+			if state.get('volume') is not None:
+				self.commands([['set_property', 'volume', state['volume']]])
+			self.commands([['set_property', 'pause', bool(state.get('paused'))]])
+			pos = state.get('pos')
+			if isinstance(pos, (int, float)) and pos > 0:
+				self.commands([['set_property', 'start', f'{pos:.3f}']])
+				self._start_override = True
+			self._play_index(plist.index(rel))
+		finally:
+			self._flush_pending()
+		print(f'[INFO] 分区 {self.id} 恢复播放: {rel} @ {pos or 0:.1f}s')
+
+	def _resume_done(self, ts: float = None):
+		t0, self._restore_t0 = self._restore_t0, None
+		if t0 is not None:
+			dt = (ts or time.monotonic()) - t0
+			RESUME_SECONDS.labels(self.id).set(dt)
+			print(f'[INFO] 分区 {self.id} 已恢复播放, 距进程启动 {dt:.3f}s')
+
+	def _cmd_volume_flush(self):
+		with self._volume_lock:
+			value, fut = self._volume_pending
+			self._volume_pending = None
+		try:
+			fut.set_result(self._cmd_volume(value))
+		except Exception as e:
+			fut.set_exception(e)
+
+	def _cmd_volume(self, value):
+		self._require_mpv()
+		if value is None:
+			return self.get('volume')
+		if not self.set('volume', value):
+			raise ZoneError('设置失败')
+		return value
+
+	def _cmd_batch(self, ops: list) -> dict:
+		plan = [self._plan_op(op) for op in ops]    # 先校验全部操作, 非法时没有任何副作用
+		self._require_mpv()
+		self._eof_ts = None
+		self._pending_cmds, self._undo = [], []
+		results, n = [], 0
+		try:
+			for fn, args in plan:
+				results.append(fn(*args))
+		finally:
+			# 中途失败时也写入已执行部分的命令, 使 mpv 与分区状态保持一致
+			n = self._flush_pending()
+			BATCH_COMMANDS.labels(self.id).observe(n)
+		return {'results': results, 'commands': n}
+
+	def _flush_pending(self) -> int:
+		"""结束批处理: 合并并写入收集的命令; 写入失败时逆序撤销已提前生效的状态变化后再抛出."""
+		cmds, self._pending_cmds = coalesce_commands(self._pending_cmds), None
+		undo, self._undo = self._undo or [], None
+		if cmds:
+			try:
+				self.commands(cmds)
+			except Exception:
+				for f in reversed(undo):
+					f()
+				if undo:
+					self._publish_snapshot()
+					self.publish_status()
+				raise
+		return len(cmds)
+
+	def _plan_op(self, op):
+		"""校验一个批处理操作, 返回 (执行函数, 参数)."""
+		if not isinstance(op, dict):
+			raise ZoneError('操作格式非法')
+		kind = op.get('op')
+		if kind in ('play', 'enqueue'):
+			rel = str(op.get('path') or '').strip()
+			if rel not in self.ensure_playlist():
+				raise ZoneError(f'文件不在列表: {rel}')
+			return (self._op_play if kind == 'play' else self._op_enqueue), (rel,)
+		if kind in ('next', 'prev'):
+			return self._op_step, (kind,)
+		if kind == 'shuffle':
+			value = op.get('value')
+			return self._op_shuffle, (None if value is None else bool(value), op.get('seed'))
+		if kind == 'autodj':
+			value = op.get('value')
+			if self.dj is None and value is not False:
+				raise ZoneError('未启用音频特征, 无法使用自动 DJ')
+			return self._cmd_autodj, (None if value is None else bool(value),)
+		if kind == 'pause':
+			return self._op_set, ('pause', bool(op.get('value', True)))
+		if kind not in ('volume', 'seek'):
+			raise ZoneError(f'未知操作: {kind}')
+		try:
+			value = float(op.get('value'))
+		except (TypeError, ValueError):
+			raise ZoneError(f'{kind}: value 必须是数字')
+		if kind == 'volume':
+			return self._op_set, ('volume', max(0.0, min(130.0, value)))
+		mode = op.get('mode') or 'absolute'
+		if mode not in SEEK_MODES:
+			raise ZoneError(f'seek: 未知 mode {mode}')
+		return self._op_seek, (value, mode)
+
+	def _op_play(self, rel: str) -> dict:
+		if not self._play_index(self.playlist.index(rel)):
+			raise ZoneError('播放失败')
+		self.autoplay = True
+		return {'rel': rel, 'index': self.index}
+
+	def _op_enqueue(self, rel: str) -> dict:
+		self.user_queue.append(rel)
+		if self.index < 0:
+			# 空闲时直接开始播放
+			self.autoplay = True
+			self._next_track()
+		else:
+			self._requeue()
+		return {'queued': len(self.user_queue)}
+
+	def _op_step(self, kind: str) -> dict:
+		moved = self._next_track() if kind == 'next' else self._prev_track()
+		return {'rel': self.meta.get('rel') if self.meta else None, 'index': self.index, 'moved': moved}
+
+	def _op_shuffle(self, on, seed) -> bool:
+		if seed is not None:
+			return self._cmd_shuffle(seed, True)
+		if on is None or on != self.shuffle:
+			return self._cmd_shuffle(None, False)
+		return self.shuffle
+
+	def _op_set(self, prop: str, value):
+		self.commands([['set_property', prop, value]])
+		return value
+
+	def _op_seek(self, value: float, mode: str):
+		if self.index < 0:
+			return None              # 没有正在播放的曲目
+		self.commands([['seek', value, mode]])
+		return value
+
+	def _cmd_playlist(self, force: bool):
+		plist = self.ensure_playlist(force)
+		return plist, self.index, self.meta.get('rel') if self.meta else None
+
+	def _cmd_skip(self, pred):
+		self.skip = pred
+		self._requeue()
+
+	def _cmd_update_meta(self, rel: str, fields: dict):
+		if self.meta and self.meta.get('rel') == rel:
+			self.meta.update(fields)
+			self._publish_snapshot()
+			self.publish_status()
+
+	def _cmd_debug(self) -> dict:
+		return {
+			'zone': self.id,
+			'MPV_CMD': self.mpv_cmd,
+			'PIPE_NAME': self.pipe,
+			'pipe_exists': self.pipe_exists(),
+			'ipc': self.ipc.stats,
+			'playlist_len': len(self.playlist),
+			'current_index': self.index,
+			'shuffle': self.shuffle,
+			'autodj': self.autodj,
+			'autodj_ready': self._dj_active(),
+			'actor': self.latency(),
+		}
+
+	# ---------- mpv 进程 & IPC ----------
+	def pipe_exists(self) -> bool:
+		"""已有连接直接返回 True, 否则尝试建立长连接."""
+		return self.ipc.connect()
+
+	def _wait_pipe(self, timeout=6.0):
+		end = time.time() + timeout
+		while time.time() < end:
+			if self.ipc.connect():
+				return True
+			time.sleep(0.15)
+		return False
+
+	def ensure_mpv(self) -> bool:
+		if not self.mpv_cmd:
+			print(f'[WARN] 分区 {self.id} 未配置 MPV_CMD')
+			return False
+		if self.pipe_exists():
+			return True
+		print(f'[INFO] 分区 {self.id} 尝试启动 mpv: {self.mpv_cmd}')
+		MPV_STARTS.labels(self.id).inc()
+		try:
+			self.proc = subprocess.Popen(self.mpv_cmd, shell=True)
+		except Exception as e:
+			print('[ERROR] 启动 mpv 进程失败:', e)
+			return False
+		ready = self._wait_pipe()
+		if not ready:
+			print('[ERROR] 等待 mpv 管道超时: ', self.pipe)
+		return ready
+
+	def commands(self, cmds):
+		# 多条命令一次写入，失败时自动尝试启动一次再重试
+		if self._pending_cmds is not None:
+			self._pending_cmds.extend(cmds)      # 批处理中: 先收集, 结束时合并写入
+			return
+		try:
+			self.ipc.command_many(cmds)
+		except IpcError as e:
+			print(f'[WARN] 分区 {self.id} 首次写入失败: {e}. 尝试 ensure_mpv 后重试...')
+			if self.ensure_mpv():
+				try:
+					self.ipc.command_many(cmds)
+					MPV_RETRIES.labels(self.id, 'ok').inc()
+					return
+				except IpcError as e2:
+					MPV_RETRIES.labels(self.id, 'failed').inc()
+					raise RuntimeError(f'MPV 管道写入失败(重试): {e2}')
+			MPV_RETRIES.labels(self.id, 'no_mpv').inc()
+			raise RuntimeError(f'MPV 管道写入失败: {e}')
+
+	def get(self, prop: str):
+		"""同步查询属性, 超时或失败返回 None."""
+		try:
+			resp = self.ipc.request(['get_property', prop])
+		except IpcError:
+			return None
+		return resp.get('data') if resp else None
+
+	def set(self, prop: str, value) -> bool:
+		try:
+			self.commands([['set_property', prop, value]])
+			return True
+		except Exception:
+			return False
+
+	# ---------- 播放列表 ----------
+	def ensure_playlist(self, force: bool = False):
+		"""确保播放列表存在; force=True 时重新扫描曲库."""
+		if force or not self.playlist:
+			self.playlist = self._tracks(force)
+		return self.playlist
+
+	def _library_changed(self, playlist, added=(), removed=()):
+		"""曲库变化: playlist 为索引发布的新快照 (旧对象不会被修改), 换上新快照并让 index 继续指向同一曲目."""
+		old, self.playlist = self.playlist, playlist
+		if self.shuffler.source is old and (added or removed):
+			self.shuffler.apply(added, removed)
+			self.shuffler.rebind(playlist)
+		rel = self.meta.get('rel') if self.meta else None
+		if rel:
+			# 当前曲目被删除时指向其前一首, 使"下一首"从原位置继续
+			self.index = playlist.index(rel) if rel in playlist else playlist.bisect(rel) - 1
+			self.meta['index'] = self.index
+		if removed and self.user_queue:
+			self.user_queue = [r for r in self.user_queue if r in playlist]
+
+	def _shuffler(self):
+		"""返回与当前播放列表对应的随机引擎; 播放列表对象被整体替换时重新开始排列."""
+		if self.shuffler.source is not self.playlist:
+			self.shuffler.reset(self.playlist, self.meta.get('rel') if self.meta else None)
+		self.shuffler.skip = self.skip
+		return self.shuffler
+
+	# ---------- 无缝衔接: 预先排入 mpv 内部播放列表 ----------
+	def _upcoming(self, n: int):
+		"""接下来将要播放的 n 首 (rel); 随机模式下即排列中预抽的部分."""
+		plist = self.playlist
+		if n <= 0 or self.index < 0 or not plist:
+			return []
+		if self.user_queue:
+			head = self.user_queue[:n]
+			return head + [r for r in self._upcoming_base(n) if r not in head][:n - len(head)]
+		return self._upcoming_base(n)
+
+	def _dj_active(self) -> bool:
+		return self.autodj and self.dj is not None and self.dj.ready()
+
+	def _upcoming_base(self, n: int):
+		plist = self.playlist
+		if self._dj_active():
+			self.dj.skip = self.skip
+			return self.dj.peek(n, plist)
+		if self.shuffle and len(plist) > 1:
+			return self._shuffler().peek(n)
+		if self.skip is None:
+			return plist[self.index+1: self.index+1+n]
+		out = []
+		for i in range(self.index + 1, len(plist)):
+			rel = plist[i]
+			if not self.skip(rel):
+				out.append(rel)
+				if len(out) >= n:
+					break
+		return out
+
+	def _queue_cmds(self):
+		"""生成刷新 mpv 后续队列的命令: 清掉当前曲目以外的条目, 再追加接下来的 prefetch 首."""
+		if self.prefetch <= 0:
+			return []
+		nxt = []
+		for rel in self._upcoming(self.prefetch):
+			try:
+				nxt.append((rel, self._resolve(rel)))
+			except ValueError:
+				continue
+		self._queued = [rel for rel, _ in nxt]
+		if nxt and self._warmer is not None:
+			self._warmer.warm(nxt[0][1])
+		return [['playlist-clear']] + [['loadfile', p, 'append'] for _, p in nxt]
+
+	def _requeue(self):
+		"""后续顺序变化 (随机/跳过重复切换) 后重排 mpv 中的预加载队列."""
+		if self.index >= 0 and self.ipc.connected:
+			try:
+				self.commands(self._queue_cmds())
+			except Exception:
+				pass
+
+	# ---------- 切歌 ----------
+	def _set_current(self, idx: int, rel: str, abs_file: str):
+		if self.user_queue and self.user_queue[0] == rel:
+			self.user_queue.pop(0)
+		self.index = idx
+		self.meta = {'abs_path': abs_file, 'rel': rel, 'index': idx, 'ts': int(time.time())}
+		if self.shuffle:
+			self._shuffler().set_current(rel)
+		if self.autodj and self.dj is not None:
+			self.dj.set_current(rel)
+		for f in self.on_track:
+			f(self, rel)
+
+	def _play_index(self, idx: int) -> bool:
+		plist = self.playlist
+		if idx < 0 or idx >= len(plist):
+			return False
+		rel = plist[idx]
+		abs_file = self._resolve(rel)
+		self._last_load_ts = time.monotonic()
+		if self._queued and self._queued[0] == rel:
+			# 下一首已在 mpv 播放列表中 (已打开/已预读), 直接切换
+			cmds = [['playlist-next', 'force']]
+		else:
+			cmds = [['loadfile', abs_file, 'replace']]
+		prev = (self.index, self.meta)
+		self._set_current(idx, rel, abs_file)
+
+		def undo():
+			self.index, self.meta = prev
+		if self._undo is not None:
+			self._undo.append(undo)      # 批处理中命令只是被收集, 真正写入 (及失败) 发生在 _flush_pending
+		try:
+			# loadfile/playlist-next 与刷新队列的命令合并为一次写入
+			self.commands(cmds + self._queue_cmds())
+		except Exception:
+			undo()
+			raise
+		self._publish_snapshot()
+		self.publish_status()
+		return True
+
+	def _next_track(self) -> bool:
+		if self.user_queue:
+			return self._play_index(self.playlist.index(self.user_queue[0]))
+		if self.index < 0:
+			return False
+		if (self.shuffle and len(self.playlist) > 1) or self.skip is not None or self._dj_active():
+			# 随机模式 / 自动 DJ / 跳过重复: 与 mpv 中已排队的曲目一致
+			nxt = self._upcoming(1)
+			return self._play_index(self.playlist.index(nxt[0])) if nxt else False
+		nxt = self.index + 1
+		if nxt >= len(self.playlist):
+			return False
+		return self._play_index(nxt)
+
+	def _prev_track(self) -> bool:
+		if self.index < 0:
+			return False
+		if self._dj_active():
+			rel = self.dj.prev()
+			return self._play_index(self.playlist.index(rel)) if rel in self.playlist else False
+		if self.shuffle and len(self.playlist) > 1:
+			# 随机模式: 沿历史回到上一首真正播放过的曲目
+			rel = self._shuffler().prev()
+			if rel is None:
+				return False
+			return self._play_index(self.playlist.index(rel))
+		prv = self.index - 1
+		if prv < 0:
+			return False
+		return self._play_index(prv)
+
+	# ---------- mpv 事件 ----------
+	def _on_mpv_event(self, ev: dict):
+		"""IPC 读线程回调: 只筛选并排队 (带上事件时间), 不读写分区状态; 状态变化全部在分区线程中进行."""
+		name = ev.get('event')
+		now = time.monotonic()
+		if name == 'playback-restart':
+			self.post(self._on_playback_restart, now)
+		elif name == 'end-file':
+			# reason: eof(正常结束) / error(无法播放) 需要切歌; stop/quit/redirect 为主动替换, 忽略
+			if ev.get('reason') in ('eof', 'error'):
+				self.post(self._on_end_file, ev.get('reason'), now)
+		elif name == 'property-change' and ev.get('name') == 'path':
+			self.post(self._on_mpv_path, ev.get('data'))
+		elif name == 'property-change' and ev.get('name') == 'eof-reached' and ev.get('data') is True:
+			# --keep-open=yes 时不会产生 end-file, 只有 eof-reached 变为 true
+			self.post(self._on_track_end, 'eof-reached', now)
+		elif name == 'property-change' and ev.get('name') == 'idle-active' and ev.get('data') is True:
+			self.post(self._on_track_end, 'idle', now)
+
+	def _on_playback_restart(self, ts: float):
+		if self._start_override:
+			self._start_override = False
+			self.set('start', 'none')
+		if self._restore_t0 is not None:
+			self._resume_done(ts)
+		if self._eof_ts is not None:
+			# 间隙按两个事件在读线程中的时间计算, 不含在队列中等待的时间
+			ADVANCE_GAP.labels(self.id, 'true' if self._eof_gapless else 'false').observe(ts - self._eof_ts)
+			self._eof_ts = None
+
+	def _on_end_file(self, reason: str, ts: float):
+		if self.autoplay:
+			self._eof_ts, self._eof_gapless = ts, bool(self._queued)
+		self._on_track_end(reason, ts)
+
+	def _on_mpv_connect(self, client):
+		# 每次(重新)连接都要重新订阅, 订阅关系随连接失效
+		client.command(['observe_property', 1, 'eof-reached'])
+		client.command(['observe_property', 2, 'idle-active'])
+		client.command(['observe_property', 3, 'path'])
+
+	def _on_mpv_path(self, path):
+		"""mpv 自行切到了已排队的下一首 (无缝衔接): 同步 index/meta 并补充队列."""
+		if not path:
+			return
+		rel = os.path.relpath(path, self.root).replace('\\', '/')
+		if self.meta and self.meta.get('rel') == rel:
+			return
+		if rel not in self._queued or rel not in self.playlist:
+			return       # 不是我们排入的曲目 (外部加载等), 不接管
+		self._set_current(self.playlist.index(rel), rel, path)
+		self._last_end_ts = time.monotonic()
+		self._publish_snapshot()
+		self.publish_status()
+		try:
+			self.commands(self._queue_cmds())
+		except Exception as e:
+			print('[WARN] 补充播放队列失败:', e)
+
+	def _on_track_end(self, reason: str, ts: float):
+		if ts < self._last_load_ts:
+			return       # 结束事件之后已有新的播放指令 (用户点播/切歌)
+		if reason in ('eof', 'error') and self._queued:
+			return       # mpv 播放列表中还有排队曲目, 由 mpv 自行衔接, 见 _on_mpv_path
+		if reason == 'idle':
+			# 兜底: mpv 空闲但本次加载尚未收到结束事件 (如 mpv 被重启)
+			if not (self._last_load_ts > self._last_end_ts and ts - self._last_load_ts > 1.0):
+				return
+		self._last_end_ts = ts
+		if not self.autoplay:
+			return
+		print(f'[INFO] 分区 {self.id} 当前曲目已结束({reason})，尝试播放下一首...')
+		if not self._next_track():
+			self._eof_ts = None
+			print('[INFO] 已到播放列表末尾')
+
+	# ---------- 自动播放 & 监管 ----------
+	def _housekeep(self):
+		"""定期执行: 空闲时自动开始播放; 正在播放但 mpv 连接丢失 (进程退出) 时重启并从当前曲目继续."""
+		if not self.autoplay:
+			return
+		if self.index < 0:
+			# 没有正在播放的，尝试自动加载并播第一首
+			self.ensure_playlist()
+			if self.playlist:
+				self._play_index(0)
+			return
+		# 保持长连接以接收事件; 已连接时不产生任何流量
+		if self.ipc.connect():
+			return
+		print(f'[WARN] 分区 {self.id} 的 mpv 已断开, 尝试重启')
+		if self.ensure_mpv():
+			self._queued = []
+			self._play_index(self.index)
+
+	# ---------- 状态 (只读快照, 任意线程) ----------
+	def status_payload(self) -> dict:
+		# 纯内存读取: 属性由 mpv 推送, time 在本地插值, 不产生 IPC 往返
+		mpv_info = self.state.snapshot() if self.ipc.connected else {}
+		snap = self.snapshot
+		return {'status': 'OK', 'zone': self.id, 'playing': dict(snap['meta']), 'queue': list(snap['queue']), 'mpv': mpv_info}
+
+	def publish_status(self, *_):
+		payload = self.status_payload()
+		self.hub.publish('status', payload)
+		for f in self.on_status:
+			f(self, payload)
+
+	def tick_status(self):
+		# 仅在播放中推送进度; 暂停/停止时状态变化已由事件触发推送
+		if self.snapshot['meta'] and self.state.get('pause') is False:
+			self.publish_status()
+
+	def info(self) -> dict:
+		snap = self.snapshot
+		return {
+			'id': self.id,
+			'connected': self.ipc.connected,
+			'playing': snap['meta'].get('rel'),
+			'shuffle': snap['shuffle'],
+			'autodj': snap['autodj'],
+			'pid': self.proc.pid if self.proc is not None and self.proc.poll() is None else None,
+			'actor': self.latency(),
+		}
+
+
+class ZoneManager:
+	"""按 id 管理分区; 第一个加入的分区为默认分区 (请求未指定 zone 时使用)."""
+
+	def __init__(self):
+		self.zones = {}
+		self.default = None
+
+	def add(self, zone: Zone):
+		self.zones[zone.id] = zone
+		if self.default is None:
+			self.default = zone.id
+		return zone
+
+	def get(self, zid=None):
+		"""zid 为空时返回默认分区; 未知 id 返回 None."""
+		return self.zones.get(zid or self.default)
+
+	def __iter__(self):
+		return iter(list(self.zones.values()))
+
+	def __len__(self):
+		return len(self.zones)
@@ -0,0 +1,104 @@
+"""带索引的播放列表.
+
+曲目按小写排序存放, 另维护:
+  - 小写键的平行列表, 二分查找不必每次调用 str.lower
+  - rel 集合, O(1) 判断是否存在
+  - rel -> 索引 的哈希表, O(1) 定位; 批量增删后统一重建一次
+
+已发布 (被分区线程读取) 的对象不再修改: 曲库变化时由 patched() 复制出新对象再整体替换引用 (copy-on-write).
+add/remove/apply 只用于尚未共享的对象.
+"""
+import bisect
+
+
+class Playlist:
+	def __init__(self, items=()):
+		self._items = sorted(items, key=str.lower)
+		self._keys = [r.lower() for r in self._items]
+		self._members = set(self._items)
+		self._pos = None             # rel -> 索引, 惰性构建 (构建完成后才赋值, 并发读取者最多重复构建一次)
+
+	# ---------- 序列协议 ----------
+	def __len__(self):
+		return len(self._items)
+
+	def __bool__(self):
+		return bool(self._items)
+
+	def __iter__(self):
+		return iter(self._items)
+
+	def __getitem__(self, i):
+		"""整数下标返回 rel; 切片返回普通 list (供分页直接序列化)."""
+		return self._items[i]
+
+	def __contains__(self, rel):
+		return rel in self._members
+
+	def to_list(self) -> list:
+		"""底层列表 (不复制), 调用方不得修改."""
+		return self._items
+
+	# ---------- 查找 ----------
+	def index(self, rel: str) -> int:
+		"""O(1) 返回 rel 的索引; 不存在时抛 ValueError."""
+		if rel not in self._members:
+			raise ValueError(rel)
+		if self._pos is None:
+			self._pos = {r: i for i, r in enumerate(self._items)}
+		return self._pos[rel]
+
+	def bisect(self, rel: str) -> int:
+		"""rel 按排序规则应处的位置 (已存在时即其索引)."""
+		key = rel.lower()
+		i = bisect.bisect_left(self._keys, key)
+		j = i
+		while j < len(self._keys) and self._keys[j] == key:
+			if self._items[j] == rel:
+				return j
+			j += 1
+		return i
+
+	# ---------- 修改 ----------
+	def add(self, rel: str) -> int:
+		"""有序插入: O(log n) 定位 + 一次 memmove. 已存在时返回原索引."""
+		if rel in self._members:
+			return self.index(rel)
+		key = rel.lower()
+		i = bisect.bisect_right(self._keys, key)
+		self._items.insert(i, rel)
+		self._keys.insert(i, key)
+		self._members.add(rel)
+		self._pos = None
+		return i
+
+	def remove(self, rel: str) -> bool:
+		if rel not in self._members:
+			return False
+		i = self.bisect(rel)
+		del self._items[i]
+		del self._keys[i]
+		self._members.discard(rel)
+		self._pos = None
+		return True
+
+	def patched(self, added=(), removed=()) -> 'Playlist':
+		"""返回应用了增删的新对象 (哈希表已建好), 自身不变."""
+		new = Playlist.__new__(Playlist)
+		new._items = list(self._items)
+		new._keys = list(self._keys)
+		new._members = set(self._members)
+		new._pos = None
+		new.apply(added, removed)
+		if new._pos is None:
+			new._pos = {r: i for i, r in enumerate(new._items)}
+		return new
+
+	def apply(self, added=(), removed=()):
+		"""批量增删 (只用于尚未共享的对象), 结束后重建一次哈希表."""
+		for rel in removed:
+			self.remove(rel)
+		for rel in added:
+			self.add(rel)
+		if added or removed:
+			self._pos = {r: i for i, r in enumerate(self._items)}
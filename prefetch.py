@@ -0,0 +1,59 @@
+"""预热系统页缓存: 后台顺序读取即将播放的文件.
+
+网络共享 (SMB) 上冷打开一个文件再开始解码会有明显停顿; 提前把下一首读一遍,
+mpv 真正打开时数据已在本机缓存中. 支持 posix_fadvise 的平台只发 WILLNEED 提示.
+"""
+import os, threading, time
+
+
+class PageCacheWarmer:
+	def __init__(self, max_bytes: int = 64 << 20, chunk: int = 1 << 20, pause: float = 0.005):
+		self.max_bytes = max_bytes
+		self.chunk = chunk
+		self.pause = pause           # 每块之间稍作停顿, 避免与当前播放抢带宽
+		self._cond = threading.Condition()
+		self._pending = None
+		self._last = None
+		self._thread = None
+		self.warmed = 0              # 已预热的字节数 (统计)
+
+	def warm(self, path: str):
+		"""请求预热 path; 只保留最新的一个请求, 重复请求同一文件直接忽略."""
+		if not path or path == self._last:
+			return
+		with self._cond:
+			self._pending = path
+			if self._thread is None or not self._thread.is_alive():
+				self._thread = threading.Thread(target=self._run, daemon=True)
+				self._thread.start()
+			self._cond.notify()
+
+	def _run(self):
+		while True:
+			with self._cond:
+				while self._pending is None:
+					self._cond.wait()
+				path, self._pending = self._pending, None
+			self._last = path
+			try:
+				self._read(path)
+			except OSError as e:
+				print(f'[WARN] 预读失败 {path}: {e}')
+
+	def _read(self, path: str):
+		with open(path, 'rb', buffering=0) as f:
+			if hasattr(os, 'posix_fadvise'):
+				os.posix_fadvise(f.fileno(), 0, self.max_bytes, os.POSIX_FADV_WILLNEED)
+				return
+			buf = bytearray(self.chunk)
+			view = memoryview(buf)
+			total = 0
+			while total < self.max_bytes:
+				if self._pending is not None:
+					return           # 有更新的请求, 放弃当前文件
+				n = f.readinto(view)
+				if not n:
+					break
+				total += n
+				self.warmed += n
+				time.sleep(self.pause)
@@ -0,0 +1,67 @@
+"""并行目录遍历.
+
+网络共享 (SMB) 上每次 stat/listdir 都是一次往返, 串行遍历的耗时几乎全是等待;
+这里把各目录的访问分发到有界线程池, 同时在途的请求数即 workers.
+单个目录超过 dir_timeout 秒未返回时放弃等待 (线程无法强制中止, 结果到达后被丢弃),
+由调用方决定如何处理该子树. 遍历过程中每完成一个目录就回调一次, 调用方可以边扫边发布.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class ParallelScanner:
+	def __init__(self, workers: int = 8, dir_timeout: float = 15.0):
+		self.workers = max(1, workers)
+		self.dir_timeout = dir_timeout
+		self.stats = {'scanning': False, 'dirs': 0, 'entries': 0, 'timeouts': 0, 'seconds': 0.0, 'rate': 0.0}
+
+	def run(self, roots, visit, handle, on_timeout=None) -> dict:
+		"""遍历以 roots 为起点的目录.
+
+		visit(rel) 在线程池中执行, 返回 (结果, 条目数);
+		handle(rel, 结果) 在调用线程中执行, 返回需要继续访问的子目录 rel;
+		on_timeout(rel) 在某目录超时被放弃时调用.
+		返回本次统计 (目录数、条目数、超时数、耗时、每秒条目数).
+		"""
+		t0 = time.time()
+		stats = self.stats = {'scanning': True, 'dirs': 0, 'entries': 0, 'timeouts': 0, 'seconds': 0.0, 'rate': 0.0}
+		started = {}                 # rel -> 开始执行的时间 (排队时间不计入超时)
+
+		def job(rel):
+			started[rel] = time.time()
+			return visit(rel)
+
+		pool = ThreadPoolExecutor(max_workers=self.workers)
+		pending = {}
+		try:
+			for rel in roots:
+				pending[pool.submit(job, rel)] = rel
+			while pending:
+				done, _ = wait(pending, timeout=min(1.0, self.dir_timeout), return_when=FIRST_COMPLETED)
+				for fut in done:
+					rel = pending.pop(fut)
+					result, entries = fut.result()
+					stats['dirs'] += 1
+					stats['entries'] += entries
+					for child in handle(rel, result):
+						pending[pool.submit(job, child)] = child
+				now = time.time()
+				for fut, rel in list(pending.items()):
+					t = started.get(rel)
+					if t is not None and now - t > self.dir_timeout and not fut.done():
+						del pending[fut]
+						stats['timeouts'] += 1
+						print(f'[WARN] 扫描目录超时, 保留旧索引: {rel or "/"}')
+						if on_timeout:
+							on_timeout(rel)
+				elapsed = now - t0
+				stats['seconds'] = round(elapsed, 3)
+				stats['rate'] = round(stats['entries'] / elapsed, 1) if elapsed > 0 else 0.0
+		finally:
+			# 超时的线程可能仍卡在 I/O 上, 不等待它们
+			pool.shutdown(wait=False, cancel_futures=True)
+			stats['scanning'] = False
+		elapsed = time.time() - t0
+		stats['seconds'] = round(elapsed, 3)
+		stats['rate'] = round(stats['entries'] / elapsed, 1) if elapsed > 0 else 0.0
+		return stats
@@ -0,0 +1,152 @@
+"""曲目路径搜索: 内存三元组 (trigram) 倒排索引.
+
+每个路径 (小写) 的三元组指向其文档 id, 倒排表为 array('I'), 20 万条路径约几十 MB.
+查询时取所有关键词中最稀有的三元组的倒排表作为候选, 再逐个做子串校验并打分.
+关键词都短于 3 个字符时无法用三元组, 改为在拼接后的大字符串上 str.find (C 层扫描).
+全部命中都参与排序 (heapq 只保留需要的前 k 条), 排在后面的更好结果不会因截断而丢失.
+增删为增量操作: 删除只打墓碑, 墓碑过多时整体重建.
+"""
+import time, heapq, bisect, threading
+from array import array
+
+
+
+def _grams(s: str):
+	return {s[i:i+3] for i in range(len(s) - 2)}
+
+
+class TrigramIndex:
+	def __init__(self):
+		self._lock = threading.RLock()
+		self._rels = []              # id -> rel (删除后为 None)
+		self._lower = []             # id -> 小写 rel
+		self._ids = {}               # rel -> id
+		self._post = {}              # gram -> array('I') of ids (递增)
+		self._dead = 0
+		self._blob = ''              # build 时全部小写路径以 '\n' 拼接, 供短关键词扫描
+		self._starts = array('I')    # 各文档在 _blob 中的起始偏移
+		self._pending = []           # 建索引期间到达的增删, 建完后重放
+		self.ready = False
+
+	def __len__(self):
+		return len(self._ids)
+
+	# ---------- 维护 ----------
+	def build(self, rels):
+		t0 = time.time()
+		rels = list(rels)
+		post = {}
+		lower = []
+		for i, rel in enumerate(rels):
+			low = rel.lower()
+			lower.append(low)
+			for g in _grams(low):
+				a = post.get(g)
+				if a is None:
+					a = post[g] = array('I')
+				a.append(i)
+		starts = array('I')
+		off = 0
+		for low in lower:
+			starts.append(off)
+			off += len(low) + 1
+		with self._lock:
+			self._rels = rels
+			self._lower = lower
+			self._ids = {r: i for i, r in enumerate(rels)}
+			self._post = post
+			self._dead = 0
+			self._blob = '\n'.join(lower)
+			self._starts = starts
+			self.ready = True
+			pending, self._pending = self._pending, []
+		for added, removed in pending:
+			self.apply(added, removed)
+		print(f'[INFO] 搜索索引已建立: {len(rels)} 条, 耗时 {time.time()-t0:.2f}s')
+
+	def add(self, rel: str):
+		with self._lock:
+			if rel in self._ids:
+				return
+			i = len(self._rels)
+			low = rel.lower()
+			self._rels.append(rel)
+			self._lower.append(low)
+			self._ids[rel] = i
+			for g in _grams(low):
+				a = self._post.get(g)
+				if a is None:
+					a = self._post[g] = array('I')
+				a.append(i)
+
+	def remove(self, rel: str):
+		with self._lock:
+			i = self._ids.pop(rel, None)
+			if i is None:
+				return
+			self._rels[i] = None
+			self._dead += 1
+
+	def apply(self, added=(), removed=()):
+		"""增量同步音乐库变化; 墓碑超过 1/4 时重建以回收倒排表空间."""
+		with self._lock:
+			if not self.ready:
+				self._pending.append((list(added), list(removed)))
+				return
+		for rel in removed:
+			self.remove(rel)
+		for rel in added:
+			self.add(rel)
+		if self._dead > max(1000, len(self._rels) // 4):
+			self.build([r for r in self._rels if r is not None])
+
+	# ---------- 查询 ----------
+	def _scan(self, term: str):
+		"""不经倒排表, 逐个产出包含 term 的文档 id."""
+		blob, starts = self._blob, self._starts
+		n = len(starts)
+		pos = blob.find(term)
+		while pos >= 0:
+			i = bisect.bisect_right(starts, pos) - 1
+			yield i
+			if i + 1 >= n:
+				break
+			pos = blob.find(term, starts[i + 1])
+		for i in range(n, len(self._lower)):     # build 之后增量加入的文档
+			if term in self._lower[i]:
+				yield i
+
+	def search(self, query: str, offset: int = 0, limit: int = 50):
+		"""返回 (命中数, 当前页 rel 列表, 是否完整). 多个关键词 (空白分隔) 需同时命中.
+
+		所有命中都参与排序, 结果总是完整的; 第三项保留给接口的 complete 字段.
+		"""
+		terms = [t for t in query.lower().split() if t]
+		if not terms:
+			return 0, [], True
+		with self._lock:
+			rels, lower = self._rels, self._lower
+			grams = [g for t in terms for g in _grams(t)]
+			if grams:
+				lists = [self._post.get(g) for g in grams]
+				if any(l is None for l in lists):
+					return 0, [], True
+				candidates = min(lists, key=len)
+			else:
+				candidates = self._scan(max(terms, key=len))
+			hits = [i for i in candidates if rels[i] is not None and all(t in lower[i] for t in terms)]
+		# 打分在锁外进行 (列表只追加, 已有元素不变), 不阻塞增删; heapq 只保留需要的前 k 条
+		score = self._score
+		top = heapq.nsmallest(offset + limit, ((score(lower[i], terms), i) for i in hits))
+		page = [rels[i] for _, i in top[offset:]]
+		return len(hits), page, True
+
+	@staticmethod
+	def _score(low: str, terms):
+		"""越小越靠前: 文件名命中优先, 文件名以关键词开头更优, 其次路径更短."""
+		name = low[low.rfind('/') + 1:]
+		in_name = 0
+		for t in terms:
+			if t in name:
+				in_name -= 1
+		return (in_name, not name.startswith(terms[0]), len(low), low)
@@ -0,0 +1,144 @@
+"""随机播放引擎.
+
+按需 (惰性) 执行 Fisher-Yates: 未抽到的曲目放在 pool 中, 每次随机取一个与末尾交换后弹出,
+O(1) 得到排列的下一项; 已抽出的序列即历史, 用游标前后移动, 所以"上一首"能真正回到
+上一首播放过的曲目. 一轮抽完才会重复. 曲库增删直接修补 pool/历史, 不重新生成排列.
+"""
+import random
+
+
+class ShuffleEngine:
+	def __init__(self, history: int = 500, seed=None):
+		self.history = history       # 游标之前最多保留的条数
+		self._rng = random.Random(seed)
+		self._pool = []              # 本轮尚未抽到的 rel
+		self._pool_pos = {}          # rel -> 在 pool 中的下标, 支持 O(1) 删除
+		self._order = []             # 已抽出的序列 (历史 + 预抽), 元素为 rel
+		self._cursor = -1            # 当前曲目在 _order 中的位置
+		self._high = -1              # 游标到达过的最远位置; 其后为预抽但未播放的部分
+		self._tracks = None          # 当前轮次的全集 (用于开始新一轮)
+		self.source = None           # reset() 时的播放列表对象, 供调用方判断是否需要重置
+		self.skip = None             # 可选 f(rel) -> bool: 抽到时跳过 (本轮不再出现), 如重复曲目
+
+	# ---------- 初始化 ----------
+	def reset(self, tracks, current: str = None):
+		"""以 tracks 为全集开始新排列; current 作为历史的第一项."""
+		self.source = tracks
+		self._tracks = tracks
+		self._order = [current] if current else []
+		self._cursor = self._high = 0 if current else -1
+		self._refill(exclude=current)
+
+	def reseed(self, seed=None):
+		self._rng.seed(seed)
+		cur = self.current()
+		if self._tracks is not None:
+			self.reset(self._tracks, cur)
+
+	def _refill(self, exclude=None):
+		self._pool = [r for r in self._tracks if r != exclude] if self._tracks is not None else []
+		self._pool_pos = {r: i for i, r in enumerate(self._pool)}
+
+	# ---------- 抽取 ----------
+	def _draw(self):
+		for _ in range(2):           # 本轮剩余的都被跳过时, 再开始新一轮试一次
+			if not self._pool:
+				# 一轮结束, 开始新一轮; 避免紧接着重复刚播过的那首
+				self._refill(exclude=self.current())
+				if not self._pool:
+					return None
+			while self._pool:
+				j = self._rng.randrange(len(self._pool))
+				last = self._pool[-1]
+				pick = self._pool[j]
+				self._pool[j] = last
+				self._pool_pos[last] = j
+				self._pool.pop()
+				del self._pool_pos[pick]
+				if self.skip is not None and self.skip(pick):
+					continue
+				self._order.append(pick)
+				return pick
+		return None
+
+	def _advance(self, pos: int):
+		self._cursor = pos
+		self._high = max(self._high, pos)
+		if self._cursor > self.history * 2:
+			drop = self._cursor - self.history
+			del self._order[:drop]
+			self._cursor -= drop
+			self._high -= drop
+
+	def current(self):
+		return self._order[self._cursor] if 0 <= self._cursor < len(self._order) else None
+
+	def peek(self, n: int):
+		"""接下来的 n 首 (不移动游标, 不足时预抽)."""
+		while len(self._order) - self._cursor - 1 < n:
+			if self._draw() is None:
+				break
+		return self._order[self._cursor + 1: self._cursor + 1 + n]
+
+	def next(self):
+		if not self.peek(1):
+			return None
+		self._advance(self._cursor + 1)
+		return self._order[self._cursor]
+
+	def prev(self):
+		if self._cursor <= 0:
+			return None
+		self._cursor -= 1
+		return self._order[self._cursor]
+
+	def set_current(self, rel: str):
+		"""同步外部选定的当前曲目 (点播或 mpv 自行衔接)."""
+		if self.current() == rel:
+			return
+		if self._cursor + 1 < len(self._order) and self._order[self._cursor + 1] == rel:
+			self._advance(self._cursor + 1)
+			return
+		# 点播: 预抽但从未播放的曲目放回 pool; 游标之后的历史被丢弃 (同浏览器前进记录)
+		for r in self._order[self._high + 1:]:
+			self._pool_add(r)
+		del self._order[self._cursor + 1:]
+		self._pool_remove(rel)
+		self._order.append(rel)
+		self._high = self._cursor
+		self._advance(len(self._order) - 1)
+
+	# ---------- 曲库变化 ----------
+	def _pool_add(self, rel: str):
+		if rel not in self._pool_pos:
+			self._pool_pos[rel] = len(self._pool)
+			self._pool.append(rel)
+
+	def _pool_remove(self, rel: str):
+		j = self._pool_pos.pop(rel, None)
+		if j is None:
+			return
+		last = self._pool.pop()
+		if last != rel:
+			self._pool[j] = last
+			self._pool_pos[last] = j
+
+	def rebind(self, tracks):
+		"""播放列表被替换为内容相同 (或已由 apply 修补) 的新对象: 只更新引用, 排列与历史保持不变."""
+		self.source = tracks
+		self._tracks = tracks
+
+	def apply(self, added=(), removed=()):
+		"""修补排列: 新曲目加入本轮 pool, 被删除的曲目从 pool 与历史中移除."""
+		for rel in added:
+			self._pool_add(rel)
+		gone = set(removed)
+		for rel in gone:
+			self._pool_remove(rel)
+		if gone and any(r in gone for r in self._order):
+			cur = self.current()
+			before = sum(1 for r in self._order[:self._cursor] if r in gone and r != cur)
+			played = sum(1 for r in self._order[:self._high + 1] if r in gone and r != cur)
+			self._order = [r for r in self._order if r not in gone or r == cur]
+			self._cursor -= before
+			self._high -= played
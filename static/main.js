@@ -2,8 +2,19 @@
 	let ctx = {tree:{}, musicDir:''};
 	try { ctx = JSON.parse(document.getElementById('boot-data').textContent); } catch(e) { console.warn('Boot data parse error', e); }
 	const ROOT = document.getElementById('tree');
+	// 播放分区: 所有播放相关请求都带上 zone
+	const ZONE = ctx.zone || '';
+	const zq = () => 'zone='+encodeURIComponent(ZONE);
+	function post(url, params){
+		return fetch(url, {method:'POST', headers:{'Content-Type':'application/x-www-form-urlencoded'}, body: zq() + (params ? '&'+params : '')});
+	}
+	// 批量控制: 多个操作一次请求, 服务端合并为一次 mpv 写入
+	function batch(ops){
+		return fetch('/batch?'+zq(), {method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({ops})});
+	}
 	function el(tag, cls, text){ const e=document.createElement(tag); if(cls)e.className=cls; if(text) e.textContent=text; return e; }
 
+	// 目录按需加载: 首屏只有顶层, 展开时请求 /tree?rel=...&depth=1
 	function buildNode(node){
 		const li = el('li','dir');
 		if(node.rel) li.dataset.rel = node.rel;
@@ -11,60 +22,96 @@
 		const arrow = el('span','arrow','▶');
 		const nameSpan = el('span','name', node.rel? node.name : '根目录');
 		label.appendChild(arrow); label.appendChild(nameSpan);
-		label.onclick = () => li.classList.toggle('collapsed');
+		if(node.file_count) label.appendChild(el('span','count', String(node.file_count)));
+		label.onclick = () => {
+			if(!li.classList.contains('collapsed')){ li.classList.add('collapsed'); return; }
+			loadDir(li).then(()=>li.classList.remove('collapsed')).catch(()=>{});
+		};
 		li.appendChild(label);
-		const ul = el('ul');
-		(node.dirs||[]).forEach(d=>ul.appendChild(buildNode(d)));
-		(node.files||[]).forEach(f=>{
-			const fi = el('li','file',f.name);
-			fi.dataset.rel = f.rel;
-			fi.onclick = () => play(f.rel, fi);
-			ul.appendChild(fi);
-		});
-		li.appendChild(ul);
+		li.appendChild(el('ul'));
+		li._loaded = null;
+		if(node.dirs || node.files) fillDir(li, node);
 		if(node.rel) li.classList.add('collapsed');
 		return li;
 	}
 
-	function render(){
-		const keyword = (document.getElementById('searchBox')?.value || '').trim().toLowerCase();
+	function fillDir(li, node){
+		const ul = li.querySelector(':scope > ul');
+		ul.innerHTML = '';
+		(node.dirs||[]).forEach(d=>ul.appendChild(buildNode(d)));
+		(node.files||[]).forEach(f=>ul.appendChild(fileItem(f)));
+		if(!ul.children.length) ul.appendChild(el('li','empty','(空)'));
+		li._loaded = Promise.resolve();
+	}
+
+	function loadDir(li){
+		if(!li._loaded){
+			li._loaded = fetch('/tree?depth=1&rel='+encodeURIComponent(li.dataset.rel||''))
+				.then(r=>r.json())
+				.then(j=>{
+					if(j.status!=='OK') throw new Error(j.error);
+					fillDir(li, j.tree);
+				})
+				.catch(e=>{ li._loaded = null; console.warn('加载目录失败', e); throw e; });
+		}
+		return li._loaded;
+	}
+
+	function fileItem(f, text){
+		const fi = el('li','file', text || f.name);
+		fi.dataset.rel = f.rel;
+		fi.onclick = () => play(f.rel, fi);
+		return fi;
+	}
+
+	function renderTree(){
 		ROOT.innerHTML='';
 		const topUL = el('ul');
-		const matchFile = f => !keyword || f.name.toLowerCase().includes(keyword) || f.rel.toLowerCase().includes(keyword);
-		const filterNode = node => {
-			if(!keyword) return node; // 无关键词直接使用
-			// 复制结构
-			const nf = { name: node.name, rel: node.rel, dirs: [], files: [] };
-			(node.dirs||[]).forEach(d=>{
-				const sub = filterNode(d);
-				if(sub && (sub.files.length || sub.dirs.length)) nf.dirs.push(sub);
-			});
-			(node.files||[]).forEach(f=>{ if(matchFile(f)) nf.files.push(f); });
-			if(nf.files.length || nf.dirs.length) return nf;
-			return null;
-		};
-		let rootView = ctx.tree;
-		if(keyword){
-			const filtered = filterNode(ctx.tree);
-			rootView = filtered || {dirs:[],files:[]};
-		}
-		(rootView.dirs||[]).forEach(d=>topUL.appendChild(buildNode(d)));
-		(rootView.files||[]).forEach(f=>{ const fi = el('li','file',f.name); fi.dataset.rel = f.rel; fi.onclick=()=>play(f.rel,fi); topUL.appendChild(fi); });
+		(ctx.tree.dirs||[]).forEach(d=>topUL.appendChild(buildNode(d)));
+		(ctx.tree.files||[]).forEach(f=>topUL.appendChild(fileItem(f)));
 		ROOT.appendChild(topUL);
+		lastStatusRel = null; // DOM 已重建, 下次状态更新时重新高亮
+	}
+
+	// 搜索走服务端 /search (三元组索引), 不再在浏览器里遍历整棵树
+	let searchCtl = null;
+	function render(){
+		const keyword = (document.getElementById('searchBox')?.value || '').trim();
+		if(searchCtl){ searchCtl.abort(); searchCtl = null; }
+		if(!keyword){ renderTree(); return; }
+		searchCtl = new AbortController();
+		fetch('/search?limit=200&q='+encodeURIComponent(keyword), {signal: searchCtl.signal})
+			.then(r=>r.json())
+			.then(j=>{
+				ROOT.innerHTML='';
+				if(j.status!=='OK'){ ROOT.appendChild(el('div','empty', j.error || '搜索失败')); return; }
+				if(!j.hits.length){ ROOT.appendChild(el('div','empty','无匹配结果')); return; }
+				const ul = el('ul');
+				j.hits.forEach(h=>ul.appendChild(fileItem(h, h.rel)));
+				if(!j.complete || j.total > j.hits.length){
+					ul.appendChild(el('li','empty', '共 '+ j.total + (j.complete?'':'+') +' 条, 仅显示前 '+ j.hits.length +' 条'));
+				}
+				ROOT.appendChild(ul);
+				lastStatusRel = null;
+			})
+			.catch(e=>{ if(e.name!=='AbortError') console.warn('搜索请求错误', e); });
 	}
 
 	let lastLocatedRel = null;
-	function expandTo(rel){
+	// 逐级加载祖先目录后定位到曲目
+	async function expandTo(rel){
 		if(!rel) return;
 		if(rel === lastLocatedRel) return; // 防止频繁跳动
 		const parts = rel.split('/');
 		let acc = '';
 		for(let i=0;i<parts.length-1;i++){
 			acc = acc ? acc + '/' + parts[i] : parts[i];
-			const dir = Array.from(document.querySelectorAll('li.dir')).find(d=>d.dataset.rel===acc);
-			if(dir){ dir.classList.remove('collapsed'); }
+			const dir = ROOT.querySelector('li.dir[data-rel="'+ CSS.escape(acc) +'"]');
+			if(!dir) return;
+			await loadDir(dir);
+			dir.classList.remove('collapsed');
 		}
-		const fileEl = Array.from(document.querySelectorAll('li.file')).find(f=>f.dataset.rel===rel);
+		const fileEl = ROOT.querySelector('li.file[data-rel="'+ CSS.escape(rel) +'"]');
 		if(fileEl){
 			fileEl.scrollIntoView({block:'center'});
 			lastLocatedRel = rel;
@@ -72,7 +119,8 @@
 	}
 
 	function play(rel, dom){
-		fetch('/play', {method:'POST', headers:{'Content-Type':'application/x-www-form-urlencoded'}, body:'path='+encodeURIComponent(rel)})
+		if(localMode){ playLocal(rel, dom); return; }
+		post('/play', 'path='+encodeURIComponent(rel))
 			.then(r=>r.json())
 			.then(j=>{
 				if(j.status!=='OK') { alert('播放失败: '+ j.error); return; }
@@ -83,40 +131,141 @@
 			}).catch(e=>alert('请求错误: '+ e));
 	}
 
-	function pollStatus(){
-		fetch('/status').then(r=>r.json()).then(j=>{
-			if(j.status!=='OK') return;
-			const bar = document.getElementById('nowPlaying');
-			if(!j.playing || !j.playing.rel){ bar.textContent='未播放'; return; }
-			const rel = j.playing.rel;
-			let label = '▶ '+ rel;
-			if(j.mpv && j.mpv.time!=null && j.mpv.duration){
-				const t = j.mpv.time||0, d = j.mpv.duration||0;
-				const fmt = s=>{ if(isNaN(s)) return '--:--'; const m=Math.floor(s/60), ss=Math.floor(s%60); return m+':'+(ss<10?'0':'')+ss; };
-				label += ' ['+ fmt(t) +' / '+ fmt(d) + (j.mpv.paused?' | 暂停':'') +']';
-				// 进度条
-				if(d>0){
-					const pct = Math.min(100, Math.max(0, t/d*100));
-					const fill = document.getElementById('playerProgressFill');
-					if(fill) fill.style.width = pct.toFixed(2)+'%';
-				}
-			}
-			// 同步音量显示
-			if(j.mpv && j.mpv.volume!=null){
-				const vs = document.getElementById('volSlider');
-				if(vs && !vs._dragging){ vs.value = Math.round(j.mpv.volume); }
-			}
-			bar.textContent = label;
-			document.querySelectorAll('.file.playing').forEach(e=>e.classList.remove('playing'));
-			// 高亮 & 定位
-			const target = Array.from(document.querySelectorAll('#tree .file')).find(f=>f.dataset.rel===rel);
-			if(target){
-				target.classList.add('playing');
-				expandTo(rel);
+	// 浏览器播放模式: 曲目经 /stream 在本机播放, 不控制服务器上的 mpv
+	const audio = document.getElementById('localAudio');
+	let localMode = !!audio && localStorage.getItem('localMode') === '1';
+	let localRel = null;
+	const streamUrl = rel => '/stream/' + rel.split('/').map(encodeURIComponent).join('/');
+	function playLocal(rel, dom){
+		localRel = rel;
+		loadPeaks(rel);
+		audio.src = streamUrl(rel);
+		audio.play().catch(e=>console.warn('浏览器播放失败', e));
+		document.querySelectorAll('.file.playing').forEach(e=>e.classList.remove('playing'));
+		if(dom) dom.classList.add('playing');
+		document.getElementById('nowPlaying').textContent = '🎧 '+ rel;
+	}
+	// 上一首/下一首/播放结束: 按页面上已加载的曲目顺序
+	function stepLocal(delta){
+		const files = Array.from(ROOT.querySelectorAll('li.file'));
+		const f = files[files.findIndex(x=>x.dataset.rel===localRel) + delta];
+		if(f) playLocal(f.dataset.rel, f);
+	}
+	if(audio){
+		audio.addEventListener('ended', ()=>stepLocal(1));
+		audio.addEventListener('timeupdate', ()=>{
+			const fill = document.getElementById('playerProgressFill');
+			if(!localMode || !audio.duration) return;
+			if(fill) fill.style.width = (audio.currentTime/audio.duration*100).toFixed(2)+'%';
+			drawWave(audio.currentTime/audio.duration);
+		});
+	}
+
+	// 波形: 当前曲目的峰值 (/peaks, 二进制) 画在播放栏中, 已播放部分高亮
+	const wave = document.getElementById('waveform');
+	let peaks = null, peaksRel = null, waveFrac = 0;
+	function loadPeaks(rel){
+		if(!wave || rel === peaksRel) return;
+		peaksRel = rel;
+		peaks = null;
+		drawWave(0);
+		const url = '/peaks/' + rel.split('/').map(encodeURIComponent).join('/');
+		const attempt = left => fetch(url).then(r=>{
+			// 202: 服务端正在后台生成, 稍后再取
+			if(r.status === 202){ if(left > 0) setTimeout(()=>{ if(peaksRel === rel) attempt(left-1); }, 1000); return; }
+			if(!r.ok) return;
+			return r.arrayBuffer().then(buf=>{
+				if(peaksRel !== rel || buf.byteLength < 12) return;
+				const dv = new DataView(buf);
+				if(dv.getUint32(0) !== 0x4A4B504B) return;     // 'JKPK'
+				peaks = new Int8Array(buf, 12, Math.min(dv.getUint16(6, true) * 2, buf.byteLength - 12));
+				drawWave(waveFrac);
+			});
+		}).catch(()=>{});
+		attempt(10);
+	}
+	function drawWave(frac){
+		waveFrac = frac;
+		if(!wave) return;
+		wave.hidden = !peaks;
+		if(!peaks) return;
+		const w = wave.clientWidth, h = wave.clientHeight, dpr = window.devicePixelRatio || 1;
+		if(wave.width !== Math.round(w*dpr) || wave.height !== Math.round(h*dpr)){
+			wave.width = Math.round(w*dpr);
+			wave.height = Math.round(h*dpr);
+		}
+		const g = wave.getContext('2d');
+		g.setTransform(dpr, 0, 0, dpr, 0, 0);
+		g.clearRect(0, 0, w, h);
+		const n = peaks.length / 2, mid = h / 2;
+		for(let x = 0; x < w; x++){
+			const i = Math.floor(x / w * n) * 2;
+			const lo = peaks[i] / 127, hi = peaks[i+1] / 127;
+			g.fillStyle = x / w <= frac ? '#4fd1a5' : '#555c66';
+			g.fillRect(x, mid - hi*mid, 1, Math.max(1, (hi - lo) * mid));
+		}
+	}
+
+	let lastStatusRel = null;
+	function applyStatus(j){
+		if(!j || j.status!=='OK' || localMode) return;
+		const bar = document.getElementById('nowPlaying');
+		if(!j.playing || !j.playing.rel){ bar.textContent='未播放'; return; }
+		const rel = j.playing.rel;
+		const tags = j.playing.tags || {};
+		let label = '▶ '+ (tags.title ? (tags.artist ? tags.artist+' - ' : '') + tags.title : rel);
+		if(j.mpv && j.mpv.time!=null && j.mpv.duration){
+			const t = j.mpv.time||0, d = j.mpv.duration||0;
+			const fmt = s=>{ if(isNaN(s)) return '--:--'; const m=Math.floor(s/60), ss=Math.floor(s%60); return m+':'+(ss<10?'0':'')+ss; };
+			label += ' ['+ fmt(t) +' / '+ fmt(d) + (j.mpv.paused?' | 暂停':'') +']';
+			// 进度条
+			if(d>0){
+				const pct = Math.min(100, Math.max(0, t/d*100));
+				const fill = document.getElementById('playerProgressFill');
+				if(fill) fill.style.width = pct.toFixed(2)+'%';
+				drawWave(t/d);
 			}
-		}).catch(()=>{}).finally(()=> setTimeout(pollStatus, 2000));
+		}
+		// 同步音量显示
+		if(j.mpv && j.mpv.volume!=null){
+			const vs = document.getElementById('volSlider');
+			if(vs && !vs._dragging){ vs.value = Math.round(j.mpv.volume); }
+		}
+		bar.textContent = label;
+		loadPeaks(rel);
+		// 高亮 & 定位: 仅在曲目变化时查找 DOM; 所在目录可能尚未加载
+		if(rel === lastStatusRel) return;
+		lastStatusRel = rel;
+		highlight(rel);
+		expandTo(rel).then(()=>highlight(rel)).catch(()=>{});
+	}
+
+	function highlight(rel){
+		const target = ROOT.querySelector('li.file[data-rel="'+ CSS.escape(rel) +'"]');
+		if(!target) return;
+		document.querySelectorAll('.file.playing').forEach(e=>e.classList.remove('playing'));
+		target.classList.add('playing');
 	}
 
+	// 优先使用 /events 服务端推送; 推送中断时轮询兜底
+	let events = null, lastPush = 0;
+	function startEvents(){
+		if(!window.EventSource) return;
+		events = new EventSource('/events?'+zq());
+		events.addEventListener('status', e=>{
+			lastPush = Date.now();
+			try { applyStatus(JSON.parse(e.data)); } catch(err) { console.warn('事件解析失败', err); }
+		});
+		events.onerror = ()=>{ if(events && events.readyState===EventSource.CLOSED) events = null; };
+	}
+
+	function pollStatus(){
+		if(events && Date.now() - lastPush < 5000){ setTimeout(pollStatus, 2000); return; }
+		fetch('/status?'+zq()).then(r=>r.json()).then(applyStatus)
+			.catch(()=>{}).finally(()=> setTimeout(pollStatus, 2000));
+	}
+
+	startEvents();
 	setTimeout(pollStatus, 1500);
 
 	// 搜索事件
@@ -129,16 +278,30 @@
 	const prevBtn = document.getElementById('prevBtn');
 	const nextBtn = document.getElementById('nextBtn');
 	const shuffleBtn = document.getElementById('shuffleBtn');
+	const djBtn = document.getElementById('djBtn');
 	if(prevBtn) prevBtn.onclick = ()=>{
-		fetch('/prev', {method:'POST'}).then(r=>r.json()).then(j=>{ if(j.status!=='OK'){ console.warn(j.error); } });
+		if(localMode){ stepLocal(-1); return; }
+		post('/prev').then(r=>r.json()).then(j=>{ if(j.status!=='OK'){ console.warn(j.error); } });
 	};
 	if(nextBtn) nextBtn.onclick = ()=>{
-		fetch('/next', {method:'POST'}).then(r=>r.json()).then(j=>{ if(j.status!=='OK'){ console.warn(j.error); } });
+		if(localMode){ stepLocal(1); return; }
+		post('/next').then(r=>r.json()).then(j=>{ if(j.status!=='OK'){ console.warn(j.error); } });
 	};
 	if(shuffleBtn) shuffleBtn.onclick = ()=>{
-		fetch('/shuffle', {method:'POST'}).then(r=>r.json()).then(j=>{
+		post('/shuffle').then(r=>r.json()).then(j=>{
 			if(j.status==='OK'){
 				shuffleBtn.dataset.on = j.shuffle ? '1':'0';
+				if(djBtn && j.shuffle) djBtn.dataset.on = '0';     // 两种模式互斥
+			}
+		});
+	};
+	if(djBtn) djBtn.onclick = ()=>{
+		post('/autodj').then(r=>r.json()).then(j=>{
+			if(j.status==='OK'){
+				djBtn.dataset.on = j.autodj ? '1':'0';
+				if(shuffleBtn) shuffleBtn.dataset.on = j.shuffle ? '1':'0';
+			} else {
+				console.warn(j.error);
 			}
 		});
 	};
@@ -146,24 +309,66 @@
 	// 音量滑块事件
 	const vol = document.getElementById('volSlider');
 	if(vol){
-		const send = val => {
-			fetch('/volume', {method:'POST', headers:{'Content-Type':'application/x-www-form-urlencoded'}, body:'value='+val})
+		// 拖动时同一时刻最多一个请求在途, 返回后立即发送期间的最新值 (中间值丢弃)
+		let inflight = false, pending = null;
+		const send = () => {
+			if(inflight || pending===null){ return; }
+			const val = Number(pending);
+			pending = null;
+			inflight = true;
+			batch([{op:'volume', value: val}])
 				.then(r=>r.json()).then(j=>{ if(j.status!=='OK'){ console.warn('设置音量失败', j); } })
-				.catch(e=>console.warn('音量请求错误', e));
+				.catch(e=>console.warn('音量请求错误', e))
+				.finally(()=>{ inflight = false; if(pending!==null){ send(); } else { vol._dragging = false; } });
 		};
-		let debounceTimer;
 		vol.addEventListener('input', ()=>{
+			if(localMode){ audio.volume = Math.min(1, vol.value/100); return; }
 			vol._dragging = true;
-			clearTimeout(debounceTimer);
-			debounceTimer = setTimeout(()=>{ send(vol.value); vol._dragging=false; }, 120);
+			pending = vol.value;
+			send();
 		});
 		// 初始化: 获取当前音量
-		fetch('/volume', {method:'POST'}).then(r=>r.json()).then(j=>{
+		post('/volume').then(r=>r.json()).then(j=>{
 			if(j.status==='OK' && j.volume!=null){ vol.value = Math.round(j.volume); }
 		}).catch(()=>{});
 	}
 
-	document.getElementById('expandAll').onclick=()=>document.querySelectorAll('#tree .dir').forEach(d=>d.classList.remove('collapsed'));
+	const localBtn = document.getElementById('localBtn');
+	if(localBtn && audio){
+		localBtn.dataset.on = localMode ? '1':'0';
+		localBtn.onclick = ()=>{
+			localMode = !localMode;
+			localStorage.setItem('localMode', localMode ? '1':'0');
+			localBtn.dataset.on = localMode ? '1':'0';
+			if(!localMode){ audio.pause(); lastStatusRel = null; }    // 回到服务器播放, 下次状态推送时重新高亮
+		};
+	}
+
+	// 切换分区: 重新加载页面, 事件流与状态随之切换
+	const zoneSel = document.getElementById('zoneSel');
+	if(zoneSel){
+		(ctx.zones||[]).forEach(z=>{ const o=el('option', null, z); o.value=z; zoneSel.appendChild(o); });
+		zoneSel.value = ZONE;
+		zoneSel.hidden = (ctx.zones||[]).length < 2;
+		zoneSel.onchange = ()=>{ location.search = '?zone='+encodeURIComponent(zoneSel.value); };
+	}
+
+	// 展开全部只作用于已加载的目录, 避免一次拉取整个曲库
+	document.getElementById('expandAll').onclick=()=>document.querySelectorAll('#tree .dir').forEach(d=>{ if(d._loaded) d.classList.remove('collapsed'); });
 	document.getElementById('collapseAll').onclick=()=>document.querySelectorAll('#tree .dir').forEach(d=>d.classList.add('collapsed'));
 	render();
+
+	// 冷启动时服务端仍在扫描: 定期刷新顶层, 目录随扫描进度逐步出现
+	function pollScan(){
+		fetch('/tree?depth=1&rel=').then(r=>r.json()).then(j=>{
+			if(j.status!=='OK') return;
+			const sig = t => (t.dirs||[]).map(d=>d.rel+':'+d.dir_count+':'+d.file_count).join('|') + '#' + (t.files||[]).length;
+			if(sig(j.tree) !== sig(ctx.tree)){
+				ctx.tree = j.tree;
+				if(!(document.getElementById('searchBox')?.value || '').trim()) renderTree();
+			}
+			if(j.scan && j.scan.scanning) setTimeout(pollScan, 1500);
+		}).catch(()=>setTimeout(pollScan, 3000));
+	}
+	if(ctx.scanning) setTimeout(pollScan, 1000);
 })();
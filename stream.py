@@ -0,0 +1,189 @@
+"""音频文件的 HTTP 流式传输: Range/206, 零拷贝发送, 连接数与每客户端带宽限制.
+
+文件数据不经过 Python 缓冲区: werkzeug 开发服务器上先让服务器写出响应头, 再直接对连接 socket
+调用 sendfile; 其他 WSGI 服务器交给 wsgi.file_wrapper (gunicorn 等同样使用 sendfile);
+两者都没有时才退回到按块读取. 限速时按令牌桶分段 sendfile, 分段之间睡眠, 不占用 CPU.
+"""
+import time, threading
+from metrics import Counter, Gauge
+
+CHUNK = 256 * 1024           # 限速/读取回退时每段的字节数
+MIN_SLICE = 16 * 1024
+
+STREAM_BYTES = Counter('jukebox_stream_bytes_total', '/stream 发送的字节数')
+STREAM_REJECTED = Counter('jukebox_stream_rejected_total', '因连接数上限被拒绝的 /stream 请求', ['reason'])
+STREAM_ACTIVE = Gauge('jukebox_stream_active', '正在传输的 /stream 连接数')
+
+
+class _Bucket:
+	"""令牌桶: 同一客户端的所有连接共用; rate 为字节/秒, 允许 1 秒的突发."""
+	__slots__ = ('rate', 'tokens', 'ts', 'lock')
+
+	def __init__(self, rate: float):
+		self.rate = rate
+		self.tokens = rate
+		self.ts = time.monotonic()
+		self.lock = threading.Lock()
+
+	def take(self, n: int) -> float:
+		"""取 n 个令牌, 返回需要等待的秒数 (令牌可以透支, 由等待补足)."""
+		with self.lock:
+			now = time.monotonic()
+			self.tokens = min(self.rate, self.tokens + (now - self.ts) * self.rate) - n
+			self.ts = now
+			return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class StreamLimiter:
+	"""总连接数与每客户端连接数上限, 以及每客户端的带宽 (字节/秒, 0 为不限)."""
+
+	def __init__(self, max_streams: int = 64, per_client: int = 4, rate: float = 0):
+		self.max_streams = max_streams
+		self.per_client = per_client
+		self.rate = rate
+		self._active = {}            # 客户端 -> 连接数
+		self._buckets = {}
+		self._total = 0
+		self._lock = threading.Lock()
+		STREAM_ACTIVE.set_function(lambda: self._total)
+
+	def acquire(self, client: str):
+		"""占用一个连接名额; 已满时返回拒绝原因 ('total' / 'client'), 成功返回 None."""
+		with self._lock:
+			if self._total >= self.max_streams:
+				reason = 'total'
+			elif self._active.get(client, 0) >= self.per_client:
+				reason = 'client'
+			else:
+				self._total += 1
+				self._active[client] = self._active.get(client, 0) + 1
+				return None
+		STREAM_REJECTED.labels(reason).inc()
+		return reason
+
+	def release(self, client: str):
+		with self._lock:
+			self._total -= 1
+			n = self._active.get(client, 1) - 1
+			if n > 0:
+				self._active[client] = n
+			else:
+				self._active.pop(client, None)
+				self._buckets.pop(client, None)     # 客户端没有连接了, 下次重新开始计量
+
+	def bucket(self, client: str):
+		if self.rate <= 0:
+			return None
+		with self._lock:
+			b = self._buckets.get(client)
+			if b is None:
+				b = self._buckets[client] = _Bucket(self.rate)
+			return b
+
+
+class FileStream:
+	"""WSGI 响应体: 发送文件的 [start, start+length) 部分; 结束或客户端断开后 close() 释放名额."""
+
+	def __init__(self, path: str, start: int, length: int, environ: dict, bucket=None, on_close=None):
+		self.path = path
+		self.start = start
+		self.length = length
+		self.bucket = bucket
+		self.on_close = on_close
+		self.sock = environ.get('werkzeug.socket')
+		self.file_wrapper = environ.get('wsgi.file_wrapper')
+		self._file = open(path, 'rb')
+		self._closed = False
+
+	def wsgi_body(self):
+		"""不限速且服务器提供 wsgi.file_wrapper 时交给服务器 (sendfile); 否则返回自身."""
+		if self.sock is None and self.bucket is None and self.file_wrapper is not None:
+			self._file.seek(self.start)
+			return self.file_wrapper(_Bounded(self._file, self.length, self.close), CHUNK)
+		return self
+
+	def __iter__(self):
+		if self.length <= 0:
+			return
+		if self.sock is not None:
+			yield b''                # 服务器先写出状态行与响应头
+			self._sendfile()
+			return
+		yield from self._read_chunks()
+
+	def _slices(self):
+		"""按带宽限制切分 (offset, count); 不限速时一次发送整段."""
+		offset, end = self.start, self.start + self.length
+		if self.bucket is None:
+			yield offset, self.length
+			return
+		step = max(MIN_SLICE, min(CHUNK, int(self.bucket.rate / 8)))
+		while offset < end:
+			n = min(step, end - offset)
+			yield offset, n
+			offset += n
+
+	def _sendfile(self):
+		try:
+			for offset, count in self._slices():
+				sent = self.sock.sendfile(self._file, offset, count)
+				STREAM_BYTES.inc(sent)
+				if sent < count:
+					return
+				if self.bucket is not None:
+					wait = self.bucket.take(count)
+					if wait > 0:
+						time.sleep(wait)
+		except OSError:
+			pass                     # 客户端断开 (跳转/暂停后浏览器会主动关闭)
+
+	def _read_chunks(self):
+		self._file.seek(self.start)
+		for _, count in self._slices():
+			while count > 0:
+				data = self._file.read(min(CHUNK, count))
+				if not data:
+					return
+				count -= len(data)
+				STREAM_BYTES.inc(len(data))
+				yield data
+				if self.bucket is not None:
+					wait = self.bucket.take(len(data))
+					if wait > 0:
+						time.sleep(wait)
+
+	def close(self):
+		if self._closed:
+			return
+		self._closed = True
+		self._file.close()
+		if self.on_close is not None:
+			self.on_close()
+
+
+class _Bounded:
+	"""只暴露前 length 字节的文件对象, 供 wsgi.file_wrapper 使用 (fileno 使其可走 sendfile)."""
+
+	def __init__(self, f, length: int, on_close):
+		self._f = f
+		self._left = length
+		self._on_close = on_close
+
+	def fileno(self):
+		return self._f.fileno()
+
+	def tell(self):
+		return self._f.tell()
+
+	def seek(self, *args):
+		return self._f.seek(*args)
+
+	def read(self, n: int = -1) -> bytes:
+		n = self._left if n is None or n < 0 else min(n, self._left)
+		data = self._f.read(n)
+		self._left -= len(data)
+		STREAM_BYTES.inc(len(data))
+		return data
+
+	def close(self):
+		self._on_close()
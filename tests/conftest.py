@@ -0,0 +1,26 @@
+import os, sys
+
+# 各模块位于仓库根目录 (非包), 测试直接按模块名导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+	"""以临时目录中的配置导入 app (整个测试会话只导入一次); 返回模块, 曲目放在 app.MUSIC_DIR."""
+	base = tmp_path_factory.mktemp('jukebox')
+	(base / 'music').mkdir()
+	(base / 'settings.ini').write_text('\n'.join([
+		'[app]',
+		f'music_dir = {base / "music"}',
+		'allowed_extensions = .mp3,.flac,.wav',
+		'watch_mode = off',
+		'dedup_scan = false',
+		'peaks_decoder =',
+		f'mpv_cmd = mpv --input-ipc-server={base / "mpv.sock"} --idle=yes',
+		'',
+	]), encoding='utf-8')
+	os.environ['JUKEBOX_INI'] = str(base / 'settings.ini')
+	import app as module
+	return module
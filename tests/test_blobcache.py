@@ -0,0 +1,59 @@
+import gzip, json
+
+import pytest
+
+import metrics
+from blobcache import BlobCache, MIN_COMPRESS
+
+
+def test_get_reports_hit_and_builds_once():
+	cache = BlobCache()
+	calls = []
+
+	def build():
+		calls.append(1)
+		return {'a': 1}
+	blob, hit = cache.get(('tree', 1), build)
+	again, hit2 = cache.get(('tree', 1), build)
+	assert (hit, hit2) == (False, True)
+	assert again is blob and len(calls) == 1
+	assert json.loads(blob.body) == {'a': 1}
+	assert cache.stats == {'hits': 1, 'misses': 1}
+
+
+def test_encoded_small_and_large_payloads():
+	cache = BlobCache()
+	small, _ = cache.get('s', lambda: {'x': 1})
+	assert small.encoded('gzip') == (small.body, None)
+	big, _ = cache.get('b', lambda: ['track %d' % i for i in range(MIN_COMPRESS)])
+	data, enc = big.encoded('gzip')
+	assert enc == 'gzip' and gzip.decompress(data) == big.body
+	assert big.encoded('gzip')[0] is data      # 每种编码只压缩一次
+
+
+def test_lru_eviction():
+	cache = BlobCache(max_entries=2)
+	for k in 'abc':
+		cache.get(k, lambda: k)
+	assert cache.get('a', lambda: 'a')[1] is False
+	assert cache.get('c', lambda: 'c')[1] is True
+
+
+def test_metric_base_is_abstract_and_series_render():
+	with pytest.raises(TypeError):
+		metrics._Metric('jukebox_test_abstract', 'x')
+	c = metrics.Counter('jukebox_test_requests_total', '测试', ['route'])
+	c.labels('/a').inc()
+	c.labels('/a').inc(2)
+	h = metrics.Histogram('jukebox_test_seconds', '测试', buckets=(0.1, 1.0))
+	h.observe(0.05)
+	h.observe(0.5)
+	h.observe(5)
+	lines = c.render() + h.render()
+	assert 'jukebox_test_requests_total{route="/a"} 3' in lines
+	assert 'jukebox_test_seconds_bucket{le="0.1"} 1' in lines
+	assert 'jukebox_test_seconds_bucket{le="1"} 2' in lines
+	assert 'jukebox_test_seconds_bucket{le="+Inf"} 3' in lines
+	assert 'jukebox_test_seconds_count 3' in lines
+	with pytest.raises(ValueError):
+		c.labels()
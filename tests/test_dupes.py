@@ -0,0 +1,89 @@
+import os
+
+import dupes
+from dupes import DuplicateFinder, hash_file
+from playlist import Playlist
+
+
+def _write(root, rel, data):
+	path = os.path.join(root, rel)
+	with open(path, 'wb') as f:
+		f.write(data)
+
+
+def _groups(finder):
+	return [g['tracks'] for g in finder.groups]
+
+
+def test_partial_hash_covers_head_and_tail(tmp_path):
+	mib = dupes.MIB
+	a = b'a' * mib + b'x' * mib + b'z' * mib
+	b = b'a' * mib + b'y' * mib + b'z' * mib
+	_write(tmp_path, 'a', a)
+	_write(tmp_path, 'b', b)
+	assert hash_file(str(tmp_path / 'a'), partial=True) == hash_file(str(tmp_path / 'b'), partial=True)
+	assert hash_file(str(tmp_path / 'a')) != hash_file(str(tmp_path / 'b'))
+	_write(tmp_path, 'empty', b'')
+	assert hash_file(str(tmp_path / 'empty')) == hash_file(str(tmp_path / 'empty'), partial=True)
+
+
+def test_scan_groups_same_content_in_playlist_order(tmp_path):
+	_write(tmp_path, 'a.mp3', b'same')
+	_write(tmp_path, 'b.mp3', b'same')
+	_write(tmp_path, 'c.mp3', b'diff')        # 大小相同, 内容不同
+	_write(tmp_path, 'd.mp3', b'other size')
+	finder = DuplicateFinder(str(tmp_path / 'lib.db'), workers=1)
+	pl = Playlist(['a.mp3', 'b.mp3', 'c.mp3', 'd.mp3'])
+	finder.scan(str(tmp_path), pl)
+	assert _groups(finder) == [['a.mp3', 'b.mp3']]
+	assert finder.is_duplicate('b.mp3') and not finder.is_duplicate('a.mp3')
+	assert finder.original('b.mp3') == 'a.mp3'
+
+
+def test_update_matches_full_scan(tmp_path):
+	for name, data in [('a', b'one'), ('b', b'one'), ('c', b'two'), ('d', b'xyz')]:
+		_write(tmp_path, name, data)
+	finder = DuplicateFinder(str(tmp_path / 'lib.db'), workers=1)
+	finder.scan(str(tmp_path), Playlist('abcd'))
+	assert _groups(finder) == [['a', 'b']]
+	# 新增与 c 相同的 e, 删除 b
+	_write(tmp_path, 'e', b'two')
+	os.remove(tmp_path / 'b')
+	pl = Playlist('acde')
+	progress = finder.update(str(tmp_path), ['e'], ['b'], pl)
+	assert progress['state'] == 'done'
+	fresh = DuplicateFinder(str(tmp_path / 'fresh.db'), workers=1)
+	fresh.scan(str(tmp_path), pl)
+	assert _groups(finder) == _groups(fresh) == [['c', 'e']]
+	assert 'b' not in finder._load()
+
+
+def test_small_update_does_not_start_a_pool(tmp_path, monkeypatch):
+	for name in 'abc':
+		_write(tmp_path, name, b'dup')
+	finder = DuplicateFinder(str(tmp_path / 'lib.db'), workers=1)
+	finder.scan(str(tmp_path), Playlist('ab'))
+
+	def no_pool(*a, **k):
+		raise AssertionError('不应为少量文件启动进程池')
+	monkeypatch.setattr(dupes, 'ProcessPoolExecutor', no_pool)
+	finder.update(str(tmp_path), ['c'], [], Playlist('abc'))
+	assert _groups(finder) == [['a', 'b', 'c']]
+
+
+def test_large_batch_uses_spawn_pool(tmp_path):
+	names = [f'{i:02d}' for i in range(40)]
+	for name in names:
+		_write(tmp_path, name, b'same content')
+	finder = DuplicateFinder(str(tmp_path / 'lib.db'), workers=2)
+	finder.scan(str(tmp_path), Playlist(names))
+	assert _groups(finder) == [names]
+	assert finder.progress['hashed'] == 40
+
+
+def test_update_before_scan_falls_back_to_scan(tmp_path):
+	_write(tmp_path, 'a', b'x')
+	_write(tmp_path, 'b', b'x')
+	finder = DuplicateFinder(str(tmp_path / 'lib.db'), workers=1)
+	finder.update(str(tmp_path), ['a'], [], Playlist('ab'))
+	assert _groups(finder) == [['a', 'b']]
@@ -0,0 +1,134 @@
+import stat, sys, wave
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import features
+from features import AutoDJ, FeatureIndex, analyze, extract_features
+
+
+def _wav(path, x, rate=11025):
+	pcm = (np.clip(x, -1, 1) * 32767).astype('<i2').tobytes()
+	with wave.open(str(path), 'wb') as w:
+		w.setnchannels(1)
+		w.setsampwidth(2)
+		w.setframerate(rate)
+		w.writeframes(pcm)
+
+
+@pytest.fixture
+def fake_decoder(tmp_path):
+	"""假的 ffmpeg: 记录参数, 输出 1 秒静音 s16le."""
+	log = tmp_path / 'args.txt'
+	path = tmp_path / 'bin' / 'ffmpeg'
+	path.parent.mkdir()
+	path.write_text(f'#!{sys.executable}\n'
+		'import sys\n'
+		f'open({str(log)!r}, "a").write(" ".join(sys.argv[1:]) + "\\n")\n'
+		'sys.stdout.buffer.write(b"\\0\\0" * 11025)\n')
+	path.chmod(path.stat().st_mode | stat.S_IEXEC)
+	return str(path), log
+
+
+def test_decoder_reads_only_the_middle_window(tmp_path, fake_decoder):
+	decoder, log = fake_decoder
+	_wav(tmp_path / 'long.wav', np.zeros(11025 * 200))       # 200 秒, 时长由文件头得到
+	feats = extract_features(str(tmp_path / 'long.wav'), decoder)
+	args = log.read_text().split()
+	assert args[args.index('-ss') + 1] == f'{(200 - features.ANALYZE_SECONDS) / 2:.3f}'
+	assert args.index('-ss') < args.index('-i') < args.index('-t')
+	assert args[args.index('-t') + 1] == f'{features.ANALYZE_SECONDS:.3f}'
+	assert feats[3] == pytest.approx(200.0)
+
+
+def test_unknown_duration_falls_back_to_full_decode(tmp_path, fake_decoder):
+	decoder, log = fake_decoder
+	(tmp_path / 'a.ogg').write_bytes(b'OggS' + b'\0' * 100)
+	feats = extract_features(str(tmp_path / 'a.ogg'), decoder)
+	args = log.read_text().split()
+	assert '-ss' not in args and '-t' not in args
+	assert feats[3] == pytest.approx(1.0)
+
+
+def test_analyze_tone_loudness_and_centroid():
+	rate = 11025
+	t = np.arange(rate * 4) / rate
+	loudness, centroid, _ = analyze((0.5 * np.sin(2 * np.pi * 1000 * t)).astype(np.float32), rate)
+	assert loudness == pytest.approx(20 * np.log10(0.5 / np.sqrt(2)), abs=0.1)
+	assert centroid == pytest.approx(1000, rel=0.05)
+
+
+def test_analyze_click_track_tempo():
+	rate = 11025
+	x = np.zeros(rate * 20, np.float32)
+	beat = int(rate * 60 / 120)
+	for i in range(0, len(x) - 200, beat):
+		x[i:i + 200] = np.random.default_rng(i).uniform(-1, 1, 200)
+	assert analyze(x, rate)[2] == pytest.approx(120, rel=0.03)
+
+
+def test_wav_without_decoder(tmp_path):
+	_wav(tmp_path / 'a.wav', np.zeros(11025 * 3))
+	assert extract_features(str(tmp_path / 'a.wav'))[3] == pytest.approx(3.0)
+	(tmp_path / 'a.mp3').write_bytes(b'ID3')
+	with pytest.raises(features.UnsupportedFormat):
+		extract_features(str(tmp_path / 'a.mp3'))
+
+
+def _brute(idx, row, exclude):
+	d = np.square(idx.points - idx.points[row]).sum(axis=1)
+	d[exclude] = np.inf
+	return int(d.argmin()) if not exclude.all() else -1
+
+
+def test_grid_nearest_matches_brute_force():
+	rng = np.random.default_rng(7)
+	n = 2000
+	vecs = np.column_stack([rng.normal(-14, 3, n), rng.lognormal(7, 0.4, n),
+		rng.uniform(60, 200, n), rng.lognormal(5.4, 0.3, n)]).astype(np.float32)
+	idx = FeatureIndex([f'{i}.mp3' for i in range(n)], vecs)
+	exclude = rng.random(n) < 0.5
+	for row in range(0, n, 97):
+		ex = exclude.copy()
+		ex[row] = True
+		got = idx.nearest(row, ex)
+		want = _brute(idx, row, ex)
+		assert np.isclose(np.square(idx.points[got] - idx.points[row]).sum(),
+			np.square(idx.points[want] - idx.points[row]).sum())
+	assert idx.nearest(0, np.ones(n, bool)) == -1
+
+
+class _Store:
+	def __init__(self, index):
+		self.index = index
+
+
+def test_autodj_plays_each_track_once_per_round():
+	rels = [f'{i}.mp3' for i in range(12)]
+	vecs = np.array([[-10 - i, 1000 + 50 * i, 100 + i, 200] for i in range(12)], np.float32)
+	dj = AutoDJ(_Store(FeatureIndex(rels, vecs)), seed=1)
+	dj.reset('0.mp3')
+	played = ['0.mp3']
+	for _ in range(11):
+		nxt = dj.peek(2, rels)[0]
+		dj.set_current(nxt)
+		played.append(nxt)
+	assert sorted(played) == sorted(rels)
+	assert played[1] == '1.mp3'              # 最相似的相邻曲目
+	assert dj.prev() == played[-2]
+
+
+def test_store_sync_extracts_and_builds_index(tmp_path):
+	rate = 11025
+	t = np.arange(rate * 3) / rate
+	for i, freq in enumerate((300, 600, 1200)):
+		_wav(tmp_path / f'{i}.wav', 0.3 * np.sin(2 * np.pi * freq * t))
+	rels = ['0.wav', '1.wav', '2.wav']
+	store = features.FeatureStore(str(tmp_path / 'lib.db'))
+	progress = store.sync(str(tmp_path), rels)
+	assert progress['extracted'] == 3 and progress['failed'] == 0
+	assert store.index is not None and len(store.index) == 3
+	assert store.get('2.wav')['centroid'] > store.get('0.wav')['centroid']
+	again = features.FeatureStore(str(tmp_path / 'lib.db'))
+	assert again.sync(str(tmp_path), rels)['stale'] == 0
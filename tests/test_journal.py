@@ -0,0 +1,93 @@
+import json, os
+
+import journal
+from journal import StateJournal
+
+
+def _lines(path):
+	with open(path, encoding='utf-8') as f:
+		return [json.loads(line) for line in f if line.strip()]
+
+
+def test_record_and_replay(tmp_path):
+	path = str(tmp_path / 'state.journal')
+	j = StateJournal(path, interval=60, fsync=False)
+	j.record('default', rel='a.mp3', pos=1.0)
+	j.record('default', pos=2.0)             # 写入前的多次变化只写最后的值
+	j.record('kitchen', rel='b.mp3')
+	j.stop()
+	state = StateJournal(path).load()
+	assert state == {'default': {'rel': 'a.mp3', 'pos': 2.0, 'ts': state['default']['ts']},
+		'kitchen': {'rel': 'b.mp3', 'ts': state['kitchen']['ts']}}
+
+
+def test_unchanged_fields_are_not_rewritten(tmp_path):
+	path = str(tmp_path / 'state.journal')
+	j = StateJournal(path, interval=60, fsync=False)
+	j.record('default', rel='a.mp3', pos=2.0)
+	j.stop()
+	j = StateJournal(path, interval=60, fsync=False)
+	j.load()
+	j.record('default', pos=2.0, volume=50)
+	j.stop()
+	recs = _lines(path)
+	assert len(recs) == 2
+	assert 'pos' not in recs[1] and recs[1]['volume'] == 50
+
+
+def test_load_ignores_torn_last_line_and_compacts(tmp_path):
+	path = tmp_path / 'state.journal'
+	path.write_text('{"z":"default","rel":"a.mp3"}\n{"z":"default","pos":5}\n{"z":"defa', encoding='utf-8')
+	j = StateJournal(str(path), fsync=False)
+	assert j.load() == {'default': {'rel': 'a.mp3', 'pos': 5}}
+	assert _lines(path) == [{'rel': 'a.mp3', 'pos': 5, 'z': 'default'}]
+	assert j.stats['compactions'] == 1
+	assert not [p for p in os.listdir(tmp_path) if p.endswith('.tmp')]
+
+
+def test_compaction_after_compact_every_records(tmp_path):
+	path = str(tmp_path / 'state.journal')
+	j = StateJournal(path, interval=60, compact_every=3, fsync=False)
+	for zone in ('a', 'b', 'c'):
+		j.record(zone, pos=1.0)
+	j.stop()
+	j = StateJournal(path, interval=60, compact_every=3, fsync=False)
+	j.load()
+	for zone in ('a', 'b', 'c'):
+		j.record(zone, pos=2.0)
+	j.stop()
+	assert j.stats['compactions'] == 1
+	assert len(_lines(path)) == 3
+	assert {z: s['pos'] for z, s in StateJournal(path).load().items()} == {'a': 2.0, 'b': 2.0, 'c': 2.0}
+
+
+def test_compaction_failure_does_not_break_load(tmp_path, monkeypatch):
+	path = tmp_path / 'state.journal'
+	path.write_text('{"z":"default","rel":"a.mp3"}\n{"z":"default","pos":5}\n', encoding='utf-8')
+
+	def fail(src, dst):
+		raise FileNotFoundError(src)
+	monkeypatch.setattr(journal.os, 'replace', fail)
+	j = StateJournal(str(path), fsync=False)
+	assert j.load() == {'default': {'rel': 'a.mp3', 'pos': 5}}
+	assert j.stats['errors'] == 1 and j.stats['compactions'] == 0
+	assert len(_lines(path)) == 2            # 原日志保留
+	assert not [p for p in os.listdir(tmp_path) if p.endswith('.tmp')]
+
+
+def test_compaction_uses_per_process_tmp_file(tmp_path, monkeypatch):
+	seen = []
+	real = os.replace
+
+	def spy(src, dst):
+		seen.append(src)
+		real(src, dst)
+	monkeypatch.setattr(journal.os, 'replace', spy)
+	path = tmp_path / 'state.journal'
+	path.write_text('{"z":"a","x":1}\n{"z":"a","x":2}\n', encoding='utf-8')
+	StateJournal(str(path), fsync=False).load()
+	assert seen == [f'{path}.{os.getpid()}.tmp']
+
+
+def test_missing_journal_loads_empty(tmp_path):
+	assert StateJournal(str(tmp_path / 'none.journal')).load() == {}
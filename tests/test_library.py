@@ -0,0 +1,62 @@
+import os
+
+from library import LibraryIndex
+
+
+def _touch(root, rel):
+	path = os.path.join(root, *rel.split('/'))
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	with open(path, 'wb') as f:
+		f.write(b'x')
+
+
+def test_scan_filters_extensions_and_builds_views(tmp_path):
+	music = str(tmp_path / 'music')
+	for rel in ('A/b.mp3', 'A/c.WAV', 'A/cover.jpg', 'z.flac'):
+		_touch(music, rel)
+	lib = LibraryIndex(str(tmp_path / 'lib.db'), music, ['.mp3', '.wav', '.flac'])
+	lib.rescan()
+	assert list(lib.playlist()) == ['A/b.mp3', 'A/c.WAV', 'z.flac']
+	tree = lib.tree()
+	assert [d['name'] for d in tree['dirs']] == ['A']
+	assert [f['name'] for f in tree['files']] == ['z.flac']
+
+
+def test_incremental_rescan_reports_changes_and_patches_playlist(tmp_path):
+	music = str(tmp_path / 'music')
+	_touch(music, 'A/a.mp3')
+	_touch(music, 'B/b.mp3')
+	lib = LibraryIndex(str(tmp_path / 'lib.db'), music, ['.mp3'])
+	lib.rescan()
+	old = lib.playlist()
+	gen = lib.generation
+	_touch(music, 'A/new.mp3')
+	os.remove(os.path.join(music, 'B', 'b.mp3'))
+	res = lib.rescan()
+	assert sorted(res['added']) == ['A/new.mp3'] and res['removed'] == ['B/b.mp3']
+	assert list(lib.playlist()) == ['A/a.mp3', 'A/new.mp3']
+	assert list(old) == ['A/a.mp3', 'B/b.mp3']          # 已发布的对象不被修改
+	assert lib.generation > gen
+	assert lib.rescan()['changed'] is False
+
+
+def test_reload_picks_up_changes_written_by_another_instance(tmp_path):
+	music = str(tmp_path / 'music')
+	_touch(music, 'a.mp3')
+	db = str(tmp_path / 'lib.db')
+	leader = LibraryIndex(db, music, ['.mp3'])
+	leader.rescan()
+	follower = LibraryIndex(db, music, ['.mp3'])
+	assert list(follower.playlist()) == ['a.mp3']
+	_touch(music, 'b.mp3')
+	leader.rescan()
+	follower.reload()
+	assert list(follower.playlist()) == ['a.mp3', 'b.mp3']
+
+
+def test_changed_settings_invalidate_the_index(tmp_path):
+	music = str(tmp_path / 'music')
+	_touch(music, 'a.mp3')
+	db = str(tmp_path / 'lib.db')
+	LibraryIndex(db, music, ['.mp3']).rescan()
+	assert list(LibraryIndex(db, music, ['.wav']).playlist()) == []
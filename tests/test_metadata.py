@@ -0,0 +1,107 @@
+import os, struct, threading, wave
+
+from library import LibraryIndex
+from metadata import MetadataStore, parse_file
+
+
+def _wav(path, seconds=1.0, rate=8000, title=None):
+	with wave.open(str(path), 'wb') as w:
+		w.setnchannels(1)
+		w.setsampwidth(2)
+		w.setframerate(rate)
+		w.writeframes(b'\0\0' * int(rate * seconds))
+	if title is not None:
+		text = title.encode('utf-8') + b'\0'
+		if len(text) & 1:
+			text += b'\0'
+		body = b'INFO' + b'INAM' + struct.pack('<I', len(text)) + text
+		with open(path, 'r+b') as f:
+			f.seek(0, 2)
+			f.write(b'LIST' + struct.pack('<I', len(body)) + body)
+			size = f.tell() - 8
+			f.seek(4)
+			f.write(struct.pack('<I', size))
+
+
+def test_parse_wav_duration_and_title(tmp_path):
+	_wav(tmp_path / 'a.wav', seconds=2.5, title='晴天')
+	rec = parse_file(str(tmp_path / 'a.wav'))
+	assert rec['duration'] == 2.5
+	assert rec['title'] == '晴天'
+
+
+def test_parse_unknown_or_missing_file(tmp_path):
+	(tmp_path / 'x.ogg').write_bytes(b'OggS')
+	assert parse_file(str(tmp_path / 'x.ogg'))['duration'] is None
+	assert parse_file(str(tmp_path / 'missing.mp3'))['title'] is None
+
+
+def test_sync_parses_only_changed_files(tmp_path):
+	for i in range(3):
+		_wav(tmp_path / f'{i}.wav')
+	store = MetadataStore(str(tmp_path / 'lib.db'))
+	assert store.sync(str(tmp_path), ['0.wav', '1.wav', '2.wav'])['stale'] == 3
+	assert store.sync(str(tmp_path), ['0.wav', '1.wav', '2.wav'])['stale'] == 0
+	_wav(tmp_path / '1.wav', seconds=3.0)
+	os.utime(tmp_path / '1.wav', (1, 1))
+	assert store.sync(str(tmp_path), ['0.wav', '1.wav', '2.wav'])['stale'] == 1
+	assert store.get('1.wav')['duration'] == 3.0
+	# 持久化: 新实例从 SQLite 读取, 不重新解析
+	again = MetadataStore(str(tmp_path / 'lib.db'))
+	assert again.sync(str(tmp_path), ['0.wav', '1.wav', '2.wav'])['stale'] == 0
+
+
+def test_sync_uses_spawn_pool_for_large_batches(tmp_path):
+	rels = [f'{i:03d}.wav' for i in range(80)]
+	for rel in rels:
+		_wav(tmp_path / rel, seconds=0.1)
+	store = MetadataStore(str(tmp_path / 'lib.db'), workers=2)
+	progress = store.sync(str(tmp_path), rels)
+	assert progress['parsed'] == 80 and progress['state'] == 'done'
+	assert all(store.get(r)['duration'] == 0.1 for r in rels)
+
+
+def test_sync_one_leaves_progress_alone(tmp_path):
+	_wav(tmp_path / 'a.wav', seconds=1.5)
+	store = MetadataStore(str(tmp_path / 'lib.db'))
+	store.progress = {'state': 'parse', 'total': 10, 'stale': 5, 'parsed': 3, 'seconds': 0.0}
+	before = dict(store.progress)
+	assert store.sync_one(str(tmp_path), 'a.wav')['duration'] == 1.5
+	assert store.progress == before
+	assert 'a.wav' in store
+	assert store.sync_one(str(tmp_path), 'missing.wav')['duration'] is None
+
+
+def test_prune_while_rows_are_stored(tmp_path):
+	store = MetadataStore(str(tmp_path / 'lib.db'))
+	rec = dict.fromkeys(('title', 'artist', 'album', 'track', 'duration'))
+	store._store([(f'old{i}', (1, 1.0), rec) for i in range(2000)])
+	stop = threading.Event()
+
+	def writer():
+		i = 0
+		while not stop.is_set():
+			store._store([(f'new{i}', (1, 1.0), rec)])
+			i += 1
+	t = threading.Thread(target=writer)
+	t.start()
+	try:
+		for _ in range(20):
+			store.prune({'old0'})
+	finally:
+		stop.set()
+		t.join()
+	assert 'old0' in store and 'old1' not in store
+
+
+def test_library_index_loads_on_first_use(tmp_path):
+	music = tmp_path / 'music'
+	(music / 'sub').mkdir(parents=True)
+	_wav(music / 'sub' / 'a.wav')
+	(music / 'notes.txt').write_text('x')
+	db = str(tmp_path / 'lib.db')
+	LibraryIndex(db, str(music), ['.wav']).rescan()
+	lib = LibraryIndex(db, str(music), ['.wav'])
+	assert lib._index is None            # 构造时不读取索引 (进程池子进程重新导入主模块时不付出代价)
+	assert list(lib.playlist()) == ['sub/a.wav']
+	assert lib._index is not None
@@ -0,0 +1,94 @@
+import os, struct, time, wave
+
+import pytest
+
+from peaks import HEADER, MAGIC, PeakStore, UnsupportedFormat, compute_peaks
+
+
+def _wav(path, samples, rate=8000):
+	with wave.open(str(path), 'wb') as w:
+		w.setnchannels(1)
+		w.setsampwidth(2)
+		w.setframerate(rate)
+		w.writeframes(struct.pack(f'<{len(samples)}h', *samples))
+
+
+def _decode(data):
+	magic, version, _, buckets, duration = HEADER.unpack_from(data)
+	pairs = struct.unpack_from(f'<{buckets * 2}b', data, HEADER.size)
+	return magic, buckets, duration, list(zip(pairs[::2], pairs[1::2]))
+
+
+def test_wav_peaks_per_bucket(tmp_path):
+	# 前半段静音, 后半段满幅方波
+	quiet, loud = [0] * 4000, [32767, -32768] * 2000
+	_wav(tmp_path / 'a.wav', quiet + loud)
+	magic, buckets, duration, pairs = _decode(compute_peaks(str(tmp_path / 'a.wav'), 4))
+	assert magic == MAGIC and buckets == 4 and duration == pytest.approx(1.0)
+	assert pairs[:2] == [(0, 0), (0, 0)]
+	assert pairs[2:] == [(-127, 127), (-127, 127)]
+
+
+def test_buckets_capped_by_frames_and_empty_file(tmp_path):
+	_wav(tmp_path / 'short.wav', [100, -100, 50])
+	assert _decode(compute_peaks(str(tmp_path / 'short.wav'), 800))[1] == 3
+	_wav(tmp_path / 'empty.wav', [])
+	assert _decode(compute_peaks(str(tmp_path / 'empty.wav'), 800))[1] == 1
+
+
+def test_non_wav_needs_decoder(tmp_path):
+	(tmp_path / 'a.mp3').write_bytes(b'ID3')
+	with pytest.raises(UnsupportedFormat):
+		compute_peaks(str(tmp_path / 'a.mp3'), 10)
+	store = PeakStore(str(tmp_path / 'cache'), decoder='')
+	assert store.supported(str(tmp_path / 'x.wav')) and not store.supported(str(tmp_path / 'a.mp3'))
+
+
+def test_store_computes_once_then_hits_cache(tmp_path):
+	_wav(tmp_path / 'a.wav', [1000, -1000] * 400)
+	store = PeakStore(str(tmp_path / 'cache'), buckets=10)
+	key, data = store.get(str(tmp_path / 'a.wav'), wait=30)
+	assert data is not None and _decode(data)[1] == 10
+	for _ in range(100):                 # 写缓存文件在完成回调中进行
+		if store.stats['computed']:
+			break
+		time.sleep(0.05)
+	assert store.get(str(tmp_path / 'a.wav')) == (key, data)
+	assert store.stats['hits'] == 1
+	# 文件变化后 key 随之变化
+	_wav(tmp_path / 'a.wav', [1000, -1000] * 500)
+	os.utime(tmp_path / 'a.wav', (1, 1))
+	assert store.key(str(tmp_path / 'a.wav')) != key
+
+
+# ---------- /peaks 路由 ----------
+@pytest.fixture(scope='module')
+def client(app):
+	_wav(os.path.join(app.MUSIC_DIR, 'peaks.wav'), [0, 20000] * 800)
+	with open(os.path.join(app.MUSIC_DIR, 'readme.txt'), 'w') as f:
+		f.write('x')
+	with open(os.path.join(app.MUSIC_DIR, 'song.flac'), 'wb') as f:
+		f.write(b'fLaC')
+	return app.APP.test_client()
+
+
+def test_route_rejects_non_tracks_before_decoding(app, client):
+	failed = dict(app.PEAKS._failed)
+	assert client.get('/peaks/readme.txt').status_code == 404
+	assert client.get('/peaks/missing.wav').status_code == 404
+	assert client.get('/peaks/../settings.ini').status_code == 404
+	assert app.PEAKS._failed == failed
+
+
+def test_route_needs_decoder_for_non_wav(client):
+	assert client.get('/peaks/song.flac').status_code == 415
+
+
+def test_route_returns_peaks_then_304(client):
+	for _ in range(60):
+		resp = client.get('/peaks/peaks.wav')
+		if resp.status_code == 200:
+			break
+		assert resp.status_code == 202
+	assert resp.status_code == 200 and resp.data[:4] == MAGIC
+	assert client.get('/peaks/peaks.wav', headers={'If-None-Match': resp.headers['ETag']}).status_code == 304
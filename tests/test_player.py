@@ -0,0 +1,69 @@
+import pytest
+
+from player import Zone, ZoneError, coalesce_commands
+from playlist import Playlist
+
+
+# ---------- coalesce_commands ----------
+def test_coalesce_keeps_last_set_property():
+	cmds = [['set_property', 'volume', 10], ['set_property', 'pause', True], ['set_property', 'volume', 30]]
+	assert coalesce_commands(cmds) == [['set_property', 'pause', True], ['set_property', 'volume', 30]]
+
+
+def test_coalesce_drops_navigation_before_last_replace():
+	cmds = [
+		['loadfile', '/a', 'replace'], ['playlist-clear'], ['loadfile', '/b', 'append'],
+		['playlist-next', 'force'], ['seek', 10], ['loadfile', '/c', 'replace'], ['loadfile', '/d', 'append'],
+	]
+	assert coalesce_commands(cmds) == [['loadfile', '/c', 'replace'], ['loadfile', '/d', 'append']]
+
+
+def test_coalesce_drops_queue_overwritten_by_later_clear():
+	cmds = [['playlist-clear'], ['loadfile', '/x', 'append'], ['playlist-clear'], ['loadfile', '/y', 'append']]
+	assert coalesce_commands(cmds) == [['playlist-clear'], ['loadfile', '/y', 'append']]
+
+
+def test_coalesce_keeps_queue_consumed_by_playlist_next():
+	cmds = [['playlist-clear'], ['loadfile', '/x', 'append'], ['playlist-next', 'force'],
+		['playlist-clear'], ['loadfile', '/y', 'append']]
+	assert coalesce_commands(cmds) == cmds
+
+
+# ---------- 写入失败时的状态回滚 ----------
+@pytest.fixture
+def zone(tmp_path):
+	tracks = Playlist(['a.mp3', 'b.mp3', 'c.mp3'])
+	z = Zone('t', 'mpv', str(tmp_path / 'no-mpv.sock'), tracks=lambda force=False: tracks,
+		resolve=lambda rel: str(tmp_path / rel), root=str(tmp_path), ipc_timeout=0.2)
+	z.playlist = tracks
+	z._require_mpv = lambda: None
+	z.ensure_mpv = lambda: False         # mpv 不可用: 每次写入都失败
+	z.index, z.meta = 0, {'rel': 'a.mp3'}
+	return z
+
+
+def test_direct_play_rolls_back_on_write_failure(zone):
+	with pytest.raises(RuntimeError):
+		zone._play_index(2)
+	assert (zone.index, zone.meta) == (0, {'rel': 'a.mp3'})
+
+
+def test_batch_rolls_back_when_flush_fails(zone):
+	with pytest.raises(RuntimeError):
+		zone._cmd_batch([{'op': 'play', 'path': 'c.mp3'}, {'op': 'play', 'path': 'b.mp3'}])
+	assert (zone.index, zone.meta) == (0, {'rel': 'a.mp3'})
+	assert zone._pending_cmds is None and zone._undo is None
+
+
+def test_restore_rolls_back_when_flush_fails(zone):
+	zone.ensure_mpv = lambda: True       # 恢复前检查通过, 写入仍失败
+	with pytest.raises(RuntimeError):
+		zone._cmd_restore({'rel': 'c.mp3', 'pos': 12.0, 'volume': 40})
+	assert (zone.index, zone.meta) == (0, {'rel': 'a.mp3'})
+	assert zone._pending_cmds is None and zone._undo is None
+
+
+def test_invalid_batch_has_no_side_effects(zone):
+	with pytest.raises(ZoneError):
+		zone._cmd_batch([{'op': 'play', 'path': 'c.mp3'}, {'op': 'play', 'path': 'missing.mp3'}])
+	assert (zone.index, zone.meta) == (0, {'rel': 'a.mp3'})
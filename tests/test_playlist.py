@@ -0,0 +1,62 @@
+from playlist import Playlist
+from shuffle import ShuffleEngine
+
+
+def test_sorted_case_insensitive_with_index():
+	pl = Playlist(['b.mp3', 'A.mp3', 'c.mp3'])
+	assert list(pl) == ['A.mp3', 'b.mp3', 'c.mp3']
+	assert pl.index('c.mp3') == 2
+	assert 'A.mp3' in pl and 'a.mp3' not in pl
+
+
+def test_patched_leaves_original_unchanged():
+	pl = Playlist(['a', 'b', 'c'])
+	pl.index('a')                # 原对象的哈希表已建好
+	new = pl.patched(added=['bb', 'd'], removed=['a'])
+	assert list(pl) == ['a', 'b', 'c']
+	assert pl.index('c') == 2
+	assert list(new) == ['b', 'bb', 'c', 'd']
+	assert [new.index(r) for r in new] == [0, 1, 2, 3]
+	assert 'a' not in new and 'a' in pl
+
+
+def test_patched_without_changes_is_a_copy():
+	pl = Playlist(['a', 'b'])
+	new = pl.patched()
+	assert new is not pl and list(new) == list(pl)
+	new.add('c')
+	assert 'c' not in pl
+
+
+def test_shuffle_plays_every_track_once_per_round():
+	tracks = Playlist(str(i) for i in range(20))
+	sh = ShuffleEngine(seed=1)
+	sh.reset(tracks, current='0')
+	seen = ['0'] + [sh.next() for _ in range(19)]
+	assert sorted(seen) == sorted(tracks)
+
+
+def test_shuffle_prev_returns_to_played_track():
+	sh = ShuffleEngine(seed=2)
+	sh.reset(Playlist('abcdef'), current='a')
+	first = sh.next()
+	sh.next()
+	assert sh.prev() == first
+	assert sh.prev() == 'a'
+	assert sh.prev() is None
+
+
+def test_shuffle_apply_and_rebind_keep_history():
+	old = Playlist('abcd')
+	sh = ShuffleEngine(seed=3)
+	sh.reset(old, current='a')
+	nxt = sh.next()
+	gone = next(r for r in 'bcd' if r != nxt)
+	new = old.patched(added=['e'], removed=[gone])
+	sh.apply(added=['e'], removed=[gone])
+	sh.rebind(new)
+	assert sh.source is new
+	assert sh.current() == nxt
+	# 本轮剩余: 新全集去掉已播放的两首
+	assert sorted(sh.peek(len(new) - 2)) == sorted(set(new) - {'a', nxt})
+	assert sh.prev() == 'a'
@@ -0,0 +1,50 @@
+from search import TrigramIndex
+
+
+def _index(rels):
+	ix = TrigramIndex()
+	ix.build(rels)
+	return ix
+
+
+def test_all_terms_must_match_case_insensitive():
+	ix = _index(['Artist/Blue Rain.mp3', 'Artist/Red Rain.mp3', 'Other/Blue Sky.mp3'])
+	total, page, complete = ix.search('blue RAIN')
+	assert (total, page, complete) == (1, ['Artist/Blue Rain.mp3'], True)
+
+
+def test_filename_hits_rank_before_directory_hits():
+	ix = _index(['rain/x.mp3', 'a/rain.mp3', 'a/b/rain song.mp3'])
+	_, page, _ = ix.search('rain')
+	assert page == ['a/rain.mp3', 'a/b/rain song.mp3', 'rain/x.mp3']
+
+
+def test_best_match_late_in_index_is_found():
+	# 大量较差的命中排在前面, 最好的结果最后加入索引, 仍应排在第一
+	rels = [f'dir {i:05d}/rain/track.mp3' for i in range(5000)] + ['z/rain.mp3']
+	ix = _index(rels)
+	total, page, complete = ix.search('rain', 0, 3)
+	assert total == 5001 and complete
+	assert page[0] == 'z/rain.mp3'
+
+
+def test_short_terms_use_scan_and_incremental_changes():
+	ix = _index(['ab.mp3', 'cd.mp3'])
+	ix.apply(added=['xab.mp3'], removed=['cd.mp3'])
+	total, page, _ = ix.search('ab')
+	assert total == 2 and sorted(page) == ['ab.mp3', 'xab.mp3']
+	assert ix.search('cd')[0] == 0
+
+
+def test_paging():
+	ix = _index([f'song {i}.mp3' for i in range(10)])
+	total, first, _ = ix.search('song', 0, 4)
+	_, second, _ = ix.search('song', 4, 4)
+	assert total == 10 and len(first) == 4 and not set(first) & set(second)
+
+
+def test_changes_before_build_are_replayed():
+	ix = TrigramIndex()
+	ix.apply(added=['late.mp3'])
+	ix.build(['early.mp3'])
+	assert ix.search('late')[1] == ['late.mp3']
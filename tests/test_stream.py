@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+from stream import StreamLimiter
+
+DATA = bytes(range(256)) * 40           # 10240 字节
+
+
+@pytest.fixture(scope='module')
+def client(app):
+	with open(os.path.join(app.MUSIC_DIR, 'song.mp3'), 'wb') as f:
+		f.write(DATA)
+	with open(os.path.join(app.MUSIC_DIR, 'notes.txt'), 'w') as f:
+		f.write('not audio')
+	return app.APP.test_client()
+
+
+def _get(client, path='/stream/song.mp3', method='GET', **headers):
+	"""发出请求并读完响应体后关闭 (关闭时释放 StreamLimiter 的名额)."""
+	resp = client.open(path, method=method, headers={k.replace('_', '-'): v for k, v in headers.items()})
+	resp.get_data()
+	resp.close()
+	return resp
+
+
+def test_full_file(client):
+	resp = _get(client)
+	assert resp.status_code == 200
+	assert resp.data == DATA
+	assert resp.headers['Accept-Ranges'] == 'bytes'
+	assert resp.headers['Content-Length'] == str(len(DATA))
+
+
+def test_byte_range(client):
+	resp = _get(client, Range='bytes=100-199')
+	assert resp.status_code == 206
+	assert resp.data == DATA[100:200]
+	assert resp.headers['Content-Range'] == f'bytes 100-199/{len(DATA)}'
+
+
+def test_suffix_and_open_ended_ranges(client):
+	assert _get(client, Range='bytes=-16').data == DATA[-16:]
+	assert _get(client, Range='bytes=10000-').data == DATA[10000:]
+
+
+def test_unsatisfiable_range_is_416(client):
+	resp = _get(client, Range=f'bytes={len(DATA)}-{len(DATA) + 10}')
+	assert resp.status_code == 416
+	assert resp.headers['Content-Range'] == f'bytes */{len(DATA)}'
+
+
+def test_stale_if_range_returns_whole_file(client):
+	resp = _get(client, Range='bytes=0-9', If_Range='"other-etag"')
+	assert resp.status_code == 200 and resp.data == DATA
+
+
+def test_matching_if_range_and_if_none_match(client):
+	etag = _get(client, method='HEAD').headers['ETag']
+	resp = _get(client, Range='bytes=0-9', If_Range=etag)
+	assert resp.status_code == 206 and resp.data == DATA[:10]
+	assert _get(client, If_None_Match=etag).status_code == 304
+
+
+def test_head_has_length_without_body(client):
+	resp = _get(client, method='HEAD')
+	assert resp.status_code == 200
+	assert resp.headers['Content-Length'] == str(len(DATA)) and resp.data == b''
+
+
+def test_non_track_paths_are_404(client):
+	assert _get(client, '/stream/notes.txt').status_code == 404
+	assert _get(client, '/stream/missing.mp3').status_code == 404
+	assert _get(client, '/stream/../settings.ini').status_code == 404
+
+
+def test_closed_streams_release_their_slot(app, client):
+	for _ in range(10):
+		_get(client, Range='bytes=0-9')
+	assert app.STREAMS._total == 0
+
+
+def test_limiter_per_client_and_total():
+	lim = StreamLimiter(max_streams=3, per_client=2)
+	assert lim.acquire('a') is None and lim.acquire('a') is None
+	assert lim.acquire('a') == 'client'
+	assert lim.acquire('b') is None
+	assert lim.acquire('c') == 'total'
+	lim.release('a')
+	assert lim.acquire('c') is None
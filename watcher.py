@@ -0,0 +1,232 @@
+"""音乐库文件监视器.
+
+Linux 本地文件系统上使用 inotify (ctypes 直接调用 libc, 无额外依赖);
+Windows 以及 SMB/NFS 等收不到远端变更事件的挂载退回到 stat 轮询,
+即定期执行 LibraryIndex 的增量扫描 (每个目录一次 stat, 仅列出 mtime 变化的目录).
+检测到变化后调用 on_change(stats), stats 结构同 LibraryIndex.rescan() 的返回值.
+"""
+import os, sys, errno, select, struct, threading, ctypes, ctypes.util
+
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = os.O_NONBLOCK if hasattr(os, 'O_NONBLOCK') else 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+_EVENT_HDR = struct.Struct('iIII')   # wd, mask, cookie, len
+
+# 这些文件系统上 inotify 只能看到本机发起的修改, 需要轮询
+_NETWORK_FS = {'cifs', 'smb3', 'smbfs', 'nfs', 'nfs4', 'fuse.sshfs', '9p', 'afs', 'ncpfs', 'davfs'}
+
+
+def _load_libc():
+	if not sys.platform.startswith('linux'):
+		return None
+	try:
+		libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+		libc.inotify_init1
+		return libc
+	except (OSError, AttributeError):
+		return None
+
+def _fs_type(path: str):
+	"""从 /proc/mounts 找出 path 所在挂载点的文件系统类型; 失败返回 None."""
+	try:
+		real = os.path.realpath(path)
+		best, fstype = '', None
+		with open('/proc/mounts', encoding='utf-8', errors='replace') as f:
+			for line in f:
+				parts = line.split()
+				if len(parts) < 3:
+					continue
+				mnt = parts[1].replace('\\040', ' ')
+				if (real == mnt or real.startswith(mnt.rstrip('/') + '/')) and len(mnt) >= len(best):
+					best, fstype = mnt, parts[2]
+		return fstype
+	except OSError:
+		return None
+
+
+class LibraryWatcher:
+	"""后台线程: inotify 事件驱动或 stat 轮询, 把变更作为增量补丁应用到 LibraryIndex."""
+
+	def __init__(self, library, on_change, mode: str = 'auto', interval: float = 30.0, debounce: float = 0.5):
+		self.library = library
+		self.on_change = on_change
+		self.requested_mode = (mode or 'auto').lower()
+		self.mode = None             # 实际生效: 'inotify' | 'poll'
+		self.interval = interval
+		self.debounce = debounce
+		self._stop = threading.Event()
+		self._thread = None
+		self._libc = None
+		self._fd = -1
+		self._wd_to_rel = {}
+		self._rel_to_wd = {}
+
+	def _resolve_mode(self) -> str:
+		if self.requested_mode in ('poll', 'inotify'):
+			if self.requested_mode == 'inotify':
+				self._libc = _load_libc()
+				if self._libc is None:
+					print('[WARN] 当前平台不支持 inotify, 改用轮询模式')
+					return 'poll'
+			return self.requested_mode
+		fstype = _fs_type(self.library.root)
+		if fstype in _NETWORK_FS:
+			print(f'[INFO] 音乐目录位于网络文件系统 ({fstype}), 使用轮询模式')
+			return 'poll'
+		self._libc = _load_libc()
+		return 'inotify' if self._libc is not None else 'poll'
+
+	def start(self):
+		if self.is_alive():
+			return
+		self._stop.clear()
+		self.mode = self._resolve_mode()
+		self._thread = threading.Thread(target=self._run, daemon=True)
+		self._thread.start()
+		print(f'[INFO] 音乐库监视器已启动 (模式: {self.mode})')
+
+	def stop(self):
+		self._stop.set()
+
+	def is_alive(self) -> bool:
+		return bool(self._thread and self._thread.is_alive())
+
+	def _run(self):
+		if self.mode == 'inotify':
+			try:
+				self._run_inotify()
+			except OSError as e:
+				print(f'[WARN] inotify 监视失败 ({e}), 改用轮询模式')
+				self.mode = 'poll'
+			finally:
+				self._close()
+		if self.mode == 'poll':
+			self._run_poll()
+
+	def _emit(self, stats):
+		if not stats.get('changed'):
+			return
+		try:
+			self.on_change(stats)
+		except Exception as e:
+			print('[WARN] 音乐库变更回调失败:', e)
+
+	# ---------- 轮询模式 ----------
+	def _run_poll(self):
+		while not self._stop.wait(self.interval):
+			try:
+				self._emit(self.library.rescan())
+			except Exception as e:
+				print('[WARN] 音乐库轮询扫描失败:', e)
+
+	# ---------- inotify 模式 ----------
+	def _close(self):
+		if self._fd >= 0:
+			os.close(self._fd)
+		self._fd = -1
+		self._wd_to_rel.clear()
+		self._rel_to_wd.clear()
+
+	def _add_watch(self, rel: str):
+		if rel in self._rel_to_wd:
+			return
+		path = self.library._abs(rel)
+		wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _WATCH_MASK)
+		if wd < 0:
+			err = ctypes.get_errno()
+			if err == errno.ENOSPC:
+				# 超出 fs.inotify.max_user_watches, 无法完整覆盖, 整体退回轮询
+				raise OSError(err, 'inotify watch 数量达到上限')
+			return     # 目录已被删除等, 由后续事件处理
+		self._wd_to_rel[wd] = rel
+		self._rel_to_wd[rel] = wd
+
+	def _read_events(self, dirty: set) -> bool:
+		"""读取一批事件, 把受影响目录加入 dirty; 队列溢出时返回 True."""
+		try:
+			buf = os.read(self._fd, 65536)
+		except BlockingIOError:
+			return False
+		overflow = False
+		off = 0
+		while off + _EVENT_HDR.size <= len(buf):
+			wd, mask, _cookie, ln = _EVENT_HDR.unpack_from(buf, off)
+			off += _EVENT_HDR.size + ln
+			if mask & IN_Q_OVERFLOW:
+				overflow = True
+				continue
+			rel = self._wd_to_rel.get(wd)
+			if rel is None:
+				continue
+			if mask & IN_IGNORED:
+				self._wd_to_rel.pop(wd, None)
+				if self._rel_to_wd.get(rel) == wd:
+					del self._rel_to_wd[rel]
+				continue
+			if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+				dirty.add(rel.rsplit('/', 1)[0] if '/' in rel else '')
+			else:
+				dirty.add(rel)
+		return overflow
+
+	def _run_inotify(self):
+		self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+		if self._fd < 0:
+			raise OSError(ctypes.get_errno(), 'inotify_init1 失败')
+		self.library.refresh(float('inf'))
+		for rel in self.library.dirs():
+			self._add_watch(rel)
+		dirty, overflow = set(), False
+		while not self._stop.is_set():
+			r, _, _ = select.select([self._fd], [], [], self.debounce if dirty else 1.0)
+			if r:
+				overflow = self._read_events(dirty) or overflow
+				continue     # 继续收集, 直到安静 debounce 秒后统一处理
+			if overflow:
+				stats = self.library.rescan()
+			elif dirty:
+				stats = self._merge([self.library.rescan_dir(rel) for rel in self._top_dirs(dirty)])
+			else:
+				continue
+			dirty, overflow = set(), False
+			for rel in stats.get('dirs_gone', []):
+				# 被移走的目录其 watch 仍跟随 inode, 必须解除, 否则事件会被记到旧路径上
+				wd = self._rel_to_wd.pop(rel, None)
+				if wd is not None:
+					self._wd_to_rel.pop(wd, None)
+					self._libc.inotify_rm_watch(self._fd, wd)
+			for rel in stats.get('dirs_listed', []):
+				self._add_watch(rel)
+			self._emit(stats)
+
+	@staticmethod
+	def _top_dirs(dirty: set):
+		"""去掉上级目录也在 dirty 中的项, 避免重复扫描同一子树."""
+		out = []
+		for rel in sorted(dirty):
+			if any(t == '' or rel.startswith(t + '/') for t in out):
+				continue
+			out.append(rel)
+		return out
+
+	@staticmethod
+	def _merge(results):
+		merged = {'changed': False, 'added': [], 'removed': [], 'dirs_listed': [], 'dirs_gone': [], 'listed': 0, 'seconds': 0.0}
+		for st in results:
+			merged['changed'] = merged['changed'] or st['changed']
+			for k in ('added', 'removed', 'dirs_listed', 'dirs_gone'):
+				merged[k].extend(st[k])
+			merged['listed'] += st['listed']
+			merged['seconds'] += st['seconds']
+			merged['dirs'] = st['dirs']
+		return merged